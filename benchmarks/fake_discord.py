@@ -0,0 +1,214 @@
+import asyncio
+import datetime
+import io
+import itertools
+from typing import Optional
+
+import discord
+
+from src import commands
+from src import common
+
+_ids = itertools.count(10 ** 17)
+_guild_ids = itertools.count(10 ** 9)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class FakeRole:
+    def __init__(self, guild: 'FakeGuild', name: str):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+class FakeMember:
+    def __init__(self, guild: 'FakeGuild', name: str, bot: bool = False):
+        self.id = next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.guild = guild
+        self.roles: list[FakeRole] = []
+        self.mention = f'<@{self.id}>'
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    async def add_roles(self, *roles: FakeRole):
+        self.roles.extend(r for r in roles if r and r not in self.roles)
+
+    async def remove_roles(self, *roles: FakeRole):
+        self.roles = [r for r in self.roles if r not in roles]
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, data: bytes, content_type: Optional[str] = None):
+        self.id = next_id()
+        self.filename = filename
+        self.content_type = content_type
+        self._data = data
+        self.size = len(data)
+
+    async def read(self) -> bytes:
+        await asyncio.sleep(FakeGateway.current.cdn_latency)
+        return self._data
+
+    async def to_file(self) -> discord.File:
+        return discord.File(io.BytesIO(await self.read()), filename=self.filename)
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeChannel', author: FakeMember, content: str = '',
+                 attachments: Optional[list[FakeAttachment]] = None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = attachments or []
+        self.mentions: list[FakeMember] = []
+        self.channel_mentions: list[FakeChannel] = []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.jump_url = f'https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}'
+
+    async def delete(self, delay: Optional[float] = None):
+        await FakeGateway.current.rest()
+        if self in self.channel.messages:
+            self.channel.messages.remove(self)
+
+    async def edit(self, content: Optional[str] = None, **_):
+        await FakeGateway.current.rest()
+        if content is not None:
+            self.content = content
+
+    async def create_thread(self, name: str, **_):
+        await FakeGateway.current.rest()
+        return FakeChannel(self.guild, name)
+
+
+class FakeChannel:
+    def __init__(self, guild: 'FakeGuild', name: str):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.messages: list[FakeMessage] = []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.jump_url = f'https://discord.com/channels/{guild.id}/{self.id}'
+
+    def post(self, author: FakeMember, content: str = '', attachments: Optional[list[FakeAttachment]] = None):
+        # a message arriving from a user, without REST latency
+        message = FakeMessage(self, author, content, attachments)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content: Optional[str] = None, *, file: Optional[discord.File] = None,
+                   files: Optional[list[discord.File]] = None, delete_after: Optional[float] = None, **_):
+        gateway = FakeGateway.current
+        await gateway.rest(upload=sum(_file_size(f) for f in ([file] if file else []) + (files or [])))
+        message = FakeMessage(self, self.guild.me, content or '')
+        self.messages.append(message)
+        gateway.sent += 1
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await FakeGateway.current.rest()
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise discord.NotFound(_FakeResponse(404), 'Unknown Message')
+
+    async def history(self, limit: Optional[int] = 100, after=None, before=None):
+        await FakeGateway.current.rest()
+        messages = [m for m in self.messages
+                    if (after is None or m.created_at > _aware(after)) and (before is None or m.created_at < _aware(before))]
+        # discord.py yields oldest first when after is given, newest first otherwise
+        ordered = messages if after is not None else list(reversed(messages))
+        for message in ordered[:limit] if limit else ordered:
+            yield message
+
+    async def purge(self, limit: int = 100):
+        await FakeGateway.current.rest()
+        removed, self.messages = self.messages[-limit:], self.messages[:-limit]
+        return removed
+
+    def permissions_for(self, _):
+        return discord.Permissions.all()
+
+    async def set_permissions(self, *_, **__):
+        await FakeGateway.current.rest()
+
+
+class FakeGuild:
+    def __init__(self, name: str):
+        # snowflake-shaped so (id >> 22) % shard_count spreads guilds over shards like Discord does
+        self.id = next(_guild_ids) << 22
+        self.name = name
+        self.me = FakeMember(self, 'Poker Bot', bot=True)
+        self.text_channels = {name: FakeChannel(self, name) for name in common.CHANNELS_TEMPLATE}
+        self.role_objects = {name: FakeRole(self, name) for name in common.ROLES_TEMPLATE}
+        self.members = [FakeMember(self, f'member{n}') for n in range(8)]
+
+    def channel(self, name: str) -> FakeChannel:
+        return self.text_channels[name]
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return next((c for c in self.text_channels.values() if c.id == channel_id), None)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((r for r in self.role_objects.values() if r.id == role_id), None)
+
+    async def fetch_channels(self) -> list[FakeChannel]:
+        await FakeGateway.current.rest()
+        return list(self.text_channels.values())
+
+    async def fetch_roles(self) -> list[FakeRole]:
+        await FakeGateway.current.rest()
+        return list(self.role_objects.values())
+
+
+class FakeGateway:
+    # Owns the simulated guilds and the REST/CDN latency every fake API call pays
+    current: 'FakeGateway' = None
+
+    def __init__(self, guilds: int = 3, rest_latency: float = 0.05, cdn_latency: float = 0.03,
+                 upload_bytes_per_s: float = 4_000_000):
+        self.rest_latency = rest_latency
+        self.cdn_latency = cdn_latency
+        self.upload_bytes_per_s = upload_bytes_per_s
+        self.sent = 0
+        self.guilds = [FakeGuild(f'guild{n}') for n in range(guilds)]
+        FakeGateway.current = self
+
+    async def rest(self, upload: int = 0):
+        await asyncio.sleep(self.rest_latency + upload / self.upload_bytes_per_s)
+
+    def owned(self, ownership) -> list[FakeGuild]:
+        return [guild for guild in self.guilds if ownership.owns(guild.id)]
+
+    def register(self, ownership=None):
+        # what populate_dictionaries would have found for each guild this process owns
+        for guild in self.owned(ownership) if ownership else self.guilds:
+            common.channels[guild.id] = {name: c.id for name, c in guild.text_channels.items()}
+            commands.index_guild(guild.id, common.channels[guild.id])
+            common.roles[guild.id] = {name: r.id for name, r in guild.role_objects.items()}
+
+
+class _FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = 'Not Found'
+
+
+def _file_size(file: discord.File) -> int:
+    try:
+        return len(file.fp.getbuffer())
+    except AttributeError:
+        return 0
+
+
+def _aware(moment: datetime.datetime) -> datetime.datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from benchmarks import synthetic
+
+
+class GenAIStub:
+    # Stands in for the Gemini generateContent endpoint: waits like the model would and answers
+    # structured ledger requests with balanced rows for user ids that exist in the synthetic history
+    def __init__(self, user_ids: list[str], latency: float = 1.5, seed: int = 0):
+        self.user_ids = user_ids
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.runner = None
+
+    def _photo_entries(self, photos: int) -> list[dict]:
+        players = self.rng.sample(self.user_ids, min(len(self.user_ids), self.rng.randint(5, 9)))
+        nets = [self.rng.randint(-2000, 4000) for _ in players[:-1]]
+        nets.append(-sum(nets))
+        rows = []
+        for user_id, net in zip(players, nets):
+            buy_in = 2000 + max(0, -net)
+            rows.append({'player': f'p_{user_id[:4]}', 'id': user_id, 'buy_in': buy_in / 100,
+                         'buy_out': (buy_in + net) / 100, 'stack': 0, 'net': net / 100})
+        per_photo = -(-len(rows) // max(photos, 1))
+        entries = []
+        for number in range(1, photos + 1):
+            chunk = rows[(number - 1) * per_photo: number * per_photo]
+            entries.append({'photo': number, 'visible_rows': len(chunk), 'rows': chunk})
+        return entries
+
+    async def generate(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        parts = [part for content in body.get('contents', []) for part in content.get('parts', [])]
+        photos = sum(1 for part in parts if 'inlineData' in part or 'inline_data' in part)
+        await asyncio.sleep(self.latency)
+        text = json.dumps(self._photo_entries(photos))
+        return web.json_response({
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+        })
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> str:
+        app = web.Application(client_max_size=64 * 2 ** 20)
+        app.router.add_post('/{version}/models/{method}', self.generate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def history_user_ids(players: int = 60, games: int = 500, seed: int = 0) -> list[str]:
+    return [user_id for user_id, _ in synthetic.history(players, games, seed).users]
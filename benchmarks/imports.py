@@ -0,0 +1,86 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cold import budget in milliseconds, best of --repeat runs
+BUDGETS = {
+    'src.bot': 900,
+    'src.on_message': 800,
+    'src.commands': 150,
+    'src.render': 100,
+    'src.graph': 200,
+    'src.query_presets': 200,
+}
+# loaded on first use only, importing the bot must not pull these in
+HEAVY = ('pandas', 'numpy', 'matplotlib', 'PIL', 'google.genai', 'rapidfuzz')
+# modules whose import must leave every HEAVY one for later
+LAZY = tuple(BUDGETS)
+
+
+def import_times(module: str) -> dict[str, tuple[float, float]]:
+    # {package: (self ms, cumulative ms)} from python -X importtime
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr.strip().splitlines()[-1]}')
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own) / 1000, int(cumulative) / 1000)
+    return times
+
+
+def heavy_modules(module: str) -> list[str]:
+    code = f'import sys, {module}; print(" ".join(m for m in {HEAVY!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr.strip().splitlines()[-1]}')
+    return result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report cold import time per module against a budget.')
+    parser.add_argument('modules', nargs='*', help='modules to check (default: every budgeted module)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8, help='heaviest dependencies to list per module')
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS', help='override a budget')
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, _, ms = item.partition('=')
+        budgets[module] = float(ms)
+
+    failures = []
+    for module in args.modules or list(budgets):
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda times: times[module][1])
+        total = best[module][1]
+        budget = budgets.get(module)
+        verdict = '' if budget is None else ('ok' if total <= budget else 'OVER')
+        print(f"{module:<24} {total:>8.1f} ms" + (f"  budget {budget:.0f} ms  {verdict}" if budget else ''))
+        children = sorted(((name, times) for name, times in best.items() if name != module),
+                          key=lambda item: item[1][1], reverse=True)
+        for name, (own, cumulative) in children[:args.top]:
+            print(f"    {name:<36} {cumulative:>8.1f} ms  (self {own:.1f})")
+        if budget and total > budget:
+            failures.append(f'{module}: {total:.0f} ms > {budget:.0f} ms')
+        loaded = heavy_modules(module)
+        if module in LAZY and loaded:
+            failures.append(f'{module} eagerly imports {", ".join(loaded)}')
+
+    if failures:
+        print('Import budget exceeded:')
+        for line in failures:
+            print(f'  {line}')
+        sys.exit(1)
+    print('All imports within budget')
+
+
+if __name__ == '__main__':
+    main()
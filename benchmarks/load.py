@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic
+from benchmarks.runner import percentile
+
+QUERY_COMMANDS = ['!players', '!leaderboard', '!leaderboard_avg', '!career {name}', '!graph', '!recent 365']
+DEFAULT_MIX = 'query=6,graph=2,ledgers=1,ocr=1'
+
+
+def screenshot(seed: int, rows: int = 8) -> bytes:
+    # a ledger-like PNG, enough for the preprocessing stage to have real work to do
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    image = Image.new('RGB', (1170, 160 + rows * 90), (24, 26, 32))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 80, 1130, 100 + rows * 90), fill=(245, 245, 245))
+    for row in range(rows):
+        user_id = synthetic.make_user_id(rng)
+        net = rng.randint(-4000, 4000) / 100
+        draw.text((60, 110 + row * 90), f'{rng.choice(synthetic.ALIASES)} @ {user_id}   20.00   {net:+.2f}',
+                  fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def generate_stream(duration: float, rate: float, guilds: int, mix: str, seed: int,
+                    names: list[str]) -> list[dict]:
+    rng = random.Random(seed)
+    kinds, weights = zip(*[(k, float(w)) for k, w in (item.split('=') for item in mix.split(','))])
+    events = []
+    moment = 0.0
+    while True:
+        moment += rng.expovariate(rate)
+        if moment > duration:
+            break
+        kind = rng.choices(kinds, weights=weights)[0]
+        event = {'t': round(moment, 4), 'guild': rng.randrange(guilds), 'kind': kind, 'seed': rng.randrange(10 ** 6)}
+        if kind == 'query':
+            event['content'] = rng.choice(QUERY_COMMANDS).format(name=rng.choice(names))
+        events.append(event)
+    return events
+
+
+def build_message(gateway, event: dict, hands: int):
+    from benchmarks.fake_discord import FakeAttachment
+    guild = gateway.guilds[event['guild'] % len(gateway.guilds)]
+    author = guild.members[event['seed'] % len(guild.members)]
+    kind = event['kind']
+    if kind == 'query':
+        return f"#query {event['content'].split()[0]}", guild.channel('query').post(author, event['content'])
+    if kind == 'graph':
+        log, ledger = synthetic.session(hands=hands, seed=event['seed'])
+        attachments = [FakeAttachment('poker_now_log.csv', log, 'text/csv'),
+                       FakeAttachment('ledger.csv', ledger, 'text/csv')]
+        return '#graph upload', guild.channel('graph').post(author, '', attachments)
+
+    # ledger imports need a fresh #game link so every insert is a new game and no admin prompt is raised
+    game = guild.channel('game').post(author, f"https://www.pokernow.club/games/pgl{event['seed']:07d}{event['t']}")
+    if kind == 'ledgers':
+        _, ledger = synthetic.session(hands=hands, seed=event['seed'])
+        attachments = [FakeAttachment('ledger.csv', ledger, 'text/csv')]
+    else:
+        attachments = [FakeAttachment(f'ledger{n}.png', screenshot(event['seed'] + n), 'image/png') for n in range(2)]
+    return f'#ledgers {kind}', guild.channel('ledgers-test').post(author, f'! {game.jump_url}', attachments)
+
+
+async def replay(events: list[dict], speed: float, args) -> dict:
+    from benchmarks.fake_discord import FakeGateway
+    from benchmarks.genai_stub import GenAIStub, history_user_ids
+    from src import bot
+    from src import metrics
+    from src import sharding
+    from src.metrics import LoopLagMonitor
+
+    stub = GenAIStub(history_user_ids(args.history_players, args.games, args.seed), latency=args.ocr_latency)
+    os.environ['GEMINI_BASE_URL'] = await stub.start(port=args.stub_port)
+    os.environ.setdefault('GEMINI_API_KEY', 'load-test')
+
+    gateway = FakeGateway(guilds=args.guilds, rest_latency=args.rest_latency)
+    # like Discord, only the guilds on this process's shards deliver events here
+    gateway.register(sharding.ownership)
+    bot.build_handlers()
+    monitor = LoopLagMonitor()
+    monitor.start()
+
+    latencies: dict[str, list[float]] = {}
+    failures: dict[str, int] = {}
+
+    async def dispatch(key: str, message):
+        began = time.perf_counter()
+        try:
+            await bot.on_message(message)
+        except Exception:
+            failures[key] = failures.get(key, 0) + 1
+        latencies.setdefault(key, []).append(time.perf_counter() - began)
+
+    tasks = []
+    skipped = 0
+    start = time.perf_counter()
+    for event in events:
+        if not sharding.ownership.owns(gateway.guilds[event['guild'] % len(gateway.guilds)].id):
+            skipped += 1
+            continue
+        delay = event['t'] / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        key, message = build_message(gateway, event, args.hands)
+        tasks.append(asyncio.create_task(dispatch(key, message)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    monitor.stop()
+    await stub.stop()
+    return {
+        'shards': str(sharding.ownership),
+        'messages': len(tasks),
+        'other_shards': skipped,
+        'elapsed_s': elapsed,
+        'throughput_per_s': len(tasks) / elapsed if elapsed else 0.0,
+        'rest_sends': gateway.sent,
+        'ocr_requests': stub.requests,
+        'handlers': {key: {
+            'count': len(values),
+            'failures': failures.get(key, 0),
+            'p50_ms': percentile(sorted(values), 50) * 1000,
+            'p95_ms': percentile(sorted(values), 95) * 1000,
+            'p99_ms': percentile(sorted(values), 99) * 1000,
+            'max_ms': max(values) * 1000,
+        } for key, values in sorted(latencies.items())},
+        'loop_lag': {
+            'p50_ms': percentile(sorted(monitor.samples), 50) * 1000,
+            'p99_ms': percentile(sorted(monitor.samples), 99) * 1000,
+            'max_ms': max(monitor.samples, default=0.0) * 1000,
+        },
+        # the bot's own breakdown: DB time per preset, OCR and render durations
+        'bot_metrics': metrics.summary(limit=40),
+    }
+
+
+def print_report(report: dict):
+    print(f"[{report['shards']}] {report['messages']} messages in {report['elapsed_s']:.1f}s "
+          f"({report['throughput_per_s']:.2f}/s), {report['rest_sends']} sends, {report['ocr_requests']} OCR calls")
+    print(f"{'handler':<22} {'count':>6} {'fail':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for key, row in report['handlers'].items():
+        print(f"{key:<22} {row['count']:>6} {row['failures']:>5} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    lag = report['loop_lag']
+    print(f"event loop lag: p50 {lag['p50_ms']:.1f} ms, p99 {lag['p99_ms']:.1f} ms, max {lag['max_ms']:.1f} ms")
+    print()
+    print(report['bot_metrics'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive bot.on_message with simulated guilds and report latency.')
+    parser.add_argument('--section', default='benchmark', help='database.ini section for the local Postgres')
+    parser.add_argument('--guilds', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=60, help='seconds of generated traffic')
+    parser.add_argument('--rate', type=float, default=2.0, help='generated messages per second')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay acceleration factor')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='relative weights of query/graph/ledgers/ocr messages')
+    parser.add_argument('--hands', type=int, default=300)
+    parser.add_argument('--history-players', type=int, default=60)
+    parser.add_argument('--games', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rest-latency', type=float, default=0.05)
+    parser.add_argument('--ocr-latency', type=float, default=1.5)
+    parser.add_argument('--stub-port', type=int, default=8765)
+    parser.add_argument('--record', help='write the generated stream to this JSONL file')
+    parser.add_argument('--replay', help='replay a recorded JSONL stream instead of generating one')
+    parser.add_argument('--json', help='also write the report to this path')
+    parser.add_argument('--shards', type=int, help='shard the simulated guilds like an AutoShardedClient')
+    parser.add_argument('--shard-ids', help='comma separated shards owned by this process (default: all)')
+    parser.add_argument('--processes', type=int, default=1, help='run the shards in this many processes')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_SECTION'] = args.section
+    if args.shards and args.processes > 1:
+        run_processes(args)
+        return
+    if args.shards:
+        # read by src.sharding when the bot is imported
+        os.environ['SHARD_COUNT'] = str(args.shards)
+        if args.shard_ids:
+            os.environ['SHARD_IDS'] = args.shard_ids
+    if args.replay:
+        with open(args.replay) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        names = [name for _, name in synthetic.history(args.history_players, args.games, args.seed).players]
+        events = generate_stream(args.duration, args.rate, args.guilds, args.mix, args.seed, names)
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(event) + '\n' for event in events)
+
+    report = asyncio.run(replay(events, args.speed, args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def run_processes(args):
+    # One replay per group of shards, each process sees the same stream but only its own guilds
+    from src import sharding
+    groups = sharding.plan(args.shards, args.processes)
+    with tempfile.TemporaryDirectory() as directory:
+        children = []
+        for index, shard_ids in enumerate(groups):
+            path = os.path.join(directory, f'shard{index}.json')
+            command = [sys.executable, '-m', 'benchmarks.load', *sys.argv[1:], '--processes', '1',
+                       '--shard-ids', ','.join(map(str, shard_ids)), '--json', path,
+                       '--stub-port', str(args.stub_port + index)]
+            children.append((path, subprocess.Popen(command)))
+        reports = []
+        for path, child in children:
+            child.wait()
+            if child.returncode == 0 and os.path.exists(path):
+                with open(path) as f:
+                    reports.append(json.load(f))
+    messages = sum(report['messages'] for report in reports)
+    elapsed = max((report['elapsed_s'] for report in reports), default=0.0)
+    print(f"{len(reports)}/{len(groups)} processes, {messages} messages in {elapsed:.1f}s "
+          f"({messages / elapsed if elapsed else 0.0:.2f}/s combined)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'processes': reports, 'messages': messages, 'elapsed_s': elapsed}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
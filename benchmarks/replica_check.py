@@ -0,0 +1,54 @@
+import argparse
+import os
+import time
+
+
+def server(connection) -> str:
+    from src.connect import query
+    ans, _ = query(connection, "SELECT inet_server_port(), pg_is_in_recovery();")
+    connection.commit()
+    port, recovery = ans[0]
+    return f"port {port} ({'standby' if recovery else 'primary'})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check read routing between a primary and a read replica.')
+    parser.add_argument('--section', default='benchmark', help='database.ini section of the primary')
+    parser.add_argument('--replica-section', help="replica section (default: '<section>_replica')")
+    parser.add_argument('--wait', type=float, default=5.0, help='seconds to wait for the replica to replay a write')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_SECTION'] = args.section
+    if args.replica_section:
+        os.environ['DATABASE_REPLICA_SECTION'] = args.replica_section
+    from src import connect as db
+
+    if db.replica_config() is None:
+        print('No replica section configured, every read uses the primary')
+        return
+    print(f'primary: {server(db.connect())}')
+    print(f'read:    {server(db.connect_read())}')
+
+    # read-your-writes: after a write this user reads from the primary until the replica replays it
+    db.current_user.set(1)
+    primary = db.connect()
+    with primary:
+        db.query(primary, "CREATE TEMP TABLE replica_check (t timestamptz); INSERT INTO replica_check VALUES (now());")
+    db.record_write(primary)
+    target = server(db.connect_read())
+    print(f'after write: {target}')
+    deadline = time.monotonic() + args.wait
+    while 1 in db._writes and time.monotonic() < deadline:
+        time.sleep(0.2)
+        target = server(db.connect_read())
+    if 1 not in db._writes:
+        print(f'replica caught up, reads back on {target}')
+    else:
+        print(f'replica still behind after {args.wait}s, reads stay on the primary')
+
+    os.environ['DATABASE_REPLICA_SECTION'] = 'replica_check_missing'
+    print(f'without a replica section: {server(db.connect_read())}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from benchmarks import synthetic
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# game_id used by the insert benchmark, far above any synthetic history
+SCRATCH_GAME_ID = 900_000
+
+
+@dataclass
+class Case:
+    name: str
+    # setup returns the callable that is timed, built once so setup cost is excluded
+    setup: Callable[['argparse.Namespace'], Callable[[], object]]
+    needs_db: bool = False
+    teardown: Optional[Callable[[], None]] = None
+
+
+def _csv_rows(data: bytes) -> list[list[str]]:
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+
+def _uncached(func: Callable[[], object]) -> Callable[[], object]:
+    # presets cached since the baseline are timed cold, so every run still reaches the database
+    from src import cache
+
+    def run():
+        cache.results.clear()
+        return func()
+    return run
+
+
+def _setup_graph(args):
+    from src import graph
+    log, ledger = synthetic.session(args.players, args.hands, args.seed)
+    log_rows, ledger_rows = _csv_rows(log), _csv_rows(ledger)
+    # the name lookup goes through the cached user_names preset
+    return _uncached(lambda: graph.graph(log_rows, ledger_rows))
+
+
+def _setup_encode(args):
+    from src import render
+    fig = render.sample_figure(args.hands, args.players, render.DEFAULT_PROFILE)
+    return lambda: render.encode(fig, render.DEFAULT_PROFILE)
+
+
+def _setup_ledger_csv(args):
+    from src import ledger_csv
+    _, ledger = synthetic.session(args.players, args.hands, args.seed)
+    return lambda: ledger_csv.parse_ledger_csv(ledger)
+
+
+def _ocr_frames(args, misread: bool) -> list:
+    # one frame per game, shaped like gemini() output, optionally with OCR-style id mistakes
+    import pandas as pd
+    rng = random.Random(args.seed)
+    data = synthetic.history(args.history_players, args.games, args.seed)
+    by_game = {}
+    for game_id, user_id, net, alias in data.ledgers:
+        by_game.setdefault(game_id, []).append((alias, synthetic.misread(user_id, rng) if misread else user_id, net))
+    games = list(by_game.values())[-args.batch:]
+    return [pd.DataFrame(rows, columns=['alias', 'user_id', 'net']) for rows in games]
+
+
+def _setup_deduplicate(args):
+    import pandas as pd
+    from src import ledger_gemini
+    frames = _ocr_frames(args, misread=False)
+    # split screenshots repeat roughly a third of the rows
+    doubled = [pd.concat([frame, frame.iloc[: len(frame) // 3]], ignore_index=True) for frame in frames]
+    return lambda: [ledger_gemini.deduplicate_rows(frame.copy()) for frame in doubled]
+
+
+def _setup_format_ledgers(args):
+    from src import ledger_gemini
+    frames = _ocr_frames(args, misread=True)
+    return lambda: ledger_gemini.format_ledgers([frame.copy() for frame in frames])
+
+
+def _setup_insert_ledgers(args):
+    from src import ledger_gemini
+    frame = _ocr_frames(args, misread=False)[-1]
+    # re-inserting the same game is steady state: the game row exists and its ledgers are replaced
+    return lambda: ledger_gemini.insert_ledgers([frame], SCRATCH_GAME_ID)
+
+
+def _teardown_insert_ledgers():
+    from src.connect import connect, query
+    with connect() as connection:
+        query(connection, 'DELETE FROM ledgers WHERE game_id = %s;', SCRATCH_GAME_ID)
+        query(connection, 'DELETE FROM games WHERE game_id = %s;', SCRATCH_GAME_ID)
+
+
+def _setup_leaderboard(args):
+    from src import query_presets
+    return lambda: query_presets.leaderboard.uncached()
+
+
+def _setup_career_graph(args):
+    from src import query_presets
+    return lambda: query_presets.career_graph()
+
+
+def _setup_recent_graph(args):
+    from src import query_presets
+    return lambda: query_presets.recent_graph(3650)
+
+
+def _setup_stats(args):
+    from src import stats
+    # loaded once in setup, what every command after the first reads
+    stats.summary()
+    return lambda: stats.summary()
+
+
+def _setup_search(args):
+    from src import query_presets
+    # an alias fragment and a user id fragment, both present in the synthetic history
+    return lambda: query_presets.search('ledgers', ['ace', 'x7'])
+
+
+def _setup_table_page(args):
+    from src import query_presets
+    keyset = query_presets.table_pages('ledgers')
+    # the page after the first, what the Next button fetches
+    first = keyset.fetch()
+    return lambda: keyset.fetch(after=first.last_key)
+
+
+CASES = [
+    Case('render.encode', _setup_encode),
+    Case('ledger_csv.parse_ledger_csv', _setup_ledger_csv),
+    Case('ledger_gemini.deduplicate_rows', _setup_deduplicate),
+    Case('graph.graph', _setup_graph, needs_db=True),
+    Case('query_presets.leaderboard', _setup_leaderboard, needs_db=True),
+    Case('query_presets.career_graph', _setup_career_graph, needs_db=True),
+    Case('query_presets.recent_graph', _setup_recent_graph, needs_db=True),
+    Case('stats.summary', _setup_stats, needs_db=True),
+    Case('query_presets.search', _setup_search, needs_db=True),
+    Case('pagination.Keyset.fetch', _setup_table_page, needs_db=True),
+    Case('ledger_gemini.format_ledgers', _setup_format_ledgers, needs_db=True),
+    Case('ledger_gemini.insert_ledgers', _setup_insert_ledgers, needs_db=True, teardown=_teardown_insert_ledgers),
+]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(case: Case, args) -> dict[str, float]:
+    run = case.setup(args)
+    try:
+        for _ in range(args.warmup):
+            run()
+        timings = []
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            began = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+
+        # tracemalloc slows allocation heavy code, so peak memory gets its own untimed pass
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if case.teardown:
+            case.teardown()
+
+    timings.sort()
+    return {
+        'iterations': args.iterations,
+        'throughput_per_s': args.iterations / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'peak_kib'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                change = (result[metric] / before[metric] - 1) * 100
+                regressions.append(f'{name} {metric}: {before[metric]:.2f} -> {result[metric]:.2f} (+{change:.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bot hot paths on synthetic data.')
+    parser.add_argument('cases', nargs='*', help='case names to run (default: all available)')
+    parser.add_argument('--db', action='store_true', help='include cases that need a database')
+    parser.add_argument('--section', default='benchmark', help='database.ini section used with --db')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--players', type=int, default=9)
+    parser.add_argument('--hands', type=int, default=400)
+    parser.add_argument('--history-players', type=int, default=60)
+    parser.add_argument('--games', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=5, help='ledgers per format/dedup call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown before failing')
+    parser.add_argument('--json', help='also write results to this path')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['DATABASE_SECTION'] = args.section
+    selected = [c for c in CASES if (not args.cases or c.name in args.cases) and (args.db or not c.needs_db)]
+
+    results = {}
+    print(f"{'case':<34} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+    for case in selected:
+        result = measure(case, args)
+        results[case.name] = result
+        print(f"{case.name:<34} {result['throughput_per_s']:>9.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['peak_kib']:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+import argparse
+import csv
+import datetime
+import io
+import os
+import random
+import string
+from dataclasses import dataclass, field
+from typing import Optional
+
+ALIASES = [
+    'ace', 'river_rat', 'nuts', 'donk', 'fishy', 'shark', 'bluff', 'grinder', 'nit', 'maniac',
+    'calling_station', 'rounder', 'tilt', 'whale', 'rock', 'gambler', 'lucky', 'dealer', 'button', 'kicker',
+]
+SUITS = 'cdhs'
+RANKS = '23456789TJQKA'
+ID_CHARS = string.ascii_letters + string.digits + '-_'
+
+
+def make_user_id(rng: random.Random) -> str:
+    return ''.join(rng.choice(ID_CHARS) for _ in range(10))
+
+
+def dollars(cents: int) -> str:
+    return f'{cents / 100:.2f}'
+
+
+@dataclass
+class Session:
+    start: datetime.datetime
+    end: Optional[datetime.datetime] = None
+    buy_in: int = 0
+    buy_out: int = 0
+
+
+@dataclass
+class SimPlayer:
+    alias: str
+    user_id: str
+    stack: int = 0
+    seated: bool = False
+    owes_blind: bool = False
+    sessions: list[Session] = field(default_factory=list)
+
+    @property
+    def tag(self) -> str:
+        return f'"{self.alias} @ {self.user_id}"'
+
+
+class SessionGenerator:
+    # Simulates a PokerNow cash game closely enough for graph.graph to parse: blinds, betting streets,
+    # uncalled bets, collections, rebuys (approved/updated), quits and missing blinds for late joiners.
+    # Bets never exceed the shortest stack in the hand, so there are no side pots to reconcile.
+    def __init__(self, players: int = 8, hands: int = 300, seed: int = 0, buy_in: int = 2000,
+                 small_blind: int = 10, big_blind: int = 20, rebuy_rate: float = 0.8, quit_rate: float = 0.004,
+                 late_joiners: int = 2):
+        self.rng = random.Random(seed)
+        self.hands = hands
+        self.buy_in = buy_in
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.rebuy_rate = rebuy_rate
+        self.quit_rate = quit_rate
+        self.clock = datetime.datetime(2024, 1, 5, 20, 0, tzinfo=datetime.timezone.utc)
+        aliases = self.rng.sample(ALIASES, min(players, len(ALIASES)))
+        aliases += [f'player{n}' for n in range(len(aliases), players)]
+        self.players = [SimPlayer(alias, make_user_id(self.rng)) for alias in aliases]
+        self.late = self.players[players - min(late_joiners, players - 2):] if players > 2 else []
+        self.entries: list[tuple[str, datetime.datetime]] = []
+        self.dealer = 0
+
+    def _log(self, line: str):
+        self.clock += datetime.timedelta(milliseconds=self.rng.randint(200, 4000))
+        self.entries.append((line, self.clock))
+
+    def _seat(self, player: SimPlayer, stack: int, late: bool = False):
+        player.seated = True
+        player.stack = stack
+        player.owes_blind = late
+        player.sessions.append(Session(self.clock, buy_in=stack))
+        self._log(f'The player {player.tag} requested a seat.')
+        self._log(f'The admin approved the player {player.tag} participation with a stack of {dollars(stack)}.')
+
+    def _quit(self, player: SimPlayer):
+        player.seated = False
+        session = player.sessions[-1]
+        session.buy_out += player.stack
+        session.end = self.clock
+        self._log(f'The player {player.tag} quits the game with a stack of {dollars(player.stack)}.')
+        player.stack = 0
+
+    def _between_hands(self, hand: int):
+        for player in self.players:
+            if player.seated and player.stack < self.big_blind:
+                if self.rng.random() < self.rebuy_rate:
+                    # PokerNow logs a top-up of a seated player as an admin stack update
+                    player.sessions[-1].buy_in += self.buy_in
+                    self._log(f'The admin updated the player {player.tag} stack from {dollars(player.stack)} '
+                              f'to {dollars(player.stack + self.buy_in)}.')
+                    player.stack += self.buy_in
+                else:
+                    self._quit(player)
+            elif player.seated and self.rng.random() < self.quit_rate:
+                self._quit(player)
+        for player in self.late:
+            if not player.seated and not player.sessions and hand >= self.hands // 4 and self.rng.random() < 0.05:
+                self._seat(player, self.buy_in, late=True)
+
+    def _cards(self, count: int) -> str:
+        cards = self.rng.sample([r + s for r in RANKS for s in SUITS], count)
+        return ', '.join(cards)
+
+    def _hand(self, number: int):
+        seated = [p for p in self.players if p.seated and p.stack >= self.big_blind]
+        if len(seated) < 2:
+            return
+        self.dealer = (self.dealer + 1) % len(seated)
+        order = seated[self.dealer + 1:] + seated[:self.dealer + 1]
+        dealer = seated[self.dealer]
+        self._log(f'-- starting hand #{number} (id: {make_user_id(self.rng)})  (No Limit Texas Hold\'em) '
+                  f'(dealer: {dealer.tag}) --')
+        self._log('Player stacks: ' + ' | '.join(f'#{i + 1} {p.tag} ({dollars(p.stack)})'
+                                                 for i, p in enumerate(seated)))
+
+        pot = 0
+        in_hand = list(order)
+        street_total = {p.user_id: 0 for p in order}
+
+        def put_in(player: SimPlayer, total: int):
+            nonlocal pot
+            added = total - street_total[player.user_id]
+            player.stack -= added
+            pot += added
+            street_total[player.user_id] = total
+
+        small, big = order[0], order[1 % len(order)]
+        put_in(small, min(self.small_blind, small.stack))
+        self._log(f'{small.tag} posts a small blind of {dollars(street_total[small.user_id])}')
+        put_in(big, min(self.big_blind, big.stack + street_total[big.user_id]))
+        self._log(f'{big.tag} posts a big blind of {dollars(street_total[big.user_id])}')
+        for player in order:
+            if player.owes_blind and player not in (small, big) and player.stack >= self.big_blind + self.small_blind:
+                player.stack -= self.small_blind
+                pot += self.small_blind
+                self._log(f'{player.tag} posts a missing small blind of {dollars(self.small_blind)}')
+            player.owes_blind = False
+
+        current = max(street_total.values())
+        last_aggressor: Optional[SimPlayer] = big
+        for street, cards in (('Preflop', 0), ('Flop', 3), ('Turn', 1), ('River', 1)):
+            if street != 'Preflop':
+                board = self._cards(cards)
+                self._log(f'{street}:  [{board}]')
+                street_total = {p.user_id: 0 for p in order}
+                current = 0
+                last_aggressor = None
+            cap = min(p.stack + street_total[p.user_id] for p in in_hand)
+            for player in list(in_hand):
+                if len(in_hand) == 1:
+                    break
+                roll = self.rng.random()
+                owed = current - street_total[player.user_id]
+                if roll < 0.15 and cap > current:
+                    target = min(cap, max(current * 2, current + self.big_blind, int(pot * self.rng.uniform(0.4, 1.0))))
+                    verb = 'raises to' if current else 'bets'
+                    put_in(player, target)
+                    current = target
+                    last_aggressor = player
+                    self._log(f'{player.tag} {verb} {dollars(target)}')
+                elif owed == 0:
+                    self._log(f'{player.tag} checks')
+                elif roll < 0.55:
+                    in_hand.remove(player)
+                    self._log(f'{player.tag} folds')
+                else:
+                    put_in(player, current)
+                    self._log(f'{player.tag} calls {dollars(current)}')
+            # players who acted before a raise either call it or fold
+            for player in list(in_hand):
+                if len(in_hand) == 1:
+                    break
+                if street_total[player.user_id] < current:
+                    if self.rng.random() < 0.5:
+                        in_hand.remove(player)
+                        self._log(f'{player.tag} folds')
+                    else:
+                        put_in(player, current)
+                        self._log(f'{player.tag} calls {dollars(current)}')
+            if len(in_hand) == 1:
+                break
+
+        winner = in_hand[0] if len(in_hand) == 1 else self.rng.choice(in_hand)
+        if len(in_hand) == 1 and last_aggressor is winner:
+            called = max([v for k, v in street_total.items() if k != winner.user_id] + [0])
+            uncalled = street_total[winner.user_id] - called
+            if uncalled > 0:
+                winner.stack += uncalled
+                pot -= uncalled
+                self._log(f'Uncalled bet of {dollars(uncalled)} returned to {winner.tag}')
+        winner.stack += pot
+        self._log(f'{winner.tag} collected {dollars(pot)} from pot')
+        self._log(f'-- ending hand #{number} --')
+
+    def run(self) -> 'SessionGenerator':
+        for player in self.players:
+            if player not in self.late:
+                self._seat(player, self.buy_in)
+        for number in range(1, self.hands + 1):
+            self._between_hands(number)
+            self._hand(number)
+        for player in self.players:
+            if player.seated:
+                player.sessions[-1].end = self.clock
+        return self
+
+    def log_csv(self) -> bytes:
+        # PokerNow exports the log newest first
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['entry', 'at', 'order'])
+        for line, at in reversed(self.entries):
+            writer.writerow([line, at.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z', int(at.timestamp() * 100000)])
+        return out.getvalue().encode('utf-8')
+
+    def ledger_rows(self) -> list[dict[str, object]]:
+        rows = []
+        for player in self.players:
+            for session in player.sessions:
+                stack = player.stack if session is player.sessions[-1] and player.seated else 0
+                rows.append({
+                    'player_nickname': player.alias,
+                    'player_id': player.user_id,
+                    'session_start_at': session.start.isoformat(),
+                    'session_end_at': session.end.isoformat() if session.end else '',
+                    'buy_in': session.buy_in,
+                    'buy_out': session.buy_out,
+                    'stack': stack,
+                    'net': session.buy_out + stack - session.buy_in,
+                })
+        return rows
+
+    def ledger_csv(self) -> bytes:
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=['player_nickname', 'player_id', 'session_start_at',
+                                                 'session_end_at', 'buy_in', 'buy_out', 'stack', 'net'])
+        writer.writeheader()
+        writer.writerows(self.ledger_rows())
+        return out.getvalue().encode('utf-8')
+
+
+def session(players: int = 8, hands: int = 300, seed: int = 0, **kwargs) -> tuple[bytes, bytes]:
+    generator = SessionGenerator(players=players, hands=hands, seed=seed, **kwargs).run()
+    return generator.log_csv(), generator.ledger_csv()
+
+
+def misread(user_id: str, rng: random.Random) -> str:
+    # one substituted character, the typical OCR mistake format_ledgers has to correct
+    position = rng.randrange(len(user_id))
+    return user_id[:position] + rng.choice(ID_CHARS) + user_id[position + 1:]
+
+
+@dataclass
+class History:
+    players: list[tuple[int, str]]
+    users: list[tuple[str, int]]
+    games: list[tuple[int, str, datetime.datetime]]
+    ledgers: list[tuple[int, str, int, str]]
+
+
+def history(players: int = 60, games: int = 500, seed: int = 0, per_game: tuple[int, int] = (5, 10),
+            start: datetime.date = datetime.date(2021, 1, 1)) -> History:
+    # Years of weekly-ish games: a core of regulars, players with several PokerNow ids, balanced nets
+    rng = random.Random(seed)
+    player_rows = [(pid, f'{rng.choice(ALIASES)}_{pid}') for pid in range(1, players + 1)]
+    user_rows = []
+    ids_by_player = {}
+    for pid, _ in player_rows:
+        ids = [make_user_id(rng) for _ in range(1 if rng.random() < 0.7 else rng.randint(2, 3))]
+        ids_by_player[pid] = ids
+        user_rows.extend((user_id, pid) for user_id in ids)
+    names = dict(player_rows)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(players)]
+
+    game_rows = []
+    ledger_rows = []
+    day = datetime.datetime.combine(start, datetime.time(20, 0), tzinfo=datetime.timezone.utc)
+    for game_id in range(1, games + 1):
+        day += datetime.timedelta(days=rng.randint(2, 9), minutes=rng.randint(0, 59))
+        game_rows.append((game_id, ''.join(rng.choice(ID_CHARS) for _ in range(25)), day))
+        count = min(players, rng.randint(*per_game))
+        seated = set()
+        while len(seated) < count:
+            seated.add(rng.choices(range(1, players + 1), weights=weights)[0])
+        nets = [rng.randint(-60, 60) * 100 + rng.randint(0, 99) for _ in range(count - 1)]
+        nets.append(-sum(nets))
+        for pid, net in zip(sorted(seated), nets):
+            user_id = rng.choice(ids_by_player[pid])
+            ledger_rows.append((game_id, user_id, net, names[pid]))
+    return History(player_rows, user_rows, game_rows, ledger_rows)
+
+
+def load_history(connection, data: History):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('TRUNCATE ledgers, users, games, players;')
+        cursor.executemany('INSERT INTO players (player_id, name) VALUES (%s, %s);', data.players)
+        cursor.executemany('INSERT INTO users (user_id, player_id) VALUES (%s, %s);', data.users)
+        cursor.executemany('INSERT INTO games (game_id, url, date) VALUES (%s, %s, %s);', data.games)
+        cursor.executemany('INSERT INTO ledgers (game_id, user_id, net, alias) VALUES (%s, %s, %s, %s);',
+                           data.ledgers)
+        cursor.execute("SELECT setval(pg_get_serial_sequence('players', 'player_id'), %s);", (len(data.players),))
+        cursor.execute("SELECT setval(pg_get_serial_sequence('games', 'game_id'), %s);", (len(data.games),))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic PokerNow sessions and ledger history.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    files = sub.add_parser('session', help='write a PokerNow log and ledger CSV')
+    files.add_argument('--out', default='.', help='output directory')
+    files.add_argument('--players', type=int, default=8)
+    files.add_argument('--hands', type=int, default=300)
+    files.add_argument('--seed', type=int, default=0)
+    files.add_argument('--rebuy-rate', type=float, default=0.8)
+    files.add_argument('--quit-rate', type=float, default=0.004)
+    files.add_argument('--late-joiners', type=int, default=2)
+
+    db = sub.add_parser('history', help='replace the ledger history of a database with synthetic history')
+    db.add_argument('--section', default='benchmark', help='database.ini section to load into')
+    db.add_argument('--production', action='store_true',
+                    help='confirm that the postgresql section (the live database) may be truncated')
+    db.add_argument('--players', type=int, default=60)
+    db.add_argument('--games', type=int, default=500)
+    db.add_argument('--seed', type=int, default=0)
+    db.add_argument('--schema', action='store_true', help='apply db/schema.sql first (empty database)')
+    args = parser.parse_args()
+
+    if args.command == 'session':
+        log, ledger = session(args.players, args.hands, args.seed, rebuy_rate=args.rebuy_rate,
+                              quit_rate=args.quit_rate, late_joiners=args.late_joiners)
+        os.makedirs(args.out, exist_ok=True)
+        log_path = os.path.join(args.out, f'poker_now_log_pg{args.seed}.csv')
+        ledger_path = os.path.join(args.out, f'ledger_pg{args.seed}.csv')
+        with open(log_path, 'wb') as f:
+            f.write(log)
+        with open(ledger_path, 'wb') as f:
+            f.write(ledger)
+        print(log_path)
+        print(ledger_path)
+    else:
+        if args.section == 'postgresql' and not args.production:
+            parser.error('history truncates every ledger, user, game and player, '
+                         'pass --production to do that to the postgresql section')
+        os.environ['DATABASE_SECTION'] = args.section
+        from src.connect import connect
+        with connect() as connection:
+            if args.schema:
+                with open('db/schema.sql') as schema, connection.cursor() as cursor:
+                    cursor.execute(schema.read())
+            load_history(connection, history(args.players, args.games, args.seed))
+        print(f'Loaded {args.players} players and {args.games} games')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+-- per-guild channel/role ids shared between bot processes (sharded deployments)
+CREATE TABLE IF NOT EXISTS public.guild_state (
+    guild_id bigint NOT NULL,
+    kind text NOT NULL,
+    name text NOT NULL,
+    object_id bigint NOT NULL,
+    shard_id integer NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT guild_state_pkey PRIMARY KEY (guild_id, kind, name)
+);
@@ -0,0 +1,25 @@
+-- lower-cased text of every column, trigram indexed for !search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION public.refresh_search_text() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_text := lower((SELECT string_agg(value, ' ') FROM jsonb_each_text(to_jsonb(NEW) - 'search_text')));
+    RETURN NEW;
+END $$;
+
+DO $$
+DECLARE
+    t text;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['players', 'users', 'ledgers', 'games'] LOOP
+        EXECUTE format('ALTER TABLE public.%I ADD COLUMN IF NOT EXISTS search_text text', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', t || '_search_text', t);
+        EXECUTE format('CREATE TRIGGER %I BEFORE INSERT OR UPDATE ON public.%I '
+                       'FOR EACH ROW EXECUTE FUNCTION public.refresh_search_text()', t || '_search_text', t);
+        -- the trigger fills existing rows
+        EXECUTE format('UPDATE public.%I SET search_text = NULL', t);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON public.%I USING gin (search_text gin_trgm_ops)',
+                       t || '_search_text_idx', t);
+    END LOOP;
+END $$;
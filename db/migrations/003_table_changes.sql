@@ -0,0 +1,18 @@
+-- NOTIFY table_changes with the table name after any write, every bot process drops its cached results for it
+CREATE OR REPLACE FUNCTION public.notify_table_change() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('table_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END $$;
+
+DO $$
+DECLARE
+    t text;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['players', 'users', 'ledgers', 'games'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I', t || '_table_changes', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.%I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change()', t || '_table_changes', t);
+    END LOOP;
+END $$;
@@ -0,0 +1,21 @@
+-- background jobs (src/jobs.py): one row per job, claimed with SKIP LOCKED by any bot process
+CREATE TABLE IF NOT EXISTS public.jobs (
+    job_id bigserial PRIMARY KEY,
+    kind text NOT NULL,
+    payload jsonb DEFAULT '{}'::jsonb NOT NULL,
+    guild_id bigint,
+    priority integer DEFAULT 0 NOT NULL,
+    dedup_key text,
+    status text DEFAULT 'pending' NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    max_attempts integer DEFAULT 3 NOT NULL,
+    run_at timestamp with time zone DEFAULT now() NOT NULL,
+    locked_until timestamp with time zone,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    finished_at timestamp with time zone,
+    last_error text
+);
+
+-- at most one pending job per dedup key
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedup_key ON public.jobs (dedup_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_due_idx ON public.jobs (priority DESC, run_at) WHERE status IN ('pending', 'running');
@@ -1,3 +1,19 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE FUNCTION public.refresh_search_text() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_text := lower((SELECT string_agg(value, ' ') FROM jsonb_each_text(to_jsonb(NEW) - 'search_text')));
+    RETURN NEW;
+END $$;
+
+CREATE FUNCTION public.notify_table_change() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('table_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END $$;
+
 CREATE TABLE public.channels (
     channel_id bigint NOT NULL,
     channel_name text NOT NULL
@@ -6,7 +22,8 @@ CREATE TABLE public.channels (
 CREATE TABLE public.games (
     game_id integer NOT NULL,
     date timestamp with time zone,
-    url text
+    url text,
+    search_text text
 );
 
 CREATE SEQUENCE public.games_game_id_seq
@@ -19,11 +36,47 @@ CREATE SEQUENCE public.games_game_id_seq
 
 ALTER SEQUENCE public.games_game_id_seq OWNED BY public.games.game_id;
 
+CREATE TABLE public.guild_state (
+    guild_id bigint NOT NULL,
+    kind text NOT NULL,
+    name text NOT NULL,
+    object_id bigint NOT NULL,
+    shard_id integer NOT NULL,
+    updated_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+CREATE TABLE public.jobs (
+    job_id bigint NOT NULL,
+    kind text NOT NULL,
+    payload jsonb DEFAULT '{}'::jsonb NOT NULL,
+    guild_id bigint,
+    priority integer DEFAULT 0 NOT NULL,
+    dedup_key text,
+    status text DEFAULT 'pending'::text NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    max_attempts integer DEFAULT 3 NOT NULL,
+    run_at timestamp with time zone DEFAULT now() NOT NULL,
+    locked_until timestamp with time zone,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    finished_at timestamp with time zone,
+    last_error text
+);
+
+CREATE SEQUENCE public.jobs_job_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+ALTER SEQUENCE public.jobs_job_id_seq OWNED BY public.jobs.job_id;
+
 CREATE TABLE public.ledgers (
     game_id integer NOT NULL,
     user_id text NOT NULL,
     net bigint,
-    alias text
+    alias text,
+    search_text text
 );
 
 CREATE TABLE public.misc (
@@ -35,7 +88,8 @@ CREATE TABLE public.players (
     player_id integer NOT NULL,
     name text,
     email text,
-    discord_id bigint
+    discord_id bigint,
+    search_text text
 );
 
 CREATE SEQUENCE public.players_player_id_seq
@@ -55,11 +109,14 @@ CREATE TABLE public.roles (
 
 CREATE TABLE public.users (
     user_id text NOT NULL,
-    player_id integer
+    player_id integer,
+    search_text text
 );
 
 ALTER TABLE ONLY public.games ALTER COLUMN game_id SET DEFAULT nextval('public.games_game_id_seq'::regclass);
 
+ALTER TABLE ONLY public.jobs ALTER COLUMN job_id SET DEFAULT nextval('public.jobs_job_id_seq'::regclass);
+
 ALTER TABLE ONLY public.players ALTER COLUMN player_id SET DEFAULT nextval('public.players_player_id_seq'::regclass);
 
 ALTER TABLE ONLY public.channels
@@ -77,6 +134,12 @@ ALTER TABLE ONLY public.games
 ALTER TABLE ONLY public.games
     ADD CONSTRAINT games_url_key UNIQUE (url);
 
+ALTER TABLE ONLY public.guild_state
+    ADD CONSTRAINT guild_state_pkey PRIMARY KEY (guild_id, kind, name);
+
+ALTER TABLE ONLY public.jobs
+    ADD CONSTRAINT jobs_pkey PRIMARY KEY (job_id);
+
 ALTER TABLE ONLY public.ledgers
     ADD CONSTRAINT ledgers_pkey PRIMARY KEY (game_id, user_id);
 
@@ -109,3 +172,31 @@ ALTER TABLE ONLY public.ledgers
 
 ALTER TABLE ONLY public.users
     ADD CONSTRAINT fk_users_players FOREIGN KEY (player_id) REFERENCES public.players(player_id) ON UPDATE CASCADE;
+
+CREATE INDEX games_search_text_idx ON public.games USING gin (search_text gin_trgm_ops);
+
+CREATE UNIQUE INDEX jobs_pending_dedup_key ON public.jobs USING btree (dedup_key) WHERE (status = 'pending'::text);
+
+CREATE INDEX jobs_due_idx ON public.jobs USING btree (priority DESC, run_at) WHERE (status = ANY (ARRAY['pending'::text, 'running'::text]));
+
+CREATE INDEX ledgers_search_text_idx ON public.ledgers USING gin (search_text gin_trgm_ops);
+
+CREATE INDEX players_search_text_idx ON public.players USING gin (search_text gin_trgm_ops);
+
+CREATE INDEX users_search_text_idx ON public.users USING gin (search_text gin_trgm_ops);
+
+CREATE TRIGGER games_search_text BEFORE INSERT OR UPDATE ON public.games FOR EACH ROW EXECUTE FUNCTION public.refresh_search_text();
+
+CREATE TRIGGER games_table_changes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.games FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change();
+
+CREATE TRIGGER ledgers_search_text BEFORE INSERT OR UPDATE ON public.ledgers FOR EACH ROW EXECUTE FUNCTION public.refresh_search_text();
+
+CREATE TRIGGER ledgers_table_changes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.ledgers FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change();
+
+CREATE TRIGGER players_search_text BEFORE INSERT OR UPDATE ON public.players FOR EACH ROW EXECUTE FUNCTION public.refresh_search_text();
+
+CREATE TRIGGER players_table_changes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.players FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change();
+
+CREATE TRIGGER users_search_text BEFORE INSERT OR UPDATE ON public.users FOR EACH ROW EXECUTE FUNCTION public.refresh_search_text();
+
+CREATE TRIGGER users_table_changes AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.users FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change();
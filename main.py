@@ -1,8 +1,10 @@
+import argparse
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import sys
 
-from src import bot
+from src import sharding
 
 os.makedirs("./logs", exist_ok=True)
 
@@ -20,12 +22,25 @@ def setup_logging():
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Discord Poker Bot')
+    parser.add_argument('--shards', type=int, help='total shard count, runs an AutoShardedClient')
+    parser.add_argument('--processes', type=int, default=1, help='split the shards across this many processes')
+    args = parser.parse_args()
+
     # run the bot
     setup_logging()
 
     logger = logging.getLogger(__name__)
-    logger.info("Launching Discord Poker Bot")
-
+    if args.shards and args.processes > 1:
+        logger.info("Launching %s processes for %s shards", args.processes, args.shards)
+        sys.exit(sharding.launch([sys.executable, os.path.abspath(__file__)], args.shards, args.processes))
+    if args.shards:
+        os.environ['SHARD_COUNT'] = str(args.shards)
+        sharding.ownership = sharding.Ownership(args.shards)
+    logger.info("Launching Discord Poker Bot (%s)", sharding.ownership)
+
+    # imported after the shard settings are known, the client is built at import
+    from src import bot
     bot.run_discord_bot()
 
 
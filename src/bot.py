@@ -9,26 +9,35 @@ from typing import Optional
 import discord
 from dotenv import load_dotenv
 
+from src import cache
+from src import commands
+from src import drain
 from src import common
+from src import guild_state
+from src import jobs
+from src import leader
+from src import metrics
+from src import notify
+from src import sharding
+from src import warmup
 from src.config import config
-from src.connect import connect, query
+from src.connect import connect, current_user, query, record_write
 from src.on_message import OnMessageHandler
+from src.profiler import profiler
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 has_dumped = False
-db_conf = config()
-DATABASE_URL = (
-    f"postgresql://{db_conf['user']}:{db_conf['password']}"
-    f"@{db_conf['host']}:{db_conf['port']}/{db_conf['database']}"
-)
+metrics_server = None
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-client = discord.Client(intents=intents)
+# AutoShardedClient when SHARD_COUNT is set, each process only receives events for the guilds on its shards
+client = sharding.make_client(intents)
+ownership = sharding.ownership
 
 channels = common.channels
 roles = common.roles
@@ -46,6 +55,18 @@ async def populate_dictionaries():
             guild_roles = [r for r in await guild.fetch_roles() if r.name in ROLES_TEMPLATE]
             roles[guild.id] = {r.name: r.id for r in sorted(guild_roles, key=lambda x: x.created_at, reverse=True)}
     except Exception as err:
+        try:
+            # another process or an earlier run of this shard may have published the ids
+            stored_channels, stored_roles = await asyncio.to_thread(
+                guild_state.load, [guild.id for guild in client.guilds])
+        except Exception as store_err:
+            logger.warning('Guild State Unavailable: %s', store_err)
+        else:
+            if stored_channels:
+                logger.warning('Using Stored Guild State: %s', err)
+                channels.update(stored_channels)
+                roles.update(stored_roles)
+                return
         logger.warning('Using Default Dictionary Values: %s', err)
         # This is to default hard-code dictionaries in primary server for necessary channels/roles
         roles = {1:
@@ -66,9 +87,22 @@ async def populate_dictionaries():
         for guild_id, mapping in channels.items():
             for name in CHANNELS_TEMPLATE:
                 mapping.setdefault(name, 0)
+            commands.index_guild(guild_id, mapping)
         for guild_id, mapping in roles.items():
             for name in ROLES_TEMPLATE:
                 mapping.setdefault(name, 0)
+        for guild in client.guilds:
+            persist_guild(guild.id)
+
+
+def persist_guild(guild_id: int):
+    # publish this guild's ids to the shared store without blocking the event loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(asyncio.to_thread(guild_state.save, guild_id, dict(channels.get(guild_id, {})),
+                                       dict(roles.get(guild_id, {})), ownership.shard(guild_id)))
 
 
 def reset_sequence(table: str, column: str) -> int:
@@ -102,7 +136,51 @@ async def reset_database_sequences(guild: discord.Guild = None):
         logger.info(f'Games - Next ID: {next_game}')
 
 
+async def request_dump():
+    await jobs.enqueue('dump_database', dedup='dump_database',
+                       fallback=lambda: asyncio.to_thread(dump_database))
+
+
+@jobs.handler('dump_database')
+async def dump_database_job(payload: dict):
+    await asyncio.to_thread(dump_database)
+
+
+@jobs.handler('add_games')
+async def add_games_job(payload: dict):
+    guild = client.get_guild(payload['guild_id'])
+    if guild is None:
+        raise RuntimeError(f"Guild {payload['guild_id']} is not available")
+    after = datetime.datetime.fromisoformat(payload['after'])
+    await handler.insert_games(guild, after, guild.get_channel(payload.get('reply_channel_id')))
+
+
+@jobs.handler('import_ledger')
+async def import_ledger_job(payload: dict):
+    # a ledger import the previous process reposted but did not finish, see handle_ledgers
+    guild = client.get_guild(payload['guild_id'])
+    if guild is None:
+        raise RuntimeError(f"Guild {payload['guild_id']} is not available")
+    channel = guild.get_channel(payload['channel_id'])
+    reposts = [await channel.fetch_message(message_id) for message_id in payload['reposts']]
+    game_channel_id, game_message_id = payload['game']
+    game_jump_message = await guild.get_channel(game_channel_id).fetch_message(game_message_id)
+    await handler.import_ledger(reposts[0], [a for repost in reposts for a in repost.attachments],
+                                game_jump_message, payload)
+
+
+def database_url() -> str:
+    db_conf = config()
+    return (
+        f"postgresql://{db_conf['user']}:{db_conf['password']}"
+        f"@{db_conf['host']}:{db_conf['port']}/{db_conf['database']}"
+    )
+
+
 def dump_database() -> Optional[str]:
+    if not leader.elector.leader:
+        logger.info('Database dump left to the leader')
+        return None
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     dump_path = f"db/dump_{timestamp}.sql"
     try:
@@ -114,7 +192,7 @@ def dump_database() -> Optional[str]:
             "--section=post-data",
             "--blobs",
             "--no-owner",
-            DATABASE_URL,
+            database_url(),
             "-f",
             dump_path
         ], check=True)
@@ -180,6 +258,9 @@ async def shutdown_message(file_path: Optional[str] = None):
 async def shutdown():
     logger.info("Shutting down bot, dumping database if not already done...")
     dump_path = dump_database_once()
+    jobs.scheduler.stop()
+    notify.listener.stop()
+    leader.elector.stop()
     try:
         await shutdown_message(dump_path)
     except Exception as e:
@@ -200,10 +281,15 @@ def handle_signal(sig, _):
     asyncio.create_task(shutdown())
 
 
-signal.signal(signal.SIGINT, handle_signal)
-signal.signal(signal.SIGTERM, handle_signal)
+handler: Optional[OnMessageHandler] = None
+# channel name -> bound handler, resolved once instead of per message
+handlers = {}
+
 
-handler = OnMessageHandler(shutdown, prompt, admin_message, reset_database_sequences, dump_database)
+def build_handlers():
+    global handler
+    handler = OnMessageHandler(shutdown, prompt, admin_message, reset_database_sequences, request_dump)
+    handlers.update({name: getattr(handler, method) for name, method in commands.ROUTES.items()})
 
 
 def update_guild_channel(
@@ -214,11 +300,15 @@ def update_guild_channel(
         logger.info(f"Removing #{old_channel.name} in {old_channel.guild.name}")
         guild_channels = channels.setdefault(old_channel.guild.id, {})
         guild_channels[old_channel.name] = 0
+        commands.index_guild(old_channel.guild.id, guild_channels)
+        persist_guild(old_channel.guild.id)
 
     if new_channel and isinstance(new_channel, discord.TextChannel) and new_channel.name in CHANNELS_TEMPLATE:
         logger.info(f"Updating #{new_channel.name} in {new_channel.guild.name}")
         guild_channels = channels.setdefault(new_channel.guild.id, {})
         guild_channels[new_channel.name] = new_channel.id
+        commands.index_guild(new_channel.guild.id, guild_channels)
+        persist_guild(new_channel.guild.id)
 
 
 def update_guild_role(
@@ -229,11 +319,13 @@ def update_guild_role(
         logger.info(f"Removing @{old_role.name} in {old_role.guild.name}")
         guild_roles = roles.setdefault(old_role.guild.id, {})
         guild_roles[old_role.name] = 0
+        persist_guild(old_role.guild.id)
 
     if new_role and new_role.name in ROLES_TEMPLATE:
         logger.info(f"Updating @{new_role.name} in {new_role.guild.name}")
         guild_roles = roles.setdefault(new_role.guild.id, {})
         guild_roles[new_role.name] = new_role.id
+        persist_guild(new_role.guild.id)
 
 
 @client.event
@@ -314,6 +406,9 @@ async def on_member_update(before: discord.Member, after: discord.Member):
                     insert_player_query = """INSERT INTO players (name, discord_id)
                                              VALUES (%s, %s) RETURNING player_id;"""
                     ans2, cols2 = query(connection, insert_player_query, after.name, after.id)
+                    connection.commit()
+                    record_write(connection)
+                    cache.invalidate('players')
                     await admin_message(guild, f'{after.name} Inserted into Database - {ans2[0][0]}')
         except Exception as err:
             logger.exception('DB error checking existing player: %s', err)
@@ -322,41 +417,70 @@ async def on_member_update(before: discord.Member, after: discord.Member):
 
 @client.event
 async def on_ready():
+    global metrics_server
+    metrics.loop_monitor.start()
+    if os.getenv('METRICS_PORT') and metrics_server is None:
+        try:
+            metrics_server = await metrics.start_http_server(int(os.getenv('METRICS_PORT')))
+        except Exception as err:
+            logger.warning('Unable to Start Metrics Endpoint: %s', err)
     await populate_dictionaries()
-    await reset_database_sequences()
-    logger.info('%s is now running!', client.user)
+    # sequence maintenance runs on whichever instance becomes leader, now or after a failover
+    await leader.elector.start()
+    notify.listener.start(asyncio.get_running_loop())
+    await jobs.scheduler.start()
+    warmup.start()
+    logger.info('%s is now running! (%s, %s guilds)', client.user, ownership, len(client.guilds))
     for guild in client.guilds:
         await admin_message(guild, 'Poker Bot Online - At Your Service!')
+    await resume_messages()
+
+
+async def resume_messages():
+    # messages the previous process left when it restarted, handled as if they had just arrived
+    resumed = 0
+    for _, channel_id, message_id in drain.load():
+        channel = client.get_channel(channel_id)
+        if channel is None:
+            continue
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.HTTPException as err:
+            logger.warning('Unable to Resume Message %s: %s', message_id, err)
+            continue
+        asyncio.create_task(on_message(message))
+        resumed += 1
+    if resumed:
+        logger.info('Resumed %s messages from before the restart', resumed)
+        metrics.increment('drain', amount=resumed, event='resumed')
 
 
 @client.event
 async def on_message(message: discord.Message):
-    global channels, roles
-    guild = message.guild
-    cid = message.channel.id
-
-    if cid == channels[guild.id]['email']:
-        await handler.handle_email(message)
-    elif cid == channels[guild.id]['email-database']:
-        await handler.handle_email_database(message)
-    elif message.author != client.user:
-        if cid == channels[guild.id]['admin']:
-            await handler.handle_admin(message)
-        elif cid == channels[guild.id]['manage']:
-            await handler.handle_manage(message)
-        elif cid == channels[guild.id]['database']:
-            await handler.handle_database(message)
-        elif cid == channels[guild.id]['commands']:
-            await handler.handle_commands(message)
-        elif cid in (channels[guild.id]['query'], channels[guild.id]['query-test']):
-            await handler.handle_query(message)
-        elif cid in (channels[guild.id]['ledgers'], channels[guild.id]['ledgers-test']):
-            await handler.handle_ledgers(message)
-        elif cid in (channels[guild.id]['graph'], channels[guild.id]['graph-test']):
-            await handler.handle_graph(message)
-        elif cid in (channels[guild.id]['game'], channels[guild.id]['game-test']):
-            await handler.handle_game(message)
+    if not ownership.owns(message.guild.id):
+        return
+    name = commands.route(message.guild.id, message.channel.id)
+    if name is None or (name not in commands.OWN_MESSAGES and message.author == client.user):
+        return
+    if not drain.inflight.admit(message):
+        return
+    # tasks copy the context, so reads made while handling this message know who wrote last
+    current_user.set(message.author.id)
+
+    handle = handlers[name]
+    replay = name in commands.REPLAYABLE
+    with drain.inflight.track(message, replay), metrics.timer('handler_seconds', handler=name):
+        await handle(message)
+    if profiler.active:
+        profiler.note_message()
 
 
 def run_discord_bot():
+    # side effects live here so importing this module (CLIs, benchmarks, !restart's exec) stays cheap
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    leader.elector.on_elected(reset_database_sequences)
+    if os.getenv('DUMP_CRON'):
+        jobs.every('dump_database', os.getenv('DUMP_CRON'))
+    build_handlers()
     client.run(os.getenv('DISCORD_BOT_TOKEN'), log_handler=None)
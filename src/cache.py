@@ -0,0 +1,122 @@
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from src import connect
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# a safety net for writes made outside the bot, the bot's own writes invalidate immediately
+TTL = float(os.getenv('CACHE_TTL', 600))
+MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+
+def _size(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(_size(key) + _size(item) for key, item in value.items())
+    return size
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ResultCache:
+    # Preset results keyed by call, valid until the TTL passes or a table they read is written
+    def __init__(self, ttl: float = TTL, max_bytes: int = MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.versions: dict[str, int] = {}
+        # key -> (expires, table versions when computed, value, size), least recently used first
+        self._entries: OrderedDict[Hashable, tuple[float, tuple[tuple[str, int], ...], Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key: Hashable):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def _gauges(self):
+        metrics.set_gauge('cache_bytes', self._bytes)
+        metrics.set_gauge('cache_entries', len(self._entries))
+
+    def invalidate(self, *tables: str):
+        with self._lock:
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._gauges()
+
+    def get_or_compute(self, key: Hashable, tables: tuple[str, ...], func: Callable[..., Any], *args, **kwargs):
+        preset = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, versions, value, _ = entry
+                if expires < time.monotonic():
+                    result = 'expired'
+                elif any(self.versions.get(table, 0) != version for table, version in versions):
+                    result = 'stale'
+                else:
+                    self._entries.move_to_end(key)
+                    metrics.increment('cache', preset=preset, result='hit')
+                    return value
+                self._drop(key)
+            else:
+                result = 'miss'
+            # read before computing, a write that lands meanwhile leaves the new entry already stale
+            versions = tuple((table, self.versions.get(table, 0)) for table in tables)
+        metrics.increment('cache', preset=preset, result=result)
+
+        # everyone is served this value, so it is read where every recent write is visible (src/connect.py)
+        token = connect.shared_read.set(True)
+        try:
+            value = func(*args, **kwargs)
+        finally:
+            connect.shared_read.reset(token)
+        size = _size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, versions, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                metrics.increment('cache_evictions')
+            self._gauges()
+        return value
+
+
+results = ResultCache()
+
+
+def cached(*tables: str):
+    # cache a preset's return value until one of the tables it reads changes
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, _freeze(args), _freeze(sorted(kwargs.items())))
+            return results.get_or_compute(key, tables, func, *args, **kwargs)
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def invalidate(*tables: str):
+    results.invalidate(*tables)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from src import metrics
+from src import render
+from src import warmup
+
+if TYPE_CHECKING:
+    import discord
+
+logger = logging.getLogger(__name__)
+
+REQUIRED = object()
+
+# channel name -> OnMessageHandler method, test channels share their handler
+ROUTES = {
+    'email': 'handle_email',
+    'email-database': 'handle_email_database',
+    'admin': 'handle_admin',
+    'manage': 'handle_manage',
+    'database': 'handle_database',
+    'commands': 'handle_commands',
+    'query': 'handle_query',
+    'query-test': 'handle_query',
+    'ledgers': 'handle_ledgers',
+    'ledgers-test': 'handle_ledgers',
+    'graph': 'handle_graph',
+    'graph-test': 'handle_graph',
+    'game': 'handle_game',
+    'game-test': 'handle_game',
+}
+# the bot's own posts are still handled here, everything else ignores them
+OWN_MESSAGES = {'email', 'email-database'}
+# these only read and post their answer last, so a restart can hand the message itself to the next process
+REPLAYABLE = {'query', 'query-test'}
+
+# guild_id -> {channel_id: channel name}, kept in step with common.channels by bot.py
+routes: dict[int, dict[int, str]] = {}
+
+
+def index_guild(guild_id: int, mapping: dict[str, int]):
+    routes[guild_id] = {cid: name for name, cid in mapping.items() if cid and name in ROUTES}
+
+
+def route(guild_id: int, channel_id: int) -> Optional[str]:
+    guild_routes = routes.get(guild_id)
+    return guild_routes.get(channel_id) if guild_routes else None
+
+
+class UsageError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Arg:
+    name: str
+    type: Callable[[str], Any] = str
+    default: Any = REQUIRED
+    variadic: bool = False
+
+
+@dataclass
+class Command:
+    name: str
+    channel: str
+    func: Callable[..., Awaitable[None]]
+    args: tuple[Arg, ...] = ()
+    usage: str = ''
+    # concurrent runs allowed, None for unlimited
+    limit: Optional[int] = None
+    exact: bool = False
+    # split --<profile> flags off before parsing and pass profile=
+    renders: bool = False
+    constants: dict[str, Any] = field(default_factory=dict)
+    semaphore: Optional[asyncio.Semaphore] = field(default=None, init=False)
+
+    def __post_init__(self):
+        if self.limit:
+            self.semaphore = asyncio.Semaphore(self.limit)
+
+    def parse(self, words: list[str]) -> dict[str, Any]:
+        parsed = dict(self.constants)
+        if self.renders:
+            parsed['profile'], words = render.split_profile(words)
+        position = 0
+        for arg in self.args:
+            if arg.variadic:
+                try:
+                    parsed[arg.name] = [arg.type(word) for word in words[position:]]
+                except ValueError:
+                    raise UsageError(self.usage)
+                position = len(words)
+                continue
+            if position < len(words):
+                try:
+                    parsed[arg.name] = arg.type(words[position])
+                    position += 1
+                    continue
+                except ValueError:
+                    # an optional argument that does not convert is treated as absent
+                    if arg.default is REQUIRED:
+                        raise UsageError(self.usage)
+            if arg.default is REQUIRED:
+                raise UsageError(self.usage)
+            parsed[arg.name] = arg.default
+        if self.exact and position < len(words):
+            raise UsageError(self.usage)
+        return parsed
+
+
+# channel -> command name -> Command
+registry: dict[str, dict[str, Command]] = {}
+# channel -> coroutine for '!<text>' that matches no command
+fallbacks: dict[str, Callable[..., Awaitable[None]]] = {}
+# channel -> reply for an unknown command, channels without one stay silent
+HELP: dict[str, str] = {}
+
+
+def command(channel: str, name: str, *args: Arg, usage: str = '', limit: Optional[int] = None,
+            exact: bool = False, renders: bool = False, **constants):
+    def decorator(func):
+        registry.setdefault(channel, {})[name] = Command(
+            name, channel, func, args, usage or f'!{name}', limit, exact, renders, constants
+        )
+        return func
+    return decorator
+
+
+def fallback(channel: str):
+    def decorator(func):
+        fallbacks[channel] = func
+        return func
+    return decorator
+
+
+def split(content: str) -> tuple[Optional[str], list[str]]:
+    txt = content.strip()
+    if not txt.startswith('!'):
+        return None, []
+    words = txt[1:].split()
+    if not words:
+        return '', []
+    return words[0].lower(), words[1:]
+
+
+async def dispatch(handler, channel: str, message: 'discord.Message'):
+    option, words = split(message.content)
+    if option is None:
+        return
+    found = registry.get(channel, {}).get(option)
+    if found is None:
+        if option and channel in fallbacks:
+            await fallbacks[channel](handler, message, option)
+        elif channel in HELP:
+            await message.channel.send(HELP[channel])
+        return
+
+    try:
+        arguments = found.parse(words)
+    except UsageError as err:
+        await message.channel.send(str(err))
+        return
+
+    started = time.perf_counter()
+    with metrics.timer('command_seconds', command=found.name):
+        if found.semaphore is None:
+            await found.func(handler, message, **arguments)
+        else:
+            if found.semaphore.locked():
+                metrics.increment('command_queued', command=found.name)
+            async with found.semaphore:
+                await found.func(handler, message, **arguments)
+    warmup.first_request(found.name, time.perf_counter() - started)
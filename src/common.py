@@ -1,4 +1,5 @@
 TABLES = {'players': 'player_id', 'users': 'player_id', 'ledgers': 'game_id', 'games': 'game_id'}
+PRIMARY_KEYS = {'players': ('player_id',), 'users': ('user_id',), 'ledgers': ('game_id', 'user_id'), 'games': ('game_id',)}
 
 CHANNELS_TEMPLATE = {
     'admin', 'commands', 'database', 'email', 'email-database', 'game', 'game-test', 'graph',
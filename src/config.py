@@ -1,10 +1,13 @@
 from configparser import ConfigParser
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
-def config(filename="db/database.ini", section="postgresql"):
+def config(filename="db/database.ini", section=None):
+    # DATABASE_SECTION points the bot, CLIs and benchmarks at another database.ini section
+    section = section or os.getenv('DATABASE_SECTION', 'postgresql')
     parser = ConfigParser()
     parser.read(filename)
     db = {}
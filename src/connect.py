@@ -1,16 +1,54 @@
+import contextlib
+import contextvars
 import logging
+import os
+import threading
+import time
+from typing import Optional
 
 import psycopg2
+import psycopg2.extensions
 
+from src import metrics
 from src.config import config
 
 logger = logging.getLogger(__name__)
 
+# seconds a failed replica is skipped before it is tried again
+REPLICA_RETRY = 30
+# how long a user's own writes force a replica freshness check
+READ_YOUR_WRITES = 300
+# idle sessions kept per target by pooled_read, each keeps its prepared statements
+POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 4))
 
-def connect():
+# discord id of the member whose message is being handled, set by bot.on_message
+current_user: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('current_user', default=None)
+# set while computing a result every member is then served, by cache.get_or_compute
+shared_read: contextvars.ContextVar[bool] = contextvars.ContextVar('shared_read', default=False)
+
+_replica_lock = threading.Lock()
+_replica_down_until = 0.0
+# user -> (monotonic time, primary WAL position after their last write)
+_writes: dict[int, tuple[float, Optional[str]]] = {}
+# the same for the last write this process made or was notified of, None once the replica has replayed it
+_last_write: Optional[tuple[float, Optional[str]]] = None
+_idle_lock = threading.Lock()
+_idle: dict[str, list['PreparedConnection']] = {'primary': [], 'replica': []}
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    # remembers which registered statements (src/statements.py) this session has prepared
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+        self.target = 'primary'
+
+
+def connect(**options):
+    # options are extra libpq connection parameters, e.g. keepalives
     try:
         params = config()
-        connection = psycopg2.connect(**params)
+        connection = psycopg2.connect(**params, **options, connection_factory=PreparedConnection)
         connection.autocommit = False
         return connection
     except Exception as err:
@@ -18,6 +56,137 @@ def connect():
         raise RuntimeError("Database connection failed") from err
 
 
+def replica_config() -> Optional[dict[str, str]]:
+    # DATABASE_REPLICA_SECTION, or '<primary section>_replica', when database.ini has it
+    primary = os.getenv('DATABASE_SECTION', 'postgresql')
+    section = os.getenv('DATABASE_REPLICA_SECTION', f'{primary}_replica')
+    try:
+        return config(section=section)
+    except Exception:
+        return None
+
+
+def record_write(connection):
+    # call after a write commits so the user's next reads, and the next cached results, wait for the replica
+    lsn = None
+    try:
+        ans, _ = query(connection, "SELECT pg_current_wal_lsn()::text;")
+        connection.commit()
+        lsn = ans[0][0]
+    except Exception as err:
+        logger.warning('Unable to Read WAL Position: %s', err)
+    note_write(lsn)
+    user = current_user.get()
+    if user is not None:
+        _writes[user] = _last_write
+
+
+def note_write(lsn: Optional[str] = None):
+    # a write another process made (lsn unknown) keeps shared reads on the primary for READ_YOUR_WRITES seconds
+    global _last_write
+    _last_write = (time.monotonic(), lsn)
+
+
+def _pending_write() -> Optional[tuple[float, Optional[str]]]:
+    # a result shared through the cache has to include everyone's writes, anything else only the user's own
+    if shared_read.get():
+        written = _last_write
+    else:
+        written = _writes.get(current_user.get())
+    if written is None:
+        return None
+    if time.monotonic() - written[0] > READ_YOUR_WRITES:
+        _replayed(written)
+        return None
+    return written
+
+
+def _replayed(written: tuple[float, Optional[str]]):
+    global _last_write
+    if shared_read.get():
+        if _last_write is written:
+            _last_write = None
+    else:
+        _writes.pop(current_user.get(), None)
+
+
+def _caught_up(connection, lsn: Optional[str]) -> bool:
+    if lsn is None:
+        return False
+    ans, _ = query(connection, "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, FALSE);", lsn)
+    connection.commit()
+    return bool(ans[0][0])
+
+
+def connect_read():
+    # Read-only work goes to the replica when one is configured and healthy, otherwise to the primary.
+    # A user who wrote recently reads from the replica only once it has replayed their write,
+    # and so does a result computed for the cache after any recent write.
+    global _replica_down_until
+    params = replica_config()
+    if params is None or time.monotonic() < _replica_down_until:
+        return connect()
+    try:
+        connection = psycopg2.connect(**params, connection_factory=PreparedConnection)
+        connection.autocommit = False
+        connection.target = 'replica'
+    except Exception as err:
+        with _replica_lock:
+            _replica_down_until = time.monotonic() + REPLICA_RETRY
+        logger.warning('Read Replica Unavailable, Using Primary for %ss: %s', REPLICA_RETRY, err)
+        metrics.increment('db_reads', target='fallback')
+        return connect()
+
+    pending = _pending_write()
+    if pending:
+        try:
+            fresh = _caught_up(connection, pending[1])
+        except Exception:
+            fresh = False
+        if not fresh:
+            connection.close()
+            metrics.increment('db_reads', target='primary_read_your_writes')
+            return connect()
+        _replayed(pending)
+    metrics.increment('db_reads', target='replica')
+    return connection
+
+
+def _pool_target() -> Optional[str]:
+    # None while a write the read must see may not have reached the replica, that needs connect_read's check
+    if replica_config() is None or time.monotonic() < _replica_down_until:
+        return 'primary'
+    return None if _pending_write() else 'replica'
+
+
+@contextlib.contextmanager
+def pooled_read():
+    # connect_read() for the preset queries, reusing idle sessions so their prepared statements are reused too
+    target = _pool_target()
+    connection = None
+    if target:
+        with _idle_lock:
+            if _idle[target]:
+                connection = _idle[target].pop()
+    if connection is None:
+        connection = connect_read()
+        metrics.increment('db_pool', result='open')
+    else:
+        metrics.increment('db_pool', result='reuse')
+        metrics.increment('db_reads', target=connection.target)
+    try:
+        with connection:
+            yield connection
+    finally:
+        with _idle_lock:
+            idle = _idle[connection.target]
+            keep = not connection.closed and len(idle) < POOL_SIZE
+            if keep:
+                idle.append(connection)
+        if not keep:
+            connection.close()
+
+
 def query(connection, command: str, *args):
     cursor = None
     try:
@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import discord
+
+from src import metrics
+from src import sharding
+
+logger = logging.getLogger(__name__)
+
+
+def resume_path(base: str, ownership: sharding.Ownership) -> str:
+    # one file per group of shards, a sibling process must not pick up (and then drop) another's messages
+    if not ownership.sharded:
+        return base
+    root, ext = os.path.splitext(base)
+    shards = '-'.join(map(str, ownership.shard_ids)) if ownership.shard_ids is not None else 'all'
+    return f'{root}.shards-{shards}{ext}'
+
+
+# where a restarting process leaves the messages it did not get to, read back once by the new process
+RESUME_PATH = resume_path(os.getenv('RESUME_PATH', 'logs/resume.json'), sharding.ownership)
+# seconds a restart waits for handlers already running
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', 120))
+# a resume file older than this is from a crash long ago, not from a restart
+RESUME_MAX_AGE = 600
+
+# guild id, channel id, message id
+MessageRef = tuple[int, int, int]
+
+
+def ref(message: discord.Message) -> MessageRef:
+    return message.guild.id, message.channel.id, message.id
+
+
+@dataclass
+class Flight:
+    message: MessageRef
+    task: asyncio.Task
+    # an unfinished handler is handled again from its message only while it has no side effects
+    replay: bool
+    # set once it has side effects, the job (kind, payload) that carries on its work in the next process
+    job: Optional[tuple[str, dict]] = None
+
+
+class Drain:
+    # Tracks the handlers in flight so a restart can stop taking new messages, let running ones finish
+    # and hand everything left over to the next process
+    def __init__(self):
+        self.draining = False
+        self.in_flight: dict[int, Flight] = {}
+        self.held: list[MessageRef] = []
+
+    def admit(self, message: discord.Message) -> bool:
+        # while draining a new message is kept for the next process instead of being handled
+        if not self.draining:
+            return True
+        self.held.append(ref(message))
+        metrics.increment('drain', event='held')
+        return False
+
+    @contextlib.contextmanager
+    def track(self, message: discord.Message, replay: bool = True):
+        self.in_flight[message.id] = Flight(ref(message), asyncio.current_task(), replay)
+        try:
+            yield
+        finally:
+            self.in_flight.pop(message.id, None)
+
+    def resume_as(self, message: discord.Message, kind: Optional[str], payload: Optional[dict] = None):
+        # called by a handler as it makes a side effect: if it does not finish it resumes as this job,
+        # or with kind None not at all. The payload is read at the restart, so later changes to it count.
+        flight = self.in_flight.get(message.id)
+        if flight is not None:
+            flight.replay = False
+            flight.job = (kind, payload or {}) if kind else None
+
+    async def drain(self, exclude: Optional[int] = None,
+                    timeout: float = DRAIN_TIMEOUT) -> tuple[list[MessageRef], list[tuple[str, dict]]]:
+        # Returns what is still unhandled after the deadline: messages to handle again (replayable handlers
+        # that did not finish, then held messages) and jobs for handlers that got past their first side effect
+        self.draining = True
+        running = [flight.task for message_id, flight in self.in_flight.items() if message_id != exclude]
+        logger.info('Draining %s running handlers (up to %ss)', len(running), timeout)
+        started = time.monotonic()
+        if running:
+            await asyncio.wait(running, timeout=timeout)
+        unfinished = [flight for message_id, flight in self.in_flight.items() if message_id != exclude]
+        # stopped here, so none of them moves past what is handed over while the process shuts down
+        for flight in unfinished:
+            flight.task.cancel()
+        await asyncio.gather(*(flight.task for flight in unfinished), return_exceptions=True)
+        messages = [flight.message for flight in unfinished if flight.replay]
+        resumed = [flight.job for flight in unfinished if flight.job]
+        dropped = len(unfinished) - len(messages) - len(resumed)
+        if dropped:
+            logger.warning('Dropping %s unfinished handlers that already posted or deleted messages', dropped)
+        metrics.observe('drain_seconds', time.monotonic() - started)
+        metrics.increment('drain', amount=len(messages), event='unfinished')
+        metrics.increment('drain', amount=len(resumed), event='queued')
+        metrics.increment('drain', amount=dropped, event='dropped')
+        return messages + self.held, resumed
+
+
+def save(messages: list[MessageRef], path: str = RESUME_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp = f'{path}.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'saved_at': time.time(), 'messages': messages}, f)
+    os.replace(temp, path)
+    logger.info('Saved %s messages for the next process', len(messages))
+
+
+def load(path: str = RESUME_PATH) -> list[MessageRef]:
+    # the file is consumed, a second restart does not replay it again
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        os.remove(path)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as err:
+        logger.warning('Unable to Read Resume File: %s', err)
+        return []
+    if time.time() - saved.get('saved_at', 0) > RESUME_MAX_AGE:
+        logger.info('Ignoring a resume file from %s', time.ctime(saved.get('saved_at', 0)))
+        return []
+    return [tuple(message) for message in saved.get('messages', [])]
+
+
+inflight = Drain()
@@ -6,24 +6,13 @@ import re
 import sys
 from typing import Optional
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
-
-from src.connect import connect, query
-
-COLORS = [
-    "Blue", "Red", "Lime", "Magenta", "Orange", "SaddleBrown", "Cyan",
-    "DarkViolet", "Gray", "Green", "Gold", "Salmon", 'SkyBlue', 'Orchid',
-]
-
-plt.rcParams['axes.prop_cycle'] = plt.cycler(color=COLORS)
+from src import query_presets
+from src import render
 
 logger = logging.getLogger(__name__)
 
 
-def graph_setup(csv1: bytes, csv2: bytes) -> Optional[io.BytesIO]:
+def graph_setup(csv1: bytes, csv2: bytes, profile: Optional[render.OutputProfile] = None) -> Optional[io.BytesIO]:
     logger.info('Preparing CSVs For Graphing')
     try:
         csv_text_1 = csv1.decode('utf-8')
@@ -49,12 +38,13 @@ def graph_setup(csv1: bytes, csv2: bytes) -> Optional[io.BytesIO]:
             ledger = csv_rows_2
 
     if log and ledger:
-        return graph(log, ledger)
+        return graph(log, ledger, profile)
     else:
         return None
 
 
-def graph(log: list[list[str]], ledger: list[list[str]]) -> io.BytesIO:
+def graph(log: list[list[str]], ledger: list[list[str]],
+          profile: Optional[render.OutputProfile] = None) -> io.BytesIO:
     players = {}  # userid: alias
     transactions = {}  # userid: [pot net, stack change, stack change bool, street action]
     stack_sizes = {}  # userid: [stack at start of hand #]
@@ -159,35 +149,24 @@ def graph(log: list[list[str]], ledger: list[list[str]]) -> io.BytesIO:
         nets[player] = [x1 - x2 for (x1, x2) in zip(stack_sizes[player], buy_ins[player])]
 
     # Graphing with matplotlib
+    profile = profile or render.DEFAULT_PROFILE
+    figsize = (10, 6)
+    dpi = profile.dpi(figsize, points=hand_number + 1, lines=len(nets))
     try:
-        fig, ax = plt.subplots(figsize=(10, 6), dpi=450)
-        for user, values in nets.items():
-            numeric_values = values
-            ax.plot(numeric_values, label=user)
-
-        ax.set_xlabel("Hand #")
-        ax.set_ylabel("Net $")
-        legend = ax.legend(title='PLAYERS', bbox_to_anchor=(1, 0.5), loc='center left', frameon=True)
-        legend.get_title().set_fontweight('bold')
-        legend.get_title().set_fontsize('large')
-        legend.get_frame().set_linewidth(1.5)
-        legend.get_frame().set_edgecolor('blue')
-
-        ax.xaxis.set_minor_locator(AutoMinorLocator(5))
-        ax.yaxis.set_minor_locator(AutoMinorLocator(5))
-        ax.set_xlim(left=0)
-        ax.set_ylim(bottom=ax.get_ylim()[0], top=ax.get_ylim()[1])
-        ax.axhline(0, color='black', linewidth=0.5, linestyle='--')
-        ax.axhspan(ax.get_ylim()[0], 0, color='red', alpha=0.03, zorder=0)
-        ax.grid(True, linestyle='-', color='gray', alpha=0.5)
-        ax.grid(True, which='minor', linestyle=':', linewidth=0.5, color='gray', alpha=0.6)
-
-        fig.tight_layout()
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png')
-        plt.close('all')
-        buffer.seek(0)
-        return buffer
+        with render.figure(render.NETS, figsize=figsize, dpi=dpi) as (fig, ax):
+            for user, values in nets.items():
+                numeric_values = values
+                ax.plot(numeric_values, label=user)
+
+            ax.set_xlabel("Hand #")
+            ax.set_ylabel("Net $")
+            render.NETS.legend(ax, title='PLAYERS', bbox_to_anchor=(1, 0.5), loc='center left', frameon=True)
+
+            ax.set_xlim(left=0)
+            render.NETS.shade_losses(ax)
+
+            fig.tight_layout()
+            return render.encode(fig, profile)
     except Exception as err:
         logger.exception('Error Plotting Graph')
 
@@ -197,37 +176,35 @@ def update_names(dictionaries: dict[str, list[int]], players_dict: dict[str, str
     # Otherwise, replacing it with the alias used during the game when they do not exist in the database
     logger.info('Updating Names for Graph')
     new_dictionaries = {}
-    with connect() as connection:
-        for player in dictionaries:
-            ans, cols = query(connection, """SELECT p.name FROM players p 
-                                              JOIN users u ON
-                                              u.player_id = p.player_id and u.user_id = %s;""", player)
-            if ans:
-                name = ans[0][0].title()
-                if new_dictionaries.get(name):
-                    # combining multiple instances of the same player across devices/user_ids
-                    new_dictionaries[name] = [sum(x) for x in zip(new_dictionaries[name], dictionaries[player])]
-                else:
-                    new_dictionaries[name] = dictionaries[player]
+    names = query_presets.user_names()
+    for player in dictionaries:
+        if player in names:
+            name = names[player].title()
+            if new_dictionaries.get(name):
+                # combining multiple instances of the same player across devices/user_ids
+                new_dictionaries[name] = [sum(x) for x in zip(new_dictionaries[name], dictionaries[player])]
             else:
-                new_dictionaries[players_dict[player]+'*'] = dictionaries[player]
+                new_dictionaries[name] = dictionaries[player]
+        else:
+            new_dictionaries[players_dict[player]+'*'] = dictionaries[player]
     return new_dictionaries
 
 
 def main():
     if len(sys.argv) <= 2:
         return
+    profile = render.get_profile(sys.argv[3] if len(sys.argv) > 3 else 'full')
     try:
         with open(sys.argv[1], "rb") as f1, open(sys.argv[2], "rb") as f2:
             csv1_bytes = f1.read()
             csv2_bytes = f2.read()
 
-        result = graph_setup(csv1_bytes, csv2_bytes)
+        result = graph_setup(csv1_bytes, csv2_bytes, profile)
         if result:
             base_names = tuple(os.path.splitext(os.path.basename(path))[0] for path in [sys.argv[1], sys.argv[2]])
             extracted = [name[idx+1:] if (idx:= name.find('_pg')) != -1 else name for name in base_names]
             unique_sorted = sorted(set(extracted))
-            output_filename = "graph_" + "_".join(unique_sorted) + ".png"
+            output_filename = "graph_" + "_".join(unique_sorted) + "." + profile.extension
             with open(output_filename, "wb") as out_file:
                 out_file.write(result.getvalue())
         else:
@@ -0,0 +1,35 @@
+import logging
+
+from src.connect import connect, query
+
+logger = logging.getLogger(__name__)
+
+
+def save(guild_id: int, channels: dict[str, int], roles: dict[str, int], shard_id: int = 0):
+    # Replaces the stored channel/role ids for one guild, any process can read them back
+    rows = [('channel', name, object_id) for name, object_id in channels.items() if object_id]
+    rows += [('role', name, object_id) for name, object_id in roles.items() if object_id]
+    try:
+        with connect() as connection:
+            query(connection, "DELETE FROM guild_state WHERE guild_id = %s;", guild_id)
+            if rows:
+                kinds, names, object_ids = (list(column) for column in zip(*rows))
+                query(connection,
+                      """INSERT INTO guild_state (guild_id, kind, name, object_id, shard_id)
+                         SELECT %s, kind, name, object_id, %s
+                         FROM unnest(%s::text[], %s::text[], %s::bigint[]) AS t(kind, name, object_id);""",
+                      guild_id, shard_id, kinds, names, object_ids)
+    except Exception as err:
+        logger.warning('Unable to Save Guild State for %s: %s', guild_id, err)
+
+
+def load(guild_ids: list[int]) -> tuple[dict[int, dict[str, int]], dict[int, dict[str, int]]]:
+    channels, roles = {}, {}
+    with connect() as connection:
+        rows, _ = query(connection,
+                        "SELECT guild_id, kind, name, object_id FROM guild_state WHERE guild_id = ANY(%s);",
+                        list(guild_ids))
+    for guild_id, kind, name, object_id in rows:
+        target = channels if kind == 'channel' else roles
+        target.setdefault(guild_id, {})[name] = object_id
+    return channels, roles
@@ -0,0 +1,283 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from src import leader
+from src import metrics
+from src import sharding
+from src.connect import connect, query
+
+logger = logging.getLogger(__name__)
+
+# seconds an idle worker waits before looking for due jobs again, enqueues in this process wake it at once
+POLL = float(os.getenv('JOB_POLL', 5))
+WORKERS = int(os.getenv('JOB_WORKERS', 2))
+# a claimed job not finished by then (its process died) is handed to another worker
+LEASE = 600
+# retry n waits RETRY_DELAY * 2 ** (n - 1) seconds
+RETRY_DELAY = 10
+
+HIGH, NORMAL, LOW = 10, 0, -10
+
+Handler = Callable[[dict], Awaitable[None]]
+handlers: dict[str, Handler] = {}
+
+
+def handler(kind: str):
+    def decorator(func: Handler):
+        handlers[kind] = func
+        return func
+    return decorator
+
+
+@dataclass
+class Job:
+    job_id: int
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+def _field(text: str, low: int, high: int) -> list[int]:
+    values = set()
+    for part in text.split(','):
+        spec, _, step = part.partition('/')
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(x) for x in spec.split('-'))
+        else:
+            start = end = int(spec)
+            if step:
+                end = high
+        if start < low or end > high or start > end:
+            raise ValueError(f'{part} is outside {low}-{high}')
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return sorted(values)
+
+
+class Cron:
+    # minute hour day-of-month month day-of-week, each *, n, a-b, a,b or with /step. Sunday is 0 (or 7).
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'{expression!r} needs 5 fields')
+        self.expression = expression
+        self.minutes = _field(fields[0], 0, 59)
+        self.hours = _field(fields[1], 0, 23)
+        self.days = set(_field(fields[2], 1, 31))
+        self.months = set(_field(fields[3], 1, 12))
+        self.weekdays = {day % 7 for day in _field(fields[4], 0, 7)}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, day: datetime.datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        # like cron, a restricted day of month and day of week match when either does
+        if self._any_day or self._any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment: datetime.datetime) -> datetime.datetime:
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += datetime.timedelta(days=1)
+        raise ValueError(f'{self.expression!r} never runs')
+
+
+@dataclass
+class Periodic:
+    kind: str
+    cron: Cron
+    payload: dict = field(default_factory=dict)
+    priority: int = LOW
+
+
+periodic: list[Periodic] = []
+
+
+def every(kind: str, expression: str, payload: Optional[dict] = None, priority: int = LOW):
+    # the leader enqueues kind at each time the cron expression matches (local time)
+    periodic.append(Periodic(kind, Cron(expression), payload or {}, priority))
+
+
+def _insert(kind: str, payload: dict, priority: int, dedup: Optional[str], guild_id: Optional[int],
+            delay: float, max_attempts: int) -> Optional[int]:
+    with connect() as connection:
+        ans, _ = query(connection,
+                       """INSERT INTO jobs (kind, payload, priority, dedup_key, guild_id, run_at, max_attempts)
+                          VALUES (%s, %s::jsonb, %s, %s, %s, now() + %s * INTERVAL '1 second', %s)
+                          ON CONFLICT (dedup_key) WHERE status = 'pending' DO NOTHING
+                          RETURNING job_id;""",
+                       kind, json.dumps(payload), priority, dedup, guild_id, delay, max_attempts)
+    return ans[0][0] if ans else None
+
+
+async def enqueue(kind: str, payload: Optional[dict] = None, *, priority: int = NORMAL, dedup: Optional[str] = None,
+                  guild_id: Optional[int] = None, delay: float = 0, max_attempts: int = 3,
+                  fallback: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[int]:
+    # Returns the new job id, or None when an identical job (same dedup key) is already pending.
+    # Jobs with a guild_id run in the process that owns the guild's shard, the rest on the leader.
+    # If the job cannot be stored, fallback (when given) runs inline instead.
+    try:
+        job_id = await asyncio.to_thread(_insert, kind, payload or {}, priority, dedup, guild_id, delay,
+                                         max_attempts)
+    except Exception as err:
+        if fallback is None:
+            raise
+        logger.warning('Unable to Queue %s, running it now: %s', kind, err)
+        await fallback()
+        return None
+    metrics.increment('jobs', kind=kind, result='queued' if job_id else 'deduplicated')
+    scheduler.wake()
+    return job_id
+
+
+class Scheduler:
+    def __init__(self, workers: int = WORKERS, poll: float = POLL):
+        self.workers = workers
+        self.poll = poll
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if periodic:
+            self._tasks.append(asyncio.create_task(self._cron()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _claim(self) -> Optional[Job]:
+        ownership = sharding.ownership
+        owned = ownership.shard_ids if ownership.sharded and ownership.shard_ids is not None else []
+        with connect() as connection:
+            ans, _ = query(connection,
+                           """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                  locked_until = now() + %s * INTERVAL '1 second'
+                              WHERE job_id = (
+                                  SELECT job_id FROM jobs
+                                  WHERE (status = 'pending' OR (status = 'running' AND locked_until < now()))
+                                    AND run_at <= now()
+                                    AND kind = ANY(%s)
+                                    AND CASE WHEN guild_id IS NULL THEN %s
+                                             ELSE %s OR mod(guild_id >> 22, %s) = ANY(%s::int[]) END
+                                  ORDER BY priority DESC, run_at, job_id
+                                  LIMIT 1
+                                  FOR UPDATE SKIP LOCKED)
+                              RETURNING job_id, kind, payload, attempts, max_attempts;""",
+                           LEASE, list(handlers), leader.elector.leader, not owned,
+                           ownership.shard_count or 1, owned)
+        return Job(*ans[0]) if ans else None
+
+    @staticmethod
+    def _finish(job: Job, error: Optional[str] = None):
+        with connect() as connection:
+            if error is None:
+                query(connection, "UPDATE jobs SET status = 'done', finished_at = now() WHERE job_id = %s;",
+                      job.job_id)
+            elif job.attempts < job.max_attempts:
+                query(connection,
+                      """UPDATE jobs SET status = 'pending', last_error = %s,
+                             run_at = now() + %s * INTERVAL '1 second'
+                         WHERE job_id = %s;""",
+                      error, RETRY_DELAY * 2 ** (job.attempts - 1), job.job_id)
+            else:
+                query(connection,
+                      "UPDATE jobs SET status = 'failed', last_error = %s, finished_at = now() WHERE job_id = %s;",
+                      error, job.job_id)
+
+    @staticmethod
+    def _release(job: Job):
+        # stopped mid-job, it is not the job's fault so the attempt does not count
+        with connect() as connection:
+            query(connection,
+                  "UPDATE jobs SET status = 'pending', attempts = attempts - 1 WHERE job_id = %s;", job.job_id)
+
+    async def _run(self, job: Job):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(handlers[job.kind](job.payload), LEASE)
+        except asyncio.CancelledError:
+            try:
+                self._release(job)
+            except Exception as err:
+                logger.warning('Unable to Release Job %s: %s', job.job_id, err)
+            raise
+        except Exception as err:
+            logger.exception('Job %s (%s) Failed, attempt %s of %s: %s',
+                             job.job_id, job.kind, job.attempts, job.max_attempts, err)
+            await asyncio.to_thread(self._finish, job, repr(err))
+            result = 'retried' if job.attempts < job.max_attempts else 'failed'
+        else:
+            await asyncio.to_thread(self._finish, job)
+            result = 'done'
+        metrics.observe('job_seconds', time.monotonic() - started, kind=job.kind)
+        metrics.increment('jobs', kind=job.kind, result=result)
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except Exception as err:
+                logger.warning('Unable to Claim Jobs: %s', err)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.exception('Unable to Record Job %s: %s', job.job_id, err)
+
+    async def _cron(self):
+        upcoming = {index: item.cron.next_after(datetime.datetime.now()) for index, item in enumerate(periodic)}
+        while True:
+            await asyncio.sleep(min(30.0, max(1.0, (min(upcoming.values()) - datetime.datetime.now()).total_seconds())))
+            now = datetime.datetime.now()
+            for index, item in enumerate(periodic):
+                if upcoming[index] > now:
+                    continue
+                if leader.elector.leader:
+                    # the slot in the key only stops a second copy while the first is still pending. Once it
+                    # has run, a leader that took over within the same minute could queue the slot again.
+                    try:
+                        await enqueue(item.kind, item.payload, priority=item.priority,
+                                      dedup=f'{item.kind}@{upcoming[index]:%Y-%m-%dT%H:%M}')
+                    except Exception as err:
+                        logger.warning('Unable to Queue Periodic %s: %s', item.kind, err)
+                upcoming[index] = item.cron.next_after(now)
+
+
+scheduler = Scheduler()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from src import metrics
+from src.connect import connect, query
+
+logger = logging.getLogger(__name__)
+
+# any bigint shared by every instance of the bot on one database
+LOCK_KEY = int(os.getenv('LEADER_LOCK_KEY', 0x706f6b6572))
+# seconds between a follower's attempts to take the lock, and between a leader's session checks
+INTERVAL = float(os.getenv('LEADER_INTERVAL', 2))
+# libpq's keepalives only notice a dead server. The server-side settings make Postgres end the session,
+# and free the lock, about 5 + 2 * 2 seconds after a leader's host vanishes without closing its socket.
+KEEPALIVE = {'keepalives': 1, 'keepalives_idle': 5, 'keepalives_interval': 2, 'keepalives_count': 2,
+             'options': '-c tcp_keepalives_idle=5 -c tcp_keepalives_interval=2 -c tcp_keepalives_count=2'}
+# a leader that stops checking in (a stalled process on a live host) is dropped after this many seconds
+IDLE_TIMEOUT = max(10, int(INTERVAL * 5))
+
+
+class Elector:
+    # The instance holding a session-level advisory lock is the leader and does the once-per-deployment work
+    # (dumps, sequence maintenance, scheduled jobs). The lock goes with the session, so a leader that dies or
+    # loses the database frees it and a follower takes over on its next attempt.
+    def __init__(self, key: int = LOCK_KEY, interval: float = INTERVAL):
+        self.key = key
+        self.interval = interval
+        self.leader = False
+        self.connection = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: list[Callable[[], Awaitable[None]]] = []
+
+    def on_elected(self, func: Callable[[], Awaitable[None]]):
+        self._on_elected.append(func)
+        return func
+
+    def _close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+
+    def step(self) -> bool:
+        # one round: a leader checks its session is still alive, a follower tries to take the lock
+        try:
+            if self.connection is None:
+                self.connection = connect(**KEEPALIVE)
+                self.connection.autocommit = True
+                try:
+                    query(self.connection, f"SET idle_session_timeout = '{IDLE_TIMEOUT}s';")
+                except Exception as err:
+                    # before Postgres 14, only the keepalives apply
+                    logger.info('idle_session_timeout Unavailable: %s', err)
+            if self.leader:
+                query(self.connection, "SELECT 1;")
+            else:
+                ans, _ = query(self.connection, "SELECT pg_try_advisory_lock(%s);", self.key)
+                self.leader = bool(ans[0][0])
+        except Exception as err:
+            if self.leader:
+                logger.warning('Lost Leadership: %s', err)
+            self.leader = False
+            self._close()
+        return self.leader
+
+    async def _elect(self):
+        was_leader = self.leader
+        await asyncio.to_thread(self.step)
+        metrics.set_gauge('leader', int(self.leader))
+        if self.leader == was_leader:
+            return
+        metrics.increment('leader_changes', role='leader' if self.leader else 'follower')
+        logger.info('Now the %s (lock %s)', 'leader' if self.leader else 'follower', self.key)
+        if self.leader:
+            for func in self._on_elected:
+                try:
+                    await func()
+                except Exception as err:
+                    logger.exception('Leader Startup Work Failed: %s', err)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval if self.connection is not None else self.interval * 5)
+            await self._elect()
+
+    async def start(self):
+        # the first round finishes before this returns, so callers know the role straight away
+        if self._task is not None:
+            return
+        await self._elect()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.leader = False
+        self._close()
+
+
+elector = Elector()
+
+
+def main():
+    # run two of these against one database, stop the leader and watch the other take over
+    parser = argparse.ArgumentParser(description='Take part in leader election and print role changes.')
+    parser.add_argument('--section', help='database.ini section (default: DATABASE_SECTION or postgresql)')
+    parser.add_argument('--key', type=int, default=LOCK_KEY)
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    parser.add_argument('--seconds', type=float, help='step down and exit after this long')
+    args = parser.parse_args()
+    if args.section:
+        os.environ['DATABASE_SECTION'] = args.section
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+
+    async def run():
+        candidate = Elector(args.key, args.interval)
+        started = time.monotonic()
+
+        @candidate.on_elected
+        async def elected():
+            print(f'pid {os.getpid()} elected after {time.monotonic() - started:.1f}s', flush=True)
+
+        await candidate.start()
+        if not candidate.leader:
+            print(f'pid {os.getpid()} following', flush=True)
+        try:
+            if args.seconds:
+                await asyncio.sleep(args.seconds)
+            else:
+                await asyncio.Event().wait()
+        finally:
+            candidate.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import csv
+import io
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LEDGER_HEADER = 'player_nickname'
+MONEY_COLUMNS = ('buy_in', 'buy_out', 'stack', 'net')
+
+
+class AmbiguousUnits(ValueError):
+    pass
+
+
+def is_ledger_csv(data: bytes) -> bool:
+    try:
+        first_line = data.decode('utf-8-sig').partition('\n')[0]
+    except UnicodeDecodeError:
+        return False
+    return first_line.split(',')[0].strip() == LEDGER_HEADER
+
+
+def in_dollars(rows: list[dict[str, str]]) -> bool:
+    # PokerNow's cents export has no decimal points, its dollar export shows them on every amount (a zero
+    # reads the same either way). The size of the amounts says nothing, micro stakes in cents look like
+    # dollars, so a mix is refused rather than guessed.
+    amounts = [value for row in rows for column in MONEY_COLUMNS
+               if (value := (row.get(column) or '').strip()) and float(value) != 0]
+    decimals = sum('.' in amount for amount in amounts)
+    if decimals and decimals != len(amounts):
+        raise AmbiguousUnits(f'{decimals} of {len(amounts)} amounts have a decimal point, '
+                             'so the export is neither in cents nor in dollars')
+    return bool(decimals)
+
+
+def parse_ledger_csv(data: bytes) -> pd.DataFrame:
+    # PokerNow ledger export: player_nickname, player_id, session_start_at, session_end_at, buy_in, buy_out, stack, net
+    # A player who leaves and rejoins has one row per session, their nets are combined.
+    # Raises AmbiguousUnits when the amounts do not tell cents from dollars, anything else malformed is empty.
+    try:
+        rows = list(csv.DictReader(io.StringIO(data.decode('utf-8-sig'))))
+        dollars = in_dollars(rows)
+        aliases = {}
+        nets = {}
+        for row in rows:
+            user_id = row['player_id'].strip()
+            net = round(float(row['net']) * 100) if dollars else int(row['net'])
+            aliases.setdefault(user_id, row['player_nickname'].strip())
+            nets[user_id] = nets.get(user_id, 0) + net
+    except AmbiguousUnits:
+        raise
+    except Exception as err:
+        logger.exception('Unable to Parse Ledger CSV: %s', err)
+        return pd.DataFrame()
+
+    logger.info('Parsed Ledger CSV: %s player(s), in %s', len(nets), 'dollars' if dollars else 'cents')
+    return pd.DataFrame({
+        'alias': [aliases[user_id] for user_id in nets],
+        'user_id': list(nets),
+        'net': list(nets.values()),
+    })
@@ -1,16 +1,22 @@
 import argparse
+import json
 import logging
 import mimetypes
 import os
+import re
 import threading
 import time
+from typing import Optional
 
 from dotenv import load_dotenv
 from google import genai
 import pandas as pd
 from rapidfuzz import fuzz, process
 
-from src.connect import connect, query
+from src import cache
+from src import ledger_images
+from src import metrics
+from src.connect import connect, query, record_write
 
 load_dotenv()
 
@@ -19,20 +25,179 @@ logger = logging.getLogger(__name__)
 done = False
 
 
-def gemini(images: list[tuple[bytes, str]], game_id=None) -> pd.DataFrame:
+USER_ID_RE = re.compile(r'^[A-Za-z0-9_-]{10}$')
+MAX_ATTEMPTS = 3
+MODEL = 'gemini-2.0-flash'
+
+ROW_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'player': {'type': 'STRING'},
+        'id': {'type': 'STRING'},
+        'buy_in': {'type': 'NUMBER'},
+        'buy_out': {'type': 'NUMBER'},
+        'stack': {'type': 'NUMBER'},
+        'net': {'type': 'NUMBER'},
+    },
+    'required': ['player', 'id', 'buy_in', 'buy_out', 'stack', 'net'],
+}
+LEDGER_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'photo': {'type': 'INTEGER'},
+            'visible_rows': {'type': 'INTEGER'},
+            'rows': {'type': 'ARRAY', 'items': ROW_SCHEMA},
+        },
+        'required': ['photo', 'visible_rows', 'rows'],
+    },
+}
+
+
+def _client() -> Optional[genai.Client]:
+    if os.getenv('GEMINI_API_KEY') is None:
+        logger.error('Error: GEMINI_API_KEY environment variable not set.')
+    # GEMINI_BASE_URL points the client at a local stand-in for load testing
+    base_url = os.getenv('GEMINI_BASE_URL')
+    http_options = genai.types.HttpOptions(base_url=base_url) if base_url else None
+    try:
+        return genai.Client(http_options=http_options)
+    except Exception as e:
+        logger.exception("Failed to create GenAI client. Ensure GEMINI_API_KEY is set. Error: %s", e)
+        return None
+
+
+def gemini(images: list[tuple[bytes, str]], game_id=None, structured=True) -> pd.DataFrame:
     prefix = f'{game_id}: ' if game_id is not None else ''
+    client = _client()
+    if client is None:
+        return pd.DataFrame()
+    with metrics.timer('ocr_preprocess_seconds'):
+        images = ledger_images.preprocess(images)
+    with metrics.timer('ocr_seconds', mode='structured' if structured else 'table'):
+        if structured:
+            return _gemini_structured(client, images, prefix)
+        return _gemini_table(client, images, prefix)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _malformed(entry) -> Optional[str]:
+    # an entry off the schema, none of its rows can be used
+    if entry is None:
+        return 'photo missing from response'
+    if not isinstance(entry, dict):
+        return 'photo is not an object'
+    if not isinstance(entry.get('rows'), list):
+        return 'rows missing'
+    if type(entry.get('visible_rows')) is not int:
+        return 'visible_rows missing'
+    for number, row in enumerate(entry['rows'], start=1):
+        if not isinstance(row, dict):
+            return f'row {number} is not an object'
+        for name in ('player', 'id'):
+            if not isinstance(row.get(name), str):
+                return f'row {number} has no {name}'
+        for name in ('buy_in', 'buy_out', 'stack', 'net'):
+            if not _is_number(row.get(name)):
+                return f'row {number} has no {name} amount'
+    return None
+
+
+def validate_photo(entry: Optional[dict]) -> list[str]:
+    malformed = _malformed(entry)
+    if malformed:
+        return [malformed]
+    errors = []
+    rows = entry['rows']
+    if len(rows) != entry['visible_rows']:
+        errors.append(f"{len(rows)} of {entry['visible_rows']} rows read")
+    for row in rows:
+        if not USER_ID_RE.fullmatch(row['id'].strip()):
+            errors.append(f"malformed id {row['id']!r}")
+        elif abs(row['buy_out'] + row['stack'] - row['buy_in'] - row['net']) > 0.005:
+            errors.append(f"net does not add up for {row['id']}")
+    return errors
+
+
+def _ocr_photos(client: genai.Client, images: list[tuple[bytes, str]], prefix: str) -> dict[int, dict]:
+    # returns the model's entry for each photo, keyed by position in images
+    prompt = ('Each photo shows part of a single PokerNow ledger, split across the photos in order. '
+              'For every photo report its number, how many player rows are visible in it, and every visible row: '
+              'player is the string before the @ sign, id is the string after the @ sign, '
+              'buy_in, buy_out, stack and net are the dollar amounts shown, with losses negative.')
+    contents = [genai.types.Part.from_text(text=prompt)]
+    for number, (img_bytes, mime_type) in enumerate(images, start=1):
+        contents.append(genai.types.Part.from_text(text=f'Photo {number}:'))
+        contents.append(genai.types.Part.from_bytes(data=img_bytes, mime_type=mime_type))
+    config = genai.types.GenerateContentConfig(response_mime_type='application/json', response_schema=LEDGER_SCHEMA)
     try:
-        GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+        logger.info('%sSending %s image(s) for structured output.', prefix, len(images))
+        response = client.models.generate_content(model=MODEL, contents=contents, config=config)
+        entries = json.loads(response.text)
+        if not isinstance(entries, list):
+            raise ValueError(f'expected a list of photos, got {type(entries).__name__}')
+        # the rest of an entry is checked by validate_photo, which has the photo sent again
+        return {entry['photo'] - 1: entry for entry in entries
+                if isinstance(entry, dict) and type(entry.get('photo')) is int and 0 < entry['photo'] <= len(images)}
+    except Exception as e:
+        logger.exception('%sError generating Gemini response. %s', prefix, e)
+        return {}
 
-        if GEMINI_API_KEY is None:
-            logger.exception('Error: GOOGLE_API_KEY environment variable not set.')
 
-        try:
-            client = genai.Client()
-        except Exception as e:
-            logger.exception("Failed to create GenAI client. Ensure GEMINI_API_KEY is set. Error: %s", e)
-            return pd.DataFrame()
+def _ledger_frame(entries: list[dict]) -> pd.DataFrame:
+    rows = [row for entry in entries for row in entry['rows']]
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame({
+        'alias': [row['player'] for row in rows],
+        'user_id': [row['id'] for row in rows],
+        'net': [round(row['net'] * 100) for row in rows],
+    })
+    return deduplicate_rows(df)
+
+
+def _gemini_structured(client: genai.Client, images: list[tuple[bytes, str]], prefix: str) -> pd.DataFrame:
+    # Each photo is validated on its own, only the photos that fail are sent again.
+    # Once every photo passes, nets that do not balance have the whole ledger sent again.
+    best: dict[int, tuple[list[str], dict]] = {}
+    pending = list(range(len(images)))
+    df = pd.DataFrame()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        results = _ocr_photos(client, [images[i] for i in pending], prefix)
+        for position, index in enumerate(pending):
+            entry = results.get(position)
+            errors = validate_photo(entry)
+            if errors:
+                logger.warning('%sPhoto %s failed validation (attempt %s): %s',
+                               prefix, index + 1, attempt, '; '.join(errors))
+            # a retry only replaces a reading with more errors, a tie takes the newer one
+            if _malformed(entry) is None and (index not in best or len(errors) <= len(best[index][0])):
+                best[index] = (errors, entry)
+        df = _ledger_frame([best[index][1] for index in sorted(best)])
+        pending = [index for index in range(len(images)) if index not in best or best[index][0]]
+        if pending:
+            continue
+        if df.empty or df['net'].sum() == 0:
+            break
+        logger.warning('%sLedger Nets Do Not Balance (attempt %s): %s', prefix, attempt, df['net'].sum())
+        pending = list(range(len(images)))
+    else:
+        failed = [index + 1 for index in range(len(images)) if index not in best or best[index][0]]
+        if failed:
+            logger.warning('%sKeeping unvalidated rows from photo(s): %s', prefix, failed)
+        else:
+            logger.warning('%sKeeping a ledger whose nets do not balance: %s', prefix, df['net'].sum())
 
+    logger.info('%sResponse Completed', prefix)
+    return df
+
+
+def _gemini_table(client: genai.Client, images: list[tuple[bytes, str]], prefix: str) -> pd.DataFrame:
+    try:
         image_parts = []
         for img_bytes, mime_type in images:
             image_parts.append(
@@ -52,7 +217,7 @@ def gemini(images: list[tuple[bytes, str]], game_id=None) -> pd.DataFrame:
         ]
         logger.info('%sSending %s image(s) with default prompt.', prefix, len(images))
         response = client.models.generate_content(
-            model='gemini-2.0-flash',
+            model=MODEL,
             contents=contents
         )
     except Exception as e:
@@ -72,13 +237,29 @@ def gemini(images: list[tuple[bytes, str]], game_id=None) -> pd.DataFrame:
         df = df.drop(columns=['BUY-IN']).drop(columns=['BUY-OUT']).drop(columns=['STACK'])
         df = df.rename(columns={'PLAYER': 'alias'}).rename(columns={'ID': 'user_id'}).rename(columns={'NET': 'net'})
         df['net'] = (df['net'].astype(float) * 100).round().astype(int)
-        return df
+        return deduplicate_rows(df)
     except Exception as e:
         logger.exception('Error formatting response from Gemini: %s', e)
         logger.info('Gemini Response: %s', df2)
         return pd.DataFrame()
 
 
+def deduplicate_rows(df: pd.DataFrame) -> pd.DataFrame:
+    # Split screenshots overlap, so the same ledger row can be read more than once.
+    # A user_id appears once per ledger; a repeated alias with the same net is the same row with a misread id
+    if df.empty:
+        return df
+    before = len(df)
+    df['user_id'] = df['user_id'].str.strip()
+    df['alias'] = df['alias'].str.strip()
+    df = df.drop_duplicates(subset=['user_id'], keep='first')
+    alias_key = df['alias'].str.casefold()
+    df = df[~pd.DataFrame({'alias': alias_key, 'net': df['net']}).duplicated(keep='first')]
+    if len(df) != before:
+        logger.info('Removed %s Duplicated Ledger Row(s)', before - len(df))
+    return df.reset_index(drop=True)
+
+
 def format_ledgers(data: list[pd.DataFrame]) -> list[pd.DataFrame]:
     try:
         user_query = """SELECT user_id FROM users;"""
@@ -98,6 +279,9 @@ def format_ledgers(data: list[pd.DataFrame]) -> list[pd.DataFrame]:
                         df.at[i, 'user_id'] = match[0]
         except Exception as e:
             logger.warning('Warning, Fuzzy Pattern Matching Failed: %s', e)
+        else:
+            # fuzzy matching can map two misread copies of a row onto the same user_id
+            data = [deduplicate_rows(df) for df in data]
 
     return data
 
@@ -136,6 +320,8 @@ def insert_ledgers(results: list[pd.DataFrame], game_id: int) -> tuple[int, list
                         logger.info('Unable to Insert at %s', game_id)
                         errors.append(f'Unable to Insert at game_id: {game_id}')
                     game_id += 1
+            record_write(connection)
+            cache.invalidate('games', 'ledgers', 'players', 'users')
         except Exception as e:
             logger.exception('Unexpected Error While Attempting to Insert Ledgers: %s', e)
             errors.append(f'No Ledgers Inserted. Unexpected Error at game_id: {game_id}')
@@ -0,0 +1,68 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageChops, ImageOps
+
+logger = logging.getLogger(__name__)
+
+TARGET_WIDTH = 1280
+# pixels within this distance of the background color are treated as background when cropping
+BACKGROUND_TOLERANCE = 24
+
+_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='ledger-image')
+
+
+def _crop_to_ledger(image: Image.Image) -> Image.Image:
+    # the ledger is the content inside the uniform border of the screenshot (page background, phone bars)
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background).point(lambda p: 255 if p > BACKGROUND_TOLERANCE else 0)
+    bbox = diff.getbbox()
+    return image.crop(bbox) if bbox else image
+
+
+def content_hash(image: Image.Image) -> bytes:
+    # screenshots of different ledgers share one layout and differ only in a few glyphs,
+    # so only identical pixels count as a duplicate, overlapping screenshots are left to row dedup
+    return hashlib.sha256(f'{image.mode} {image.size}'.encode() + image.tobytes()).digest()
+
+
+def _prepare(image: tuple[bytes, str]) -> tuple[bytes, str, Optional[bytes]]:
+    img_bytes, mime_type = image
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as original:
+            prepared = ImageOps.exif_transpose(original).convert('L')
+        prepared = _crop_to_ledger(prepared)
+        if prepared.width > TARGET_WIDTH:
+            height = round(prepared.height * TARGET_WIDTH / prepared.width)
+            prepared = prepared.resize((TARGET_WIDTH, height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        prepared.save(buffer, format='PNG')
+        return buffer.getvalue(), 'image/png', content_hash(prepared)
+    except Exception as err:
+        # an image that cannot be decoded locally is still sent untouched, the model may cope with it
+        logger.warning('Unable to Preprocess Ledger Image: %s', err)
+        return img_bytes, mime_type, None
+
+
+def preprocess(images: list[tuple[bytes, str]]) -> list[tuple[bytes, str]]:
+    if not images:
+        return []
+    prepared = list(_pool.map(_prepare, images))
+
+    kept = []
+    hashes = set()
+    for img_bytes, mime_type, image_hash in prepared:
+        if image_hash is not None and image_hash in hashes:
+            logger.info('Skipping Duplicate Ledger Image')
+            continue
+        if image_hash is not None:
+            hashes.add(image_hash)
+        kept.append((img_bytes, mime_type))
+
+    logger.info('Preprocessed %s image(s) -> %s, %s KiB -> %s KiB', len(images), len(kept),
+                sum(len(b) for b, _ in images) // 1024, sum(len(b) for b, _ in kept) // 1024)
+    return kept
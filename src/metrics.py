@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_SAMPLES = 1000
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        # recent observations for percentiles, the buckets keep the all-time distribution
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self.gauges[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.gauges.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+observe = registry.observe
+set_gauge = registry.set_gauge
+increment = registry.increment
+
+
+@contextmanager
+def timer(name: str, **labels: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+class LoopLagMonitor:
+    # How late a short sleep wakes up is how long something else held the event loop
+    def __init__(self, interval: float = 0.05, history: int = 10_000):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.samples.append(lag)
+            registry.observe('event_loop_lag_seconds', lag)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def _label_text(labels: Labels) -> str:
+    return ' '.join(v for _, v in labels)
+
+
+def summary(limit: int = 25) -> str:
+    with registry._lock:
+        rows = sorted(registry.histograms.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        lines = [f"{'metric':<38} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7}"]
+        for (name, labels), histogram in rows:
+            label = f"{name.removesuffix('_seconds')} {_label_text(labels)}".strip()
+            lines.append(f'{label[:38]:<38} {histogram.count:>6} {histogram.percentile(50) * 1000:>6.0f}ms '
+                         f'{histogram.percentile(95) * 1000:>5.0f}ms {histogram.percentile(99) * 1000:>5.0f}ms')
+        for (name, labels), value in sorted(registry.gauges.items()):
+            lines.append(f'{f"{name} {_label_text(labels)}".strip()[:38]:<38} {value:>6.1f}')
+        for (name, labels), value in sorted(registry.counters.items()):
+            lines.append(f'{f"{name} {_label_text(labels)}".strip()[:38]:<38} {value:>6.0f}')
+    return '\n'.join(lines)
+
+
+def _prometheus_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def prometheus() -> str:
+    lines = []
+    with registry._lock:
+        for (name, labels), histogram in sorted(registry.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _prometheus_labels(labels, 'le="' + le + '"')
+                lines.append(f'pokerbot_{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'pokerbot_{name}_sum{_prometheus_labels(labels)} {histogram.total}')
+            lines.append(f'pokerbot_{name}_count{_prometheus_labels(labels)} {histogram.count}')
+        for (name, labels), value in sorted(registry.gauges.items()):
+            lines.append(f'pokerbot_{name}{_prometheus_labels(labels)} {value}')
+        for (name, labels), value in sorted(registry.counters.items()):
+            lines.append(f'pokerbot_{name}_total{_prometheus_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+async def start_http_server(port: int, host: str = '127.0.0.1'):
+    # optional local scrape endpoint, aiohttp already ships with discord.py
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(text=prometheus(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info('Metrics endpoint listening on http://%s:%s/metrics', host, port)
+    return runner
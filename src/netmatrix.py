@@ -0,0 +1,149 @@
+import logging
+import threading
+from dataclasses import dataclass, replace
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src import cache
+from src import metrics
+from src.connect import connect, query
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('games', 'ledgers', 'users', 'players')
+
+# one row per player and game, a player with several pokernow ids in one game gets their sum
+_CELLS = """
+    SELECT p.player_id, l.game_id, COALESCE(SUM(l.net), 0)::bigint, COUNT(*)
+    FROM ledgers l
+    JOIN users u ON l.user_id = u.user_id
+    JOIN players p ON u.player_id = p.player_id
+    {where}
+    GROUP BY p.player_id, l.game_id;
+    """
+CELLS = _CELLS.format(where='')
+GAME_CELLS = _CELLS.format(where='WHERE l.game_id = ANY(%s)')
+NAMES = """SELECT player_id, name FROM players;"""
+# the same sums are kept in memory, equal sums mean nothing the matrix shows has changed. The net sums
+# weighted by player (and by player and game) catch nets moved between players, as a corrected misread does.
+FINGERPRINT = """
+    SELECT COUNT(*), COALESCE(SUM(l.net), 0)::bigint, COALESCE(SUM(l.game_id::bigint * p.player_id), 0)::bigint,
+           COALESCE(SUM(l.net::numeric * p.player_id), 0), COALESCE(SUM(l.net::numeric * p.player_id * l.game_id), 0)
+    FROM ledgers l
+    JOIN users u ON l.user_id = u.user_id
+    JOIN players p ON u.player_id = p.player_id;
+    """
+
+
+@dataclass(frozen=True)
+class Nets:
+    # players x games in game_id order, a game a player missed is 0 in nets and in counts
+    player_ids: np.ndarray
+    names: tuple[str, ...]
+    game_ids: np.ndarray
+    nets: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def played(self) -> np.ndarray:
+        return self.counts > 0
+
+    def fingerprint(self) -> tuple[int, int, int, int, int]:
+        mix = (self.counts * self.player_ids[:, None] * self.game_ids[None, :]).sum()
+        by_game = (self.nets * self.player_ids[:, None]).sum(axis=0)
+        # summed as python ints, weighted by game the total can pass int64
+        by_player_game = sum(int(net) * int(game_id) for net, game_id in zip(by_game, self.game_ids))
+        return int(self.counts.sum()), int(self.nets.sum()), int(mix), int(by_game.sum()), by_player_game
+
+
+def _cells(rows: list[tuple]) -> np.ndarray:
+    return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+
+def _names(player_ids: np.ndarray, names: dict[int, str]) -> tuple[str, ...]:
+    return tuple(names.get(int(player_id), str(player_id)) for player_id in player_ids)
+
+
+def _build(cells: np.ndarray, names: dict[int, str], keep: Optional[Nets] = None,
+           replaced: Iterable[int] = ()) -> Nets:
+    # a new matrix from cells, plus keep's columns for the games not in replaced
+    player_ids, game_ids = cells[:, 0], cells[:, 1]
+    if keep is not None:
+        kept = ~np.isin(keep.game_ids, np.fromiter(replaced, dtype=np.int64))
+        player_ids = np.concatenate([keep.player_ids, player_ids])
+        game_ids = np.concatenate([keep.game_ids[kept], game_ids])
+    player_ids, game_ids = np.unique(player_ids), np.unique(game_ids)
+    nets = np.zeros((len(player_ids), len(game_ids)), dtype=np.int64)
+    counts = np.zeros(nets.shape, dtype=np.int32)
+    if keep is not None:
+        rows = np.searchsorted(player_ids, keep.player_ids)
+        columns = np.searchsorted(game_ids, keep.game_ids[kept])
+        nets[np.ix_(rows, columns)] = keep.nets[:, kept]
+        counts[np.ix_(rows, columns)] = keep.counts[:, kept]
+    rows = np.searchsorted(player_ids, cells[:, 0])
+    columns = np.searchsorted(game_ids, cells[:, 1])
+    nets[rows, columns] = cells[:, 2]
+    counts[rows, columns] = cells[:, 3]
+    return Nets(player_ids, _names(player_ids, names), game_ids, nets, counts)
+
+
+class NetMatrix:
+    # Every player's net in every game, loaded once and patched per game as ledgers are inserted.
+    # Other writes (!delete, !reassign, hand edits) are noticed through the cache's table versions;
+    # a fingerprint query then tells whether the matrix needs a full reload.
+    def __init__(self):
+        self.nets: Optional[Nets] = None
+        self.versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _versions() -> dict[str, int]:
+        return {table: cache.results.versions.get(table, 0) for table in TABLES}
+
+    def _load(self) -> Nets:
+        # the primary, a replica behind the write that bumped the versions would be remembered as current
+        with metrics.timer('db_query_seconds', preset='net_matrix'), connect() as connection:
+            names, _ = query(connection, NAMES)
+            cells, _ = query(connection, CELLS)
+        nets = _build(_cells(cells), dict(names))
+        logger.info('Loaded %s players x %s games', *nets.nets.shape)
+        return nets
+
+    def current(self) -> Nets:
+        with self._lock:
+            versions = self._versions()
+            if self.nets is not None and versions == self.versions:
+                metrics.increment('net_matrix', result='hit')
+                return self.nets
+            if self.nets is None:
+                result = 'load'
+            else:
+                with metrics.timer('db_query_seconds', preset='net_matrix_check'), connect() as connection:
+                    (fingerprint,), _ = query(connection, FINGERPRINT)
+                result = 'checked' if tuple(map(int, fingerprint)) == self.nets.fingerprint() else 'reload'
+            if result == 'checked' and versions['players'] != self.versions['players']:
+                with connect() as connection:
+                    names, _ = query(connection, NAMES)
+                self.nets = replace(self.nets, names=_names(self.nets.player_ids, dict(names)))
+            elif result != 'checked':
+                self.nets = self._load()
+            # read before querying, a write that lands meanwhile is checked on the next call
+            self.versions = versions
+            metrics.increment('net_matrix', result=result)
+            return self.nets
+
+    def refresh_games(self, game_ids: Iterable[int]):
+        # call after (re)writing these games' ledgers, the rest of the matrix is kept
+        game_ids = [int(game_id) for game_id in game_ids]
+        with self._lock:
+            if self.nets is None or not game_ids:
+                return
+            with metrics.timer('db_query_seconds', preset='net_matrix_games'), connect() as connection:
+                names, _ = query(connection, NAMES)
+                cells, _ = query(connection, GAME_CELLS, game_ids)
+            self.nets = _build(_cells(cells), dict(names), self.nets, game_ids)
+            metrics.increment('net_matrix', result='patched')
+
+
+matrix = NetMatrix()
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Optional
+
+from src import cache
+from src import metrics
+from src.connect import connect, note_write, query
+
+logger = logging.getLogger(__name__)
+
+# db/migrations/003_table_changes.sql notifies this channel with the table name after every write
+CHANNEL = 'table_changes'
+RETRY = 10
+
+
+class Listener:
+    # LISTENs on its own connection and drops cached results for the tables other processes
+    # (or hand edits) change. Reads happen on the event loop when the socket is readable, no thread or polling.
+    def __init__(self):
+        self.connection = None
+        self._fd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connecting: Optional[asyncio.Task] = None
+
+    @property
+    def listening(self) -> bool:
+        return self.connection is not None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        # connects in the background, the loop never waits on the database
+        self._loop = loop
+        if self.listening or self._connecting:
+            return
+        self._connecting = loop.create_task(self._connect())
+
+    @staticmethod
+    def _open():
+        connection = connect()
+        connection.autocommit = True
+        query(connection, f'LISTEN {CHANNEL};')
+        return connection
+
+    async def _connect(self):
+        while True:
+            try:
+                connection = await asyncio.to_thread(self._open)
+            except Exception as err:
+                logger.warning('Unable to Listen for Table Changes, retrying in %ss: %s', RETRY, err)
+                await asyncio.sleep(RETRY)
+                continue
+            break
+        self._connecting = None
+        self.connection = connection
+        self._fd = connection.fileno()
+        self._loop.add_reader(self._fd, self._read)
+        # anything written while nobody was listening
+        cache.results.clear()
+        metrics.increment('table_changes', event='listening')
+        logger.info('Listening for Table Changes')
+
+    def _read(self):
+        try:
+            self.connection.poll()
+        except Exception as err:
+            logger.warning('Lost Table Change Listener: %s', err)
+            self.stop()
+            self.start(self._loop)
+            return
+        tables = set()
+        while self.connection.notifies:
+            tables.add(self.connection.notifies.pop(0).payload)
+        if tables:
+            # the write's WAL position is unknown here, cached results are read from the primary for a while
+            note_write()
+            cache.invalidate(*tables)
+            for table in tables:
+                metrics.increment('table_changes', event='received', table=table)
+
+    def stop(self):
+        if self._connecting:
+            self._connecting.cancel()
+            self._connecting = None
+        if self.connection is None:
+            return
+        self._loop.remove_reader(self._fd)
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+
+listener = Listener()
@@ -1,19 +1,31 @@
 import asyncio
 import datetime
+import io
 import logging
 import os
 import re
 import sys
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import discord
-import pandas as pd
 
+from src import cache
+from src import commands
+from src import drain
 from src import common
-from src.connect import connect, query
+from src.commands import Arg
+from src.connect import connect, query, record_write
 from src import graph
-from src import ledger_gemini
+from src import jobs
+from src import metrics
+from src import profiler
 from src import query_presets
+from src import render
+from src.pagination import Keyset, Page
+from src.singleflight import flights, names_key
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +38,18 @@ TABLES = common.TABLES
 CHANNELS_TEMPLATE = common.CHANNELS_TEMPLATE
 ROLES_TEMPLATE = common.ROLES_TEMPLATE
 
+PAGE_TIMEOUT = 300
+MAX_FILES = 10
+
 _IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_CHANNEL_MENTION_RE = re.compile(r'^<#(\d+)>$')
+_MESSAGE_LINK_RE = re.compile(fr'^{re.escape(JUMP_URL_PREFIX)}(\d+)/(\d+)/(\d+)$')
+
+commands.HELP.update({
+    'database': '!delete, !reassign, !reset, !table, !search, more commands soon',
+    'query': '!leaderboard, !leaderboard_avg, !career, !graph, !recent, !players, !summary, !streaks, !form',
+    'manage': '!setup, !restart, !add_games, !add_ledgers, ![#channel], ![message link]',
+})
 
 
 async def game_jump(message: discord.Message) -> Optional[discord.Message]:
@@ -50,17 +73,17 @@ async def game_jump(message: discord.Message) -> Optional[discord.Message]:
     return game_jump_message
 
 
+async def read_attachments(attachments: list[discord.Attachment]) -> list[tuple[bytes, str]]:
+    # downloaded together, once, the same bytes serve the repost and the OCR
+    data = await asyncio.gather(*(attachment.read() for attachment in attachments))
+    return [(img_bytes, attachment.content_type) for img_bytes, attachment in zip(data, attachments)]
+
+
 async def attachments_to_bytes(attachments_list: list[list[discord.Attachment]]) -> list[list[tuple[bytes, str]]]:
     images = []
     try:
         for sublist in attachments_list:
-            row = []
-            for attachment in sublist:
-                img_bytes = await attachment.read()
-                img_type = attachment.content_type
-                img_pair = (img_bytes, img_type)
-                row.append(img_pair)
-            images.append(row)
+            images.append(await read_attachments(sublist))
     except Exception as err:
         logger.exception('Error Converting Attachments to Images: %s', err)
         images = []
@@ -68,6 +91,88 @@ async def attachments_to_bytes(attachments_list: list[list[discord.Attachment]])
     return images
 
 
+def table_text(rows: list[tuple], columns: list[str], start: int = 1) -> str:
+    # pandas is only loaded for the commands that print tables
+    import pandas as pd
+    answer = pd.DataFrame(rows, columns=columns)
+    answer.index += start
+    with pd.option_context('display.min_rows', 25, 'display.max_rows', 25):
+        return f'```{answer}```'
+
+
+def graph_bytes(graph_fn, *args) -> Optional[bytes]:
+    # bytes rather than a stream so every coalesced request can upload its own copy
+    graph = graph_fn(*args)
+    return graph.getvalue() if graph else None
+
+
+async def send_files(channel: discord.abc.Messageable, content: str,
+                     files: list[discord.File]) -> list[discord.Message]:
+    # as few messages as Discord's per-message file limit allows, the text goes with the first
+    sent = []
+    for start in range(0, len(files), MAX_FILES):
+        sent.append(await channel.send(content if start == 0 else None, files=files[start:start + MAX_FILES]))
+    metrics.increment('reposted_files', amount=len(files))
+    return sent
+
+
+def page_text(page: Page) -> str:
+    return table_text(page.rows, page.columns, page.start)
+
+
+class PageView(discord.ui.View):
+    # Previous/Next buttons under a table, each press fetches only the slice past the key it last showed
+    def __init__(self, keyset: Keyset, page: Page):
+        super().__init__(timeout=PAGE_TIMEOUT)
+        self.keyset = keyset
+        self.page = page
+        self.message: Optional[discord.Message] = None
+        self._sync()
+
+    def _sync(self):
+        self.previous_page.disabled = not self.page.has_previous
+        self.next_page.disabled = not self.page.has_next
+
+    async def _show(self, interaction: discord.Interaction, **seek):
+        try:
+            page = await asyncio.to_thread(self.keyset.fetch, **seek)
+        except Exception as err:
+            logger.exception('Unable to Connect to the Database: %s', err)
+            await interaction.response.send_message('Unable to Connect to the Database', ephemeral=True)
+            return
+        if page.rows:
+            self.page = page
+        else:
+            # rows were deleted since the last page, stop here
+            self.page.has_next = False
+        self._sync()
+        await interaction.response.edit_message(content=page_text(self.page), view=self)
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        start = max(1, self.page.start - self.keyset.limit)
+        await self._show(interaction, before=self.page.first_key, start=start)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        await self._show(interaction, after=self.page.last_key, start=self.page.start + len(self.page.rows))
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+
+async def send_pages(channel: discord.abc.Messageable, keyset: Keyset, page: Page):
+    if not page.has_next:
+        await channel.send(page_text(page))
+        return
+    view = PageView(keyset, page)
+    view.message = await channel.send(page_text(page), view=view)
+
+
 class OnMessageHandler:
     def __init__(self, shutdown_fn, prompt_fn, admin_fn, reset_sequences_fn, dump_fn):
         self.shutdown = shutdown_fn
@@ -77,210 +182,208 @@ class OnMessageHandler:
         self.dump = dump_fn
 
     async def handle_admin(self, message: discord.Message):
-        # currently admin is just logs, might add functionality later
-        return
+        # admin is mostly logs, plus operational commands
+        await commands.dispatch(self, 'admin', message)
+
+    @commands.command('admin', 'stats', Arg('action', str.lower, default=None))
+    async def stats(self, message: discord.Message, action: Optional[str]):
+        if action == 'reset':
+            metrics.registry.reset()
+            await message.channel.send('Metrics reset')
+            return
+        stats_text = metrics.summary()
+        if len(stats_text) > 1990:
+            stats_text = stats_text[:stats_text.rfind('\n', 0, 1990)]
+        await message.channel.send(f'```{stats_text}```')
+
+    @commands.command('admin', 'profile', Arg('window', variadic=True), limit=1)
+    async def profile(self, message: discord.Message, window: list[str]):
+        if message.author.get_role(roles[message.guild.id]['admin']) is None:
+            await message.channel.send('Only admins can profile the bot')
+            return
+        try:
+            seconds, messages = profiler.parse_window(window)
+        except ValueError:
+            await message.channel.send('Usage: !profile [seconds] or !profile [count] messages')
+            return
+        if profiler.profiler.active:
+            await message.channel.send('A profile is already running')
+            return
+
+        label = f'{messages} messages' if messages else f'{seconds:.0f}s'
+        await message.channel.send(f'Profiling the next {label}...')
+        report = await profiler.profiler.capture(seconds, messages)
+        stamp = report.started.strftime('%Y%m%d_%H%M%S')
+        files = [discord.File(io.BytesIO(report.summary.encode('utf-8')), filename=f'profile_{stamp}.txt'),
+                 discord.File(io.BytesIO(report.folded), filename=f'profile_{stamp}.folded')]
+        headline = report.summary.partition('\n')[0]
+        await message.channel.send(f'{headline}\nThe .folded file opens in speedscope or flamegraph.pl', files=files)
 
     async def handle_commands(self, message: discord.Message):
         # for future implementation of commands
         return
 
     async def handle_database(self, message: discord.Message):
-        guild = message.guild
-        txt = message.content.strip()
-        if txt and txt.startswith('!'):
-            words = txt[1:].split()
-            if words:
-                option = words[0].lower()
-                arguments = words[1:]
-                if option == 'reset':
-                    await self.reset_sequences(guild)
-                    return
-                elif option == 'delete':
-                    response = await self.prompt(
-                        message,
-                        "Enter: [table] [id] (e.g., 'players 115' or 'games 72'). You have 1 minute."
-                    )
-                    if response is None:
-                        await message.channel.send('Too late!')
-                        return
+        await commands.dispatch(self, 'database', message)
 
-                    parts = response.split()
-                    if len(parts) != 2:
-                        await message.channel.send("Invalid format. Operation cancelled.")
-                        return
+    @commands.command('database', 'reset')
+    async def reset(self, message: discord.Message):
+        await self.reset_sequences(message.guild)
 
-                    table, id_str = parts
-                    table = table.lower()
-                    if table not in TABLES or not id_str.isdigit():
-                        await message.channel.send("Invalid table or ID. Operation cancelled.")
-                        return
+    @commands.command('database', 'delete', limit=1)
+    async def delete(self, message: discord.Message):
+        guild = message.guild
+        response = await self.prompt(
+            message,
+            "Enter: [table] [id] (e.g., 'players 115' or 'games 72'). You have 1 minute."
+        )
+        if response is None:
+            await message.channel.send('Too late!')
+            return
 
-                    id_value = int(id_str)
-                    delete_query = f"""DELETE FROM {table} WHERE {TABLES[table]} = %s"""
+        parts = response.split()
+        if len(parts) != 2:
+            await message.channel.send("Invalid format. Operation cancelled.")
+            return
 
-                    try:
-                        with connect() as connection:
-                            query(connection, delete_query, id_value)
-                    except Exception as err:
-                        logger.exception('Error deleting database entry: %s', err)
-                        await message.channel.send(f'An error occurred: {err}')
-                    else:
-                        await message.channel.send(f"Deleted {table} entry {id_value} successfully.")
-                    await self.reset_sequences(guild)
-                    return
-                elif option == 'reassign':
-                    response = await self.prompt(
-                        message,
-                        "Enter: [wrong_player_id] [correct_player_id] {correct_user_id} (e.g. '151 108 a1b2c3d4e5'). You have 1 minute."
-                    )
-                    if response is None:
-                        await message.channel.send('Too late!')
-                        return
+        table, id_str = parts
+        table = table.lower()
+        if table not in TABLES or not id_str.isdigit():
+            await message.channel.send("Invalid table or ID. Operation cancelled.")
+            return
 
-                    parts = response.split()
-                    if len(parts) not in [2, 3] or not parts[0].isdigit() or not parts[1].isdigit():
-                        await message.channel.send("Invalid format. Operation cancelled.")
-                        return
+        id_value = int(id_str)
+        delete_query = f"""DELETE FROM {table} WHERE {TABLES[table]} = %s"""
 
-                    incorrect_player_id = int(parts[0])
-                    correct_player_id = int(parts[1])
-                    correct_user_id = parts[2] if len(parts) == 3 else None
+        try:
+            with connect() as connection:
+                query(connection, delete_query, id_value)
+            record_write(connection)
+            cache.invalidate(table)
+        except Exception as err:
+            logger.exception('Error deleting database entry: %s', err)
+            await message.channel.send(f'An error occurred: {err}')
+        else:
+            await message.channel.send(f"Deleted {table} entry {id_value} successfully.")
+        await self.reset_sequences(guild)
 
-                    user_id_text = ''
-                    if correct_user_id:
-                        user_id_text = f' ({correct_user_id} - updated)'
-                    response = await self.prompt(
-                        message,
-                        f"Respond 'OK' to reassign player {incorrect_player_id} -> {correct_player_id}{user_id_text}"
-                    )
-                    if response is None or response.lower() != 'ok':
-                        raise RuntimeError("User cancelled the operation — rolling back.")
+    @commands.command('database', 'reassign', limit=1)
+    async def reassign(self, message: discord.Message):
+        guild = message.guild
+        response = await self.prompt(
+            message,
+            "Enter: [wrong_player_id] [correct_player_id] {correct_user_id} (e.g. '151 108 a1b2c3d4e5'). You have 1 minute."
+        )
+        if response is None:
+            await message.channel.send('Too late!')
+            return
 
-                    try:
-                        with connect() as connection:
-                            if correct_user_id:
-                                row = query(connection, "SELECT 1 FROM users WHERE user_id = %s", correct_user_id)
-                                if not row:
-                                    query(
-                                        connection,
-                                        "INSERT INTO users (user_id, player_id) VALUES (%s, %s)",
-                                        correct_user_id, correct_player_id
-                                    )
-                                query(
-                                    connection,
-                                    "UPDATE ledgers SET user_id = %s WHERE user_id IN "
-                                    "(SELECT user_id FROM users WHERE player_id = %s)",
-                                    correct_user_id, incorrect_player_id
-                                )
-                                query(
-                                    connection,
-                                    "DELETE FROM users WHERE player_id = %s and user_id != %s",
-                                    incorrect_player_id, correct_user_id
-                                )
-                            else:
-                                query(
-                                    connection,
-                                    "UPDATE users SET player_id = %s WHERE player_id = %s",
-                                    correct_player_id, incorrect_player_id
-                                )
-                            if correct_player_id != incorrect_player_id:
-                                query(
-                                    connection,
-                                    "DELETE FROM players WHERE player_id = %s ",
-                                    incorrect_player_id
-                                )
-                    except RuntimeError:
-                        logger.info('Player Reassignment Cancelled')
-                        await message.channel.send(f'Player Reassignment Cancelled')
-                    except Exception as err:
-                        logger.exception('Error reassigning database entry: %s', err)
-                        await message.channel.send(f'An error occurred: {err}')
-                    else:
-                        await message.channel.send('Player Reassignment Successful.')
-                    await self.reset_sequences(guild)
-                    return
-                elif option == 'table':
-                    if not arguments:
-                        await message.channel.send('!table requires 1 argument, the table name')
-                        return
+        parts = response.split()
+        if len(parts) not in [2, 3] or not parts[0].isdigit() or not parts[1].isdigit():
+            await message.channel.send("Invalid format. Operation cancelled.")
+            return
 
-                    table = arguments[0].lower()
-                    if table not in TABLES or not _IDENTIFIER_RE.fullmatch(table):
-                        await message.channel.send(f'Table: {table} - does not exist')
-                        return
-                    safe_table = f'"{table}"'
+        incorrect_player_id = int(parts[0])
+        correct_player_id = int(parts[1])
+        correct_user_id = parts[2] if len(parts) == 3 else None
 
-                    try:
-                        with connect() as connection:
-                            ans, columns = query(connection,
-                                                    "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
-                                                    table)
-                            table_columns = [c[0].lower() for c in ans]
-                            table_query = f"""Select * FROM {safe_table} ORDER BY """
-                            if arguments[1:]:
-                                for col in arguments[1:]:
-                                    if col not in table_columns or not _IDENTIFIER_RE.fullmatch(col):
-                                        await message.channel.send(f'Column: {col} - not in {table}')
-                                        return
-                                table_query += ', '.join(f'"{col}" DESC' for col in arguments[1:])
-                            else:
-                                table_query += f'"{TABLES[table]}" DESC'
-
-                            table_query += ';'
-                            ans, cols = query(connection, table_query)
-                            answer = pd.DataFrame(ans, columns=cols)
-                            answer.index += 1
-                            with pd.option_context('display.min_rows', 25, 'display.max_rows', 25):
-                                await message.channel.send(f'```{answer}```')
-                    except Exception as err:
-                        logger.exception('Unable to Connect to the Database: %s', err)
-                        await message.channel.send('Unable to Connect to the Database')
-                    return
-                elif option == 'search':
-                    if len(arguments) < 2:
-                        await message.channel.send('Usage: !search <table> <value> [value2] [value3] ...')
-                        return
+        user_id_text = ''
+        if correct_user_id:
+            user_id_text = f' ({correct_user_id} - updated)'
+        response = await self.prompt(
+            message,
+            f"Respond 'OK' to reassign player {incorrect_player_id} -> {correct_player_id}{user_id_text}"
+        )
+        if response is None or response.lower() != 'ok':
+            raise RuntimeError("User cancelled the operation — rolling back.")
 
-                    table = arguments[0].lower()
-                    values = arguments[1:]
+        try:
+            with connect() as connection:
+                if correct_user_id:
+                    row = query(connection, "SELECT 1 FROM users WHERE user_id = %s", correct_user_id)
+                    if not row:
+                        query(
+                            connection,
+                            "INSERT INTO users (user_id, player_id) VALUES (%s, %s)",
+                            correct_user_id, correct_player_id
+                        )
+                    query(
+                        connection,
+                        "UPDATE ledgers SET user_id = %s WHERE user_id IN "
+                        "(SELECT user_id FROM users WHERE player_id = %s)",
+                        correct_user_id, incorrect_player_id
+                    )
+                    query(
+                        connection,
+                        "DELETE FROM users WHERE player_id = %s and user_id != %s",
+                        incorrect_player_id, correct_user_id
+                    )
+                else:
+                    query(
+                        connection,
+                        "UPDATE users SET player_id = %s WHERE player_id = %s",
+                        correct_player_id, incorrect_player_id
+                    )
+                if correct_player_id != incorrect_player_id:
+                    query(
+                        connection,
+                        "DELETE FROM players WHERE player_id = %s ",
+                        incorrect_player_id
+                    )
+            record_write(connection)
+            cache.invalidate('players', 'users', 'ledgers')
+        except RuntimeError:
+            logger.info('Player Reassignment Cancelled')
+            await message.channel.send(f'Player Reassignment Cancelled')
+        except Exception as err:
+            logger.exception('Error reassigning database entry: %s', err)
+            await message.channel.send(f'An error occurred: {err}')
+        else:
+            await message.channel.send('Player Reassignment Successful.')
+        await self.reset_sequences(guild)
 
-                    if table not in TABLES or not _IDENTIFIER_RE.fullmatch(table):
-                        await message.channel.send(f'Table: {table} - does not exist')
-                        return
-                    safe_table = f'"{table}"'
+    @commands.command('database', 'table', Arg('table', str.lower), Arg('columns', variadic=True),
+                      usage='!table requires 1 argument, the table name')
+    async def table(self, message: discord.Message, table: str, columns: list[str]):
+        if table not in TABLES or not _IDENTIFIER_RE.fullmatch(table):
+            await message.channel.send(f'Table: {table} - does not exist')
+            return
+        for col in columns:
+            if not _IDENTIFIER_RE.fullmatch(col):
+                await message.channel.send(f'Column: {col} - not in {table}')
+                return
+        try:
+            keyset = await asyncio.to_thread(query_presets.table_pages, table, columns)
+            page = await asyncio.to_thread(keyset.fetch)
+        except KeyError as err:
+            await message.channel.send(f'Column: {err.args[0]} - not in {table}')
+            return
+        except Exception as err:
+            logger.exception('Unable to Connect to the Database: %s', err)
+            await message.channel.send('Unable to Connect to the Database')
+            return
+        await send_pages(message.channel, keyset, page)
 
-                    try:
-                        with connect() as connection:
-                            ans, columns = query(connection,
-                                                 "SELECT column_name FROM information_schema.columns WHERE table_name = %s",
-                                                 table)
-                            table_columns = [c[0].lower() for c in ans]
-
-                            conditions = []
-                            params = []
-                            for val in values:
-                                col_checks = [f'CAST("{col}" AS TEXT) ILIKE %s' for col in table_columns]
-                                conditions.append("(" + " OR ".join(col_checks) + ")")
-                                params.extend([f"%{val}%"] * len(table_columns))
-
-                            where_clause = " OR ".join(conditions)
-                            search_query = f'SELECT * FROM {safe_table} WHERE {where_clause} ORDER BY {TABLES[table]} DESC;'
-
-                            ans, cols = query(connection, search_query, *params)
-                            if not ans:
-                                await message.channel.send(f'No matches found for {", ".join(values)} in {table}')
-                                return
-
-                            answer = pd.DataFrame(ans, columns=cols)
-                            answer.index += 1
-                            with pd.option_context('display.min_rows', 25, 'display.max_rows', 25):
-                                await message.channel.send(f'```{answer}```')
-                    except Exception as err:
-                        logger.exception('Search failed: %s', err)
-                        await message.channel.send('Search failed')
-                    return
-            await message.channel.send('!delete, !reassign, !reset, !table, !search, more commands soon')
+    @commands.command('database', 'search', Arg('table', str.lower), Arg('values', variadic=True),
+                      usage='Usage: !search <table> <value> [value2] [value3] ...')
+    async def search(self, message: discord.Message, table: str, values: list[str]):
+        if not values:
+            await message.channel.send('Usage: !search <table> <value> [value2] [value3] ...')
+            return
+        if table not in TABLES or not _IDENTIFIER_RE.fullmatch(table):
+            await message.channel.send(f'Table: {table} - does not exist')
             return
+        try:
+            keyset = await asyncio.to_thread(query_presets.search_pages, table, values)
+            page = await asyncio.to_thread(keyset.fetch)
+        except Exception as err:
+            logger.exception('Search failed: %s', err)
+            await message.channel.send('Search failed')
+            return
+        if not page.rows:
+            await message.channel.send(f'No matches found for {", ".join(values)} in {table}')
+            return
+        await send_pages(message.channel, keyset, page)
 
     @staticmethod
     async def handle_email(message: discord.Message):
@@ -312,7 +415,9 @@ class OnMessageHandler:
         try:
             with connect() as connection:
                 query(connection, insert_player_query, member_name, member_id, member_email)
-            self.dump()
+            record_write(connection)
+            cache.invalidate('players')
+            await self.dump()
         except Exception as err:
             logger.exception('Unable to Update Player Email: %s', err)
         return
@@ -351,12 +456,13 @@ class OnMessageHandler:
                 game_jump_url = game_jump_message.jump_url if game_jump_message else 'Cannot find game'
 
                 # This does not enforce or check if the log and ledgers are truly corresponding
-                nets_graph = graph.graph_setup(attachment_one, attachment_two)
+                profile, _ = render.split_profile(message.content.split())
+                nets_graph = graph.graph_setup(attachment_one, attachment_two, profile)
 
                 if nets_graph:
                     try:
                         # According to Official Documentation, the File object is only to be used once
-                        nets_file = discord.File(nets_graph, filename='nets.png')
+                        nets_file = discord.File(nets_graph, filename=f'nets.{profile.extension}')
                         await message.channel.send(f'Nets for: {game_jump_url}', file=nets_file)
 
                         await message.delete()
@@ -385,23 +491,49 @@ class OnMessageHandler:
             email = await self._get_email(game_jump_message)
             email_tag = f' {email}' if email else ''
         attachments = message.attachments
-        await message.channel.send(f'Ledger for: {game_jump_url}{email_tag}', file=await attachments[0].to_file())
-        for screen_shot in attachments[1:]:
-            await message.channel.send(file=await screen_shot.to_file())
+        try:
+            images = await read_attachments(attachments)
+        except Exception as err:
+            # the original stays up so the screenshots are not lost
+            logger.warning('Unable to Download Ledger Attachments: %s', err)
+            await self.admin_message(guild, 'Ledger Not Reposted - Unable to Download Attachments')
+            return
+        files = [discord.File(io.BytesIO(img_bytes), filename=attachment.filename)
+                 for (img_bytes, _), attachment in zip(images, attachments)]
+        reposts = await send_files(message.channel, f'Ledger for: {game_jump_url}{email_tag}', files)
+        test_channel = message.channel.id == channels[guild.id]['ledgers-test']
+        progress = None
+        if game_jump_message and (not test_channel or '!' in message.content):
+            progress = {'guild_id': guild.id, 'channel_id': message.channel.id,
+                        'reposts': [repost.id for repost in reposts],
+                        'game': [game_jump_message.channel.id, game_jump_message.id]}
+        # the original is deleted next, a restart from here on resumes the import from the reposts
+        drain.inflight.resume_as(message, 'import_ledger' if progress else None, progress)
         await message.delete()
 
         if game_jump_message:
-            if message.channel.id == channels[guild.id]['ledgers-test']:
-                if '!' not in message.content:
+            if test_channel:
+                if progress is None:
                     await message.channel.send('Not Inserting Ledger', delete_after=5)
                     return
                 else:
                     await message.channel.send('Inserting Game/Ledger')
+            await self.import_ledger(message, attachments, game_jump_message, progress, images)
+        return
 
+    async def import_ledger(self, message: discord.Message, attachments: list[discord.Attachment],
+                            game_jump_message: discord.Message, progress: dict,
+                            images: Optional[list[tuple[bytes, str]]] = None):
+        # progress is what the import_ledger job resumes from, the game id is added once it is settled
+        guild = message.guild
+        if images is None:
+            images = await read_attachments(attachments)
+        game_id = progress.get('game_id')
+        if game_id is None:
             matches = [word for word in game_jump_message.content.split() if POKERNOW in word]
             if not matches:
                 logger.warning('No PokerNow URL found in message.')
-                await self.admin_message('Ledger Not Inserted - Missing PokerNow URL')
+                await self.admin_message(guild, 'Ledger Not Inserted - Missing PokerNow URL')
                 return
             url = matches[0].rpartition('/')[2]
 
@@ -412,6 +544,9 @@ class OnMessageHandler:
                 with connect() as connection:
                     new_insert, _ = query(connection, game_query, url, game_jump_message.created_at)
                     existing_game, _ = query(connection, game_id_query, url)
+                if new_insert:
+                    record_write(connection)
+                    cache.invalidate('games')
             except Exception as err:
                 logger.warning('Unable to Insert Game: %s\nurl = %s', err, url)
                 await self.admin_message(guild, 'Error Connecting with Database. Ledger(s) Skipped')
@@ -429,269 +564,331 @@ class OnMessageHandler:
                     return
                 elif response.lower() not in ['yes', 'y']:
                     return
-            if new_insert or existing_game:
-                game_id = new_insert[0][0] if new_insert else existing_game[0][0]
-                images_list = await attachments_to_bytes([attachments])
-                results = []
-                for sublist in images_list:
-                    results.append(await asyncio.to_thread(ledger_gemini.gemini, sublist, game_id=game_id))
-                await self._insert(guild, results, game_id)
-                return
-            else:
+            if not new_insert and not existing_game:
                 logger.warning('Ledgers Skipped, Unexpected Error')
                 await self.admin_message(guild, 'Ledgers Skipped, Unexpected Error')
-        return
-
-    @staticmethod
-    async def handle_query(message: discord.Message):
-        txt = message.content.strip()
-        if txt and txt.startswith('!'):
-            words = txt[1:].split()
-            if words:
-                option = words[0].lower()
-                arguments = words[1:]
-                if option == 'players':
-                    ans, columns = query_presets.players()
-                    if ans:
-                        answer = pd.DataFrame(ans, columns=columns)
-                        answer.index += 1
-                        await message.channel.send(', '.join(answer['name'].to_list()))
-                    else:
-                        logger.info('Unexpected #query Error: %s', txt)
-                        await message.channel.send("Unexpected Error")
-                    return
-                elif option in ('leaderboard', 'leaderboard_avg'):
-                    ans, columns = query_presets.leaderboard(arguments, option == 'leaderboard_avg')
-                    if ans:
-                        answer = pd.DataFrame(ans, columns=columns)
-                        answer.index += 1
-                        with pd.option_context('display.min_rows', 25, 'display.max_rows', 25):
-                            await message.channel.send(f'```{answer}```')
-                    else:
-                        logger.info('Unexpected #query Error: %s', txt)
-                        await message.channel.send("Unexpected Error")
-                    return
-                elif option == 'career':
-                    if len(arguments) == 1:
-                        ans, columns = query_presets.career(arguments[0])
-                        if ans:
-                            answer = pd.DataFrame(ans, columns=columns)
-                            answer.index += 1
-                            with pd.option_context('display.min_rows', 25, 'display.max_rows', 25):
-                                await message.channel.send(f'```{answer}```')
-                            return
-                    await message.channel.send("!Include exactly 1 player name. !career name. !players.")
-                    return
-                elif option == 'graph':
-                    career_graph = query_presets.career_graph(arguments)
-                    if career_graph:
-                        graph_file = discord.File(career_graph, filename='career_graph.png')
-                        await message.channel.send(file=graph_file)
-                    else:
-                        await message.channel.send('Error or No Career Graph')
-                    return
-                elif option == 'recent':
-                    days = 30
-                    if arguments and arguments[0].isdigit():
-                        days = arguments[0]
-                        arguments = arguments[1:]
-                    recent_graph = query_presets.recent_graph(days, arguments)
-                    if recent_graph:
-                        recent_file = discord.File(recent_graph, filename='recent_graph.png')
-                        await message.channel.send(file=recent_file)
-                    else:
-                        await message.channel.send(f'No games in the last {days} days')
-                    return
-            await message.channel.send("!leaderboard, !leaderboard_avg, !career, !graph, !recent, !players")
-        return
+                return
+            game_id = new_insert[0][0] if new_insert else existing_game[0][0]
+            progress['game_id'] = game_id
+
+        csv_attachments = [a for a in attachments if a.filename.lower().endswith('.csv')]
+        if csv_attachments:
+            from src import ledger_csv
+            # PokerNow's exported ledger is exact, no OCR or id correction needed
+            csv_files = [img_bytes for (img_bytes, _), a in zip(images, attachments)
+                         if a.filename.lower().endswith('.csv')]
+            ledger_files = [data for data in csv_files if ledger_csv.is_ledger_csv(data)]
+            if not ledger_files:
+                await self.admin_message(guild, 'Ledger Not Inserted - Attach the ledger .csv, not the log')
+                return
+            try:
+                results = [ledger_csv.parse_ledger_csv(ledger_files[0])]
+            except ledger_csv.AmbiguousUnits as err:
+                logger.warning('Ledger CSV Not Inserted: %s', err)
+                await self.admin_message(guild, f'Ledger Not Inserted - Unclear if the .csv is in cents or dollars, '
+                                                f'{err}')
+                return
+        else:
+            from src import ledger_gemini
+            results = [await asyncio.to_thread(ledger_gemini.gemini, images, game_id=game_id)]
+        # _insert writes before its first await, so a restart can no longer stop the import short of the insert
+        drain.inflight.resume_as(message, None)
+        await self._insert(guild, results, game_id, exact=bool(csv_attachments))
+
+    async def handle_query(self, message: discord.Message):
+        await commands.dispatch(self, 'query', message)
+
+    @commands.command('query', 'players')
+    async def players(self, message: discord.Message):
+        ans, columns = await flights.run('players', (), query_presets.players)
+        if ans:
+            name_index = columns.index('name')
+            await message.channel.send(', '.join(row[name_index] for row in ans))
+        else:
+            logger.info('Unexpected #query Error: %s', message.content.strip())
+            await message.channel.send("Unexpected Error")
+
+    @commands.command('query', 'leaderboard_avg', Arg('players', variadic=True), average=True)
+    @commands.command('query', 'leaderboard', Arg('players', variadic=True))
+    async def leaderboard(self, message: discord.Message, players: list[str], average: bool = False):
+        ans, columns = await flights.run('leaderboard', (names_key(players), average),
+                                         query_presets.leaderboard, players, average)
+        if ans:
+            await message.channel.send(table_text(ans, columns))
+        else:
+            logger.info('Unexpected #query Error: %s', message.content.strip())
+            await message.channel.send("Unexpected Error")
+
+    @commands.command('query', 'career', Arg('name'), exact=True,
+                      usage='!Include exactly 1 player name. !career name. !players.')
+    async def career(self, message: discord.Message, name: str):
+        ans, columns = await flights.run('career', (name.lower(),), query_presets.career, name)
+        if ans:
+            await message.channel.send(table_text(ans, columns))
+            return
+        await message.channel.send("!Include exactly 1 player name. !career name. !players.")
+
+    @commands.command('query', 'graph', Arg('players', variadic=True), renders=True)
+    async def career_graph(self, message: discord.Message, players: list[str], profile: render.OutputProfile):
+        career_graph = await flights.run('graph', (names_key(players), profile.name), graph_bytes,
+                                         query_presets.career_graph, players, profile, limit=2)
+        if career_graph:
+            graph_file = discord.File(io.BytesIO(career_graph), filename=f'career_graph.{profile.extension}')
+            await message.channel.send(file=graph_file)
+        else:
+            await message.channel.send('Error or No Career Graph')
+
+    @commands.command('query', 'recent', Arg('days', int, default=30), Arg('players', variadic=True),
+                      renders=True)
+    async def recent_graph(self, message: discord.Message, days: int, players: list[str],
+                           profile: render.OutputProfile):
+        recent_graph = await flights.run('recent', (days, names_key(players), profile.name), graph_bytes,
+                                         query_presets.recent_graph, days, players, profile, limit=2)
+        if recent_graph:
+            recent_file = discord.File(io.BytesIO(recent_graph), filename=f'recent_graph.{profile.extension}')
+            await message.channel.send(file=recent_file)
+        else:
+            await message.channel.send(f'No games in the last {days} days')
+
+    @commands.command('query', 'summary', Arg('players', variadic=True))
+    async def summary(self, message: discord.Message, players: list[str]):
+        from src import stats
+        ans, columns = await flights.run('summary', (names_key(players),), stats.summary, players)
+        if ans:
+            await message.channel.send(table_text(ans, columns))
+        else:
+            await message.channel.send('No games found')
+
+    @commands.command('query', 'streaks', Arg('players', variadic=True))
+    async def streaks(self, message: discord.Message, players: list[str]):
+        from src import stats
+        ans, columns = await flights.run('streaks', (names_key(players),), stats.streaks, players)
+        if ans:
+            await message.channel.send(table_text(ans, columns))
+        else:
+            await message.channel.send('No games found')
+
+    @commands.command('query', 'form', Arg('games', int, default=5), Arg('players', variadic=True),
+                      usage='!form [games] [players], games is at least 1')
+    async def form(self, message: discord.Message, games: int, players: list[str]):
+        from src import stats
+        if games < 1:
+            await message.channel.send('!form [games] [players], games is at least 1')
+            return
+        ans, columns = await flights.run('form', (games, names_key(players)), stats.form, games, players)
+        if ans:
+            await message.channel.send(table_text(ans, columns))
+        else:
+            await message.channel.send('No games found')
 
     async def handle_manage(self, message: discord.Message):
+        await commands.dispatch(self, 'manage', message)
+
+    @commands.command('manage', 'restart', limit=1)
+    async def restart(self, message: discord.Message):
+        await message.channel.send("Restarting bot, finishing work in progress...")
+        logger.info('Restarting bot...')
+        # stop taking messages, let running handlers finish and pass the rest to the new process
+        unfinished, resumed = await drain.inflight.drain(exclude=message.id)
+        # stopped first, so this process does not claim the jobs it hands over
+        jobs.scheduler.stop()
+        for kind, payload in resumed:
+            try:
+                await jobs.enqueue(kind, payload, priority=jobs.HIGH, guild_id=payload.get('guild_id'))
+            except Exception as err:
+                logger.warning('Unable to Queue %s for the Next Process: %s', kind, err)
+                await self.admin_message(message.guild, f'Unfinished {kind} lost in the restart')
+        drain.save(unfinished)
+        await self.shutdown()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    @commands.command('manage', 'setup', limit=1)
+    async def setup(self, message: discord.Message):
         guild = message.guild
-        txt = message.content.strip()
-        if txt and txt.startswith('!'):
-            words = txt[1:].split()
-            if words:
-                option = words[0].lower()
-                arguments = words[1:]
-                if option == 'restart':
-                    await message.channel.send("Restarting bot...")
-                    logger.info('Restarting bot...')
-                    await self.shutdown()
-                    os.execv(sys.executable, [sys.executable] + sys.argv)
-                elif option == 'setup':
-                    guild_channels = [c for c in await guild.fetch_channels() if
-                                      isinstance(c, discord.TextChannel) and c.name in CHANNELS_TEMPLATE]
-                    guild_channel_names = [c.name for c in guild_channels]
-                    for channel in CHANNELS_TEMPLATE:
-                        if channel not in guild_channel_names:
-                            new_channel = await guild.create_text_channel(name=channel, reason="Setup missing channel")
-                            perms = new_channel.permissions_for(guild.me)
-                            if not perms.read_messages:
-                                await new_channel.set_permissions(guild.me, read_messages=True, send_messages=True)
-                            channels[guild.id][channel] = new_channel.id
-                        else:
-                            duplicate_channels = [d for d in guild_channels if d.name == channel]
-                            for c in duplicate_channels:
-                                if c.id == channels[guild.id][channel]:
-                                    perms = c.permissions_for(guild.me)
-                                    if not perms.read_messages:
-                                        await c.set_permissions(guild.me, read_messages=True, send_messages=True)
-                                else:
-                                    await c.delete(reason=f'Removed Duplicate of #{channel}')
-
-                    guild_roles = [r for r in await guild.fetch_roles() if r.name in ROLES_TEMPLATE]
-                    guild_role_names = [r.name for r in guild_roles]
-
-                    for role in ROLES_TEMPLATE:
-                        if role not in guild_role_names:
-                            new_role = await guild.create_role(name=role, reason="Setup missing role")
-                            roles[guild.id][role] = new_role.id
-                        else:
-                            duplicate_roles = [d for d in guild_roles if d.name == role]
-                            for r in duplicate_roles:
-                                if not r.id == roles[guild.id][role]:
-                                    await r.delete(reason=f"Removed Duplicate of @'{role}'")
-                    return
-                elif option == 'purge':
-                    channel_mentions = message.channel_mentions
-                    if len(channel_mentions) == 1:
-                        channel = channel_mentions[0]
-                        response = await self.prompt(
-                            message,
-                            f"Enter the number of messages you want to purge from {channel.name}.\nYou have 1 minute."
-                        )
-                        if response is None:
-                            await message.channel.send('Too late!')
-                            return
-                        elif response.lower() in ['cancel', 'no', 'quit', 'exit', 'abandon']:
-                            return
-                        elif not response.isdigit() or int(response) < 1:
-                            await message.channel.send('Enter a positive integer for the number of messages to purge.')
-                            return
-                        try:
-                            await message.channel_mentions[0].purge(limit=int(response))
-                        except discord.Forbidden:
-                            logger.warning('Missing permissions to manage messages in %s', channel.name)
-                            await message.channel.send(f'Missing permissions to manage messages in {channel.name}')
-                        return
-                    await message.channel.send('!purge required exactly 1 channel to be mentioned')
-                    return
-                elif option == 'add_games':
-                    # message: !add_games MM DD YYYY
-                    if len(arguments) > 1:
-                        m = int(arguments[0])
-                        d = int(arguments[1])
-                        y = int(arguments[2])
-                        logger.debug('Starting to Add Games to Database')
-                        game_query = """INSERT INTO games (url, date) VALUES (%s, %s);"""
-                        links = []
-                        game_channel = guild.get_channel(channels[guild.id]['game'])
-                        # oldest to newest
-                        async for entry in game_channel.history(after=datetime.datetime(year=y, month=m, day=d)):
-                            if POKERNOW in entry.content:
-                                matches = [word for word in entry.content.split() if POKERNOW in word]
-                                links.append([matches[0], entry.created_at.strftime('%m-%d-%y'), entry.created_at])
-                        try:
-                            with connect() as connection:
-                                for item in links:
-                                    # unique part of pokernow url
-                                    query(connection, game_query, item[0].split()[-1].rpartition('/')[2], item[-1])
-                        except Exception as err:
-                            logger.warning('No Games Inserted: %s', err)
-                        return
-                    else:
-                        await message.channel.send('!add_games MM DD YYYY')
-                        return
-                elif option == 'add_ledgers':
-                    # message: !add_ledgers {game_id of 1st ledger} MM DD YYYY [MM DD YYY] <-- [optional end date]
-                    if len(arguments) in (4, 7):
-                        logger.debug('Starting to Add Ledgers to Database')
-                        game_id = int(arguments[0])
-                        m = int(arguments[1])
-                        d = int(arguments[2])
-                        y = int(arguments[3])
-                        after = datetime.datetime(month=m, day=d, year=y)
-                        before = (
-                            datetime.datetime(month=int(arguments[4]), day=int(arguments[5]), year=int(arguments[6]))
-                            if len(arguments) == 7
-                            else datetime.datetime.now()
-                        )
-                        i = 0
-                        attachments_list = []
-                        buffer = datetime.datetime.min
-                        ledgers_channel = guild.get_channel(channels[guild.id]['ledgers'])
-                        # oldest to newest
-                        async for entry in ledgers_channel.history(after=after, before=before):
-                            if entry.attachments:
-                                if not attachments_list or entry.created_at - buffer >= datetime.timedelta(minutes=2):
-                                    i += 1
-                                    attachments_list.append(entry.attachments)
-                                    buffer = entry.created_at
-                                else:
-                                    attachments_list[-1] = attachments_list[-1] + entry.attachments
-                        images_list = await attachments_to_bytes(attachments_list=attachments_list)
-                        results = []
-                        for index, sublist in enumerate(images_list):
-                            results.append(await asyncio.to_thread(ledger_gemini.gemini, sublist, game_id=game_id + index))
-                        await self._insert(guild, results, game_id)
-                        return
+        guild_channels = [c for c in await guild.fetch_channels() if
+                          isinstance(c, discord.TextChannel) and c.name in CHANNELS_TEMPLATE]
+        guild_channel_names = [c.name for c in guild_channels]
+        for channel in CHANNELS_TEMPLATE:
+            if channel not in guild_channel_names:
+                new_channel = await guild.create_text_channel(name=channel, reason="Setup missing channel")
+                perms = new_channel.permissions_for(guild.me)
+                if not perms.read_messages:
+                    await new_channel.set_permissions(guild.me, read_messages=True, send_messages=True)
+                channels[guild.id][channel] = new_channel.id
+            else:
+                duplicate_channels = [d for d in guild_channels if d.name == channel]
+                for c in duplicate_channels:
+                    if c.id == channels[guild.id][channel]:
+                        perms = c.permissions_for(guild.me)
+                        if not perms.read_messages:
+                            await c.set_permissions(guild.me, read_messages=True, send_messages=True)
                     else:
-                        await message.channel.send('!add_ledgers GID MM DD YYYY')
-                        return
+                        await c.delete(reason=f'Removed Duplicate of #{channel}')
+        commands.index_guild(guild.id, channels[guild.id])
+
+        guild_roles = [r for r in await guild.fetch_roles() if r.name in ROLES_TEMPLATE]
+        guild_role_names = [r.name for r in guild_roles]
+
+        for role in ROLES_TEMPLATE:
+            if role not in guild_role_names:
+                new_role = await guild.create_role(name=role, reason="Setup missing role")
+                roles[guild.id][role] = new_role.id
+            else:
+                duplicate_roles = [d for d in guild_roles if d.name == role]
+                for r in duplicate_roles:
+                    if not r.id == roles[guild.id][role]:
+                        await r.delete(reason=f"Removed Duplicate of @'{role}'")
+
+    @commands.command('manage', 'purge', limit=1)
+    async def purge(self, message: discord.Message):
+        channel_mentions = message.channel_mentions
+        if len(channel_mentions) == 1:
+            channel = channel_mentions[0]
+            response = await self.prompt(
+                message,
+                f"Enter the number of messages you want to purge from {channel.name}.\nYou have 1 minute."
+            )
+            if response is None:
+                await message.channel.send('Too late!')
+                return
+            elif response.lower() in ['cancel', 'no', 'quit', 'exit', 'abandon']:
+                return
+            elif not response.isdigit() or int(response) < 1:
+                await message.channel.send('Enter a positive integer for the number of messages to purge.')
+                return
+            try:
+                await message.channel_mentions[0].purge(limit=int(response))
+            except discord.Forbidden:
+                logger.warning('Missing permissions to manage messages in %s', channel.name)
+                await message.channel.send(f'Missing permissions to manage messages in {channel.name}')
+            return
+        await message.channel.send('!purge required exactly 1 channel to be mentioned')
+
+    @commands.command('manage', 'add_games', Arg('month', int), Arg('day', int), Arg('year', int),
+                      usage='!add_games MM DD YYYY', limit=1)
+    async def add_games(self, message: discord.Message, month: int, day: int, year: int):
+        guild = message.guild
+        after = datetime.datetime(year=year, month=month, day=day)
+        # walking #game history can take minutes, it runs as a job and reports back here
+        job_id = await jobs.enqueue('add_games', {'guild_id': guild.id, 'after': after.isoformat(),
+                                                  'reply_channel_id': message.channel.id},
+                                    guild_id=guild.id, dedup=f'add_games:{guild.id}:{after:%Y-%m-%d}',
+                                    fallback=lambda: self.insert_games(guild, after, message.channel))
+        if job_id:
+            await message.channel.send(f'Adding games since {after:%m/%d/%Y} in the background')
+
+    async def insert_games(self, guild: discord.Guild, after: datetime.datetime,
+                           reply_channel: Optional[discord.abc.Messageable] = None):
+        logger.debug('Starting to Add Games to Database')
+        game_query = """INSERT INTO games (url, date) VALUES (%s, %s);"""
+        links = []
+        game_channel = guild.get_channel(channels[guild.id]['game'])
+        # oldest to newest
+        async for entry in game_channel.history(after=after):
+            if POKERNOW in entry.content:
+                matches = [word for word in entry.content.split() if POKERNOW in word]
+                links.append([matches[0], entry.created_at.strftime('%m-%d-%y'), entry.created_at])
+        try:
+            with connect() as connection:
+                for item in links:
+                    # unique part of pokernow url
+                    query(connection, game_query, item[0].split()[-1].rpartition('/')[2], item[-1])
+            record_write(connection)
+            cache.invalidate('games')
+        except Exception as err:
+            logger.warning('No Games Inserted: %s', err)
+            if reply_channel:
+                await reply_channel.send('No Games Inserted')
+        else:
+            if reply_channel:
+                await reply_channel.send(f'Added {len(links)} games since {after:%m/%d/%Y}')
+
+    @commands.command('manage', 'add_ledgers', Arg('game_id', int), Arg('month', int), Arg('day', int),
+                      Arg('year', int), Arg('end', int, variadic=True), usage='!add_ledgers GID MM DD YYYY', limit=1)
+    async def add_ledgers(self, message: discord.Message, game_id: int, month: int, day: int, year: int,
+                          end: list[int]):
+        # message: !add_ledgers {game_id of 1st ledger} MM DD YYYY [MM DD YYY] <-- [optional end date]
+        if len(end) not in (0, 3):
+            await message.channel.send('!add_ledgers GID MM DD YYYY')
+            return
+        guild = message.guild
+        logger.debug('Starting to Add Ledgers to Database')
+        after = datetime.datetime(month=month, day=day, year=year)
+        before = (
+            datetime.datetime(month=end[0], day=end[1], year=end[2])
+            if end
+            else datetime.datetime.now()
+        )
+        i = 0
+        attachments_list = []
+        buffer = datetime.datetime.min
+        ledgers_channel = guild.get_channel(channels[guild.id]['ledgers'])
+        # oldest to newest
+        async for entry in ledgers_channel.history(after=after, before=before):
+            if entry.attachments:
+                if not attachments_list or entry.created_at - buffer >= datetime.timedelta(minutes=2):
+                    i += 1
+                    attachments_list.append(entry.attachments)
+                    buffer = entry.created_at
                 else:
-                    channel_pattern = r"^<#(\d+)>$"
-                    message_pattern = fr"^{re.escape(JUMP_URL_PREFIX)}{guild.id}/(\d+)/(\d+)$"
-                    channel_match = re.match(channel_pattern, option)
-                    message_match = re.match(message_pattern, option)
-                    if channel_match:
-                        # ! #channel [body] <-- [body is optional if attachments are included]
-                        # group[1] == {channel_id where new message to be sent}
-                        new_content = txt.split(channel_match.group())[1].strip()
-                        channel = message.channel_mentions[0]
-                        attachments = message.attachments
-                        if not new_content and not attachments:
-                            await message.channel.send('Compose Error: Missing message text/attachments')
-                            return
-                        elif not new_content:
-                            await channel.send(file=await attachments[0].to_file())
-                        elif attachments:
-                            await channel.send(new_content, files=[await attachments[0].to_file()])
-                        else:
-                            await channel.send(new_content)
-                            return
-
-                        if attachments:
-                            for file in attachments[1:]:
-                                await channel.send(file=await file.to_file())
-                        await message.channel.send(f'*Message Sent In: {channel.jump_url}')
-                        return
-                    elif message_match:
-                        # ! {message_link} [body] <-- [optional body if attachments included]
-                        # group[1] == {channel_id for the location of the message to be edited}
-                        # group[2] == {message_id of the message to be edited}
-                        # Edits with text, but no attachments will not alter existing attachments, same thing vice versa
-                        cid, mid = message_match.group(1), message_match.group(2)
-                        if cid.isdigit() and mid.isdigit():
-                            new_content = txt.split(message_match.group())[1].strip()
-                            attachments = message.attachments
-                            old = await guild.get_channel(int(cid)).fetch_message(int(mid))
-                            if not new_content and not attachments:
-                                await message.channel.send('Edit Error: Missing message text/attachments')
-                                return
-                            elif not new_content:
-                                await old.edit(attachments=[await att.to_file() for att in attachments])
-                                return
-                            elif attachments:
-                                await old.edit(content=new_content,
-                                               attachments=[await att.to_file() for att in attachments])
-                                return
-                            else:
-                                await old.edit(content=new_content)
-                                return
+                    attachments_list[-1] = attachments_list[-1] + entry.attachments
+        from src import ledger_gemini
+        images_list = await attachments_to_bytes(attachments_list=attachments_list)
+        results = []
+        for index, sublist in enumerate(images_list):
+            results.append(await asyncio.to_thread(ledger_gemini.gemini, sublist, game_id=game_id + index))
+        await self._insert(guild, results, game_id)
+
+    @commands.fallback('manage')
+    async def compose(self, message: discord.Message, option: str):
+        guild = message.guild
+        txt = message.content.strip()
+        channel_match = _CHANNEL_MENTION_RE.match(option)
+        message_match = _MESSAGE_LINK_RE.match(option)
+        if channel_match:
+            # ! #channel [body] <-- [body is optional if attachments are included]
+            # group[1] == {channel_id where new message to be sent}
+            new_content = txt.split(channel_match.group())[1].strip()
+            channel = message.channel_mentions[0]
+            attachments = message.attachments
+            if not new_content and not attachments:
+                await message.channel.send('Compose Error: Missing message text/attachments')
+                return
+            elif not new_content:
+                await channel.send(file=await attachments[0].to_file())
+            elif attachments:
+                await channel.send(new_content, files=[await attachments[0].to_file()])
             else:
-                await message.channel.send('!setup, !restart, !add_games, !add_ledgers, ![#channel], ![message link]')
+                await channel.send(new_content)
+                return
+
+            if attachments:
+                for file in attachments[1:]:
+                    await channel.send(file=await file.to_file())
+            await message.channel.send(f'*Message Sent In: {channel.jump_url}')
+            return
+        elif message_match and int(message_match.group(1)) == guild.id:
+            # ! {message_link} [body] <-- [optional body if attachments included]
+            # group[2] == {channel_id for the location of the message to be edited}
+            # group[3] == {message_id of the message to be edited}
+            # Edits with text, but no attachments will not alter existing attachments, same thing vice versa
+            cid, mid = message_match.group(2), message_match.group(3)
+            new_content = txt.split(message_match.group())[1].strip()
+            attachments = message.attachments
+            old = await guild.get_channel(int(cid)).fetch_message(int(mid))
+            if not new_content and not attachments:
+                await message.channel.send('Edit Error: Missing message text/attachments')
+                return
+            elif not new_content:
+                await old.edit(attachments=[await att.to_file() for att in attachments])
+                return
+            elif attachments:
+                await old.edit(content=new_content,
+                               attachments=[await att.to_file() for att in attachments])
+                return
+            else:
+                await old.edit(content=new_content)
                 return
-        return
 
     async def _get_email(self, message: Optional[discord.Message]) -> Optional[str]:
         if not message:
@@ -701,11 +898,9 @@ class OnMessageHandler:
             return email_matches[0]
 
         email = None
-        email_query = """SELECT email FROM players WHERE discord_id = %s;"""
         guild = message.guild
         try:
-            with connect() as connection:
-                rows, cols = query(connection, email_query, message.author.id)
+            rows, cols = await asyncio.to_thread(query_presets.email, message.author.id)
             if rows:
                 return rows[0][0]
             else:
@@ -724,9 +919,11 @@ class OnMessageHandler:
                 break
         return email
 
-    async def _insert(self, guild: discord.Guild, results: list[pd.DataFrame], game_id: int):
-        ledgers_sum, new_users, errors, success = ledger_gemini.insert_ledgers(ledger_gemini.format_ledgers(results),
-                                                                      game_id=game_id)
+    async def _insert(self, guild: discord.Guild, results: list['pd.DataFrame'], game_id: int, exact: bool = False):
+        from src import ledger_gemini
+        if not exact:
+            results = ledger_gemini.format_ledgers(results)
+        ledgers_sum, new_users, errors, success = ledger_gemini.insert_ledgers(results, game_id=game_id)
         if errors:
             error_text = "\n".join(errors[:5])
             if len(errors) > 5:
@@ -734,6 +931,13 @@ class OnMessageHandler:
             await self.admin_message(guild, f"⚠️ Ledger Insert Errors:\n{error_text}")
 
         if success:
+            from src import netmatrix
+            try:
+                # insert_ledgers writes results[i] to game_id + i
+                await asyncio.to_thread(netmatrix.matrix.refresh_games, range(game_id, game_id + len(results)))
+            except Exception as err:
+                # the next !summary/!streaks/!form finds the mismatch and reloads
+                logger.warning('Unable to Update Net Matrix: %s', err)
             num_ledgers = sum(len(df) for df in results if not df.empty)
             logger.info('%s Ledger(s) Inserted', num_ledgers)
             await self.admin_message(guild, f"Inserted Ledger(s)")
@@ -741,7 +945,7 @@ class OnMessageHandler:
 
     async def _after_insert(self, guild: discord.Guild, ledgers_sum: int, new_users: list[str]) -> None:
         await self.reset_sequences(guild)
-        self.dump()
+        await self.dump()
         if ledgers_sum:
             await self.admin_message(guild, f'Unbalanced Ledgers Sum: {ledgers_sum}')
             logger.warning('Unbalanced Ledgers Sum: %s', ledgers_sum)
@@ -749,4 +953,3 @@ class OnMessageHandler:
             for user in new_users:
                 await self.admin_message(guild,
                                          f"{user} has been created\n!reassign in <#{channels[guild.id]['database']}>")
-        await self.reset_sequences(guild)
\ No newline at end of file
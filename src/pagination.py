@@ -0,0 +1,104 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src import metrics
+from src.connect import connect_read, query
+
+# rows per Discord message, the same 25 the table replies have always shown
+PAGE_SIZE = 25
+
+Key = tuple
+
+
+@dataclass
+class Page:
+    rows: list[tuple]
+    columns: list[str]
+    start: int
+    first_key: Optional[Key]
+    last_key: Optional[Key]
+    has_previous: bool
+    has_next: bool
+
+
+@dataclass
+class Keyset:
+    # A query paged by the values of its sort keys instead of OFFSET, so each page reads only its own rows.
+    # order holds (expression, params), all sorted descending with NULLs last, and must end with the primary key.
+    table: str
+    columns: list[str]
+    order: list[tuple[str, tuple]]
+    where: str = 'TRUE'
+    where_params: tuple = ()
+    limit: int = PAGE_SIZE
+    preset: str = 'page'
+    # the primary key never holds NULLs, so it can use a row comparison the index can serve
+    key_only: bool = field(default=False)
+
+    def _seek(self, key: Key, forward: bool) -> tuple[str, list]:
+        if self.key_only:
+            expressions = ', '.join(expression for expression, _ in self.order)
+            marks = ', '.join(['%s'] * len(key))
+            params = [p for _, ps in self.order for p in ps] + list(key)
+            return f"({expressions}) {'<' if forward else '>'} ({marks})", params
+
+        # lexicographic successor written out term by term so NULL keys page correctly
+        clauses, params = [], []
+        for index, value in enumerate(key):
+            terms, term_params = [], []
+            for (expression, ps), previous in zip(self.order[:index], key[:index]):
+                if previous is None:
+                    terms.append(f'({expression}) IS NULL')
+                    term_params += ps
+                else:
+                    terms.append(f'({expression}) = %s')
+                    term_params += [*ps, previous]
+            expression, ps = self.order[index]
+            if value is None:
+                if forward:
+                    # nothing sorts after NULL in this column
+                    continue
+                terms.append(f'({expression}) IS NOT NULL')
+                term_params += ps
+            elif forward:
+                terms.append(f'(({expression}) < %s OR ({expression}) IS NULL)')
+                term_params += [*ps, value, *ps]
+            else:
+                terms.append(f'({expression}) > %s')
+                term_params += [*ps, value]
+            clauses.append('(' + ' AND '.join(terms) + ')')
+            params += term_params
+        return '(' + (' OR '.join(clauses) or 'FALSE') + ')', params
+
+    def fetch(self, after: Optional[Key] = None, before: Optional[Key] = None, start: int = 1) -> Page:
+        forward = before is None
+        keys = ', '.join(f'{expression} AS _k{index}' for index, (expression, _) in enumerate(self.order))
+        direction = 'DESC NULLS LAST' if forward else 'ASC NULLS FIRST'
+        ordering = ', '.join(f'_k{index} {direction}' for index in range(len(self.order)))
+        select = ', '.join(f'"{c}"' for c in self.columns)
+        params = [p for _, ps in self.order for p in ps] + list(self.where_params)
+        conditions = [self.where]
+        if after is not None or before is not None:
+            seek, seek_params = self._seek(after if forward else before, forward)
+            conditions.append(seek)
+            params += seek_params
+        page_query = f"""SELECT {select}, {keys} FROM "{self.table}"
+                         WHERE {' AND '.join(conditions)}
+                         ORDER BY {ordering}
+                         LIMIT %s;"""
+        params.append(self.limit + 1)
+        with metrics.timer('db_query_seconds', preset=self.preset), connect_read() as connection:
+            ans, cols = query(connection, page_query, *params)
+
+        more = len(ans) > self.limit
+        ans = ans[:self.limit]
+        if not forward:
+            ans.reverse()
+        width = len(self.columns)
+        rows = [row[:width] for row in ans]
+        first_key = tuple(ans[0][width:]) if ans else None
+        last_key = tuple(ans[-1][width:]) if ans else None
+        if forward:
+            return Page(rows, cols[:width], start, first_key, last_key, after is not None, more)
+        return Page(rows, cols[:width], start, first_key, last_key, more, True)
+
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.01
+MAX_SECONDS = 300
+MAX_MESSAGES = 1000
+TRACE_FRAMES = 10
+TOP = 15
+
+
+@dataclass
+class ProfileReport:
+    summary: str
+    folded: bytes
+    started: datetime.datetime
+
+
+def _frame_name(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class Profiler:
+    # Sampling CPU profiler plus a tracemalloc diff, only running while a capture is in progress.
+    # While idle the only cost is the `active` check in on_message.
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.active = False
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._messages_left: Optional[int] = None
+        self._messages_seen = 0
+        self._done: Optional[asyncio.Event] = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
+
+    def note_message(self):
+        self._messages_seen += 1
+        if self._messages_left is not None:
+            self._messages_left -= 1
+            if self._messages_left <= 0 and self._done:
+                self._done.set()
+
+    async def capture(self, seconds: Optional[float] = None, messages: Optional[int] = None) -> ProfileReport:
+        if self.active:
+            raise RuntimeError('A profile is already running')
+        started = datetime.datetime.now()
+        self._stacks = Counter()
+        self._samples = 0
+        self._messages_seen = 0
+        self._messages_left = min(messages, MAX_MESSAGES) if messages else None
+        self._done = asyncio.Event()
+        self._stop.clear()
+
+        owns_tracing = not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        before = tracemalloc.take_snapshot()
+        thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self.active = True
+        start = time.perf_counter()
+        thread.start()
+        try:
+            timeout = min(seconds, MAX_SECONDS) if seconds else MAX_SECONDS
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self.active = False
+            self._stop.set()
+            thread.join()
+            elapsed = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if owns_tracing:
+                tracemalloc.stop()
+
+        summary = self._summary(elapsed, before, after, peak)
+        folded = ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+        logger.info('Profile captured: %.1fs, %d samples, %d messages', elapsed, self._samples, self._messages_seen)
+        return ProfileReport(summary, folded.encode('utf-8'), started)
+
+    def _summary(self, elapsed: float, before, after, peak: int) -> str:
+        inclusive, own = Counter(), Counter()
+        for stack, count in self._stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+        total = sum(self._stacks.values()) or 1
+
+        lines = [f'Profile: {elapsed:.1f}s, {self._samples} samples every {self.interval * 1000:.0f}ms, '
+                 f'{self._messages_seen} messages handled', '', 'Top functions by self samples:']
+        lines += [f'{count / total * 100:6.1f}%  {name}' for name, count in own.most_common(TOP)]
+        lines += ['', 'Top functions by inclusive samples:']
+        lines += [f'{count / total * 100:6.1f}%  {name}' for name, count in inclusive.most_common(TOP)]
+
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        lines += ['', f'Allocations (traced peak {peak / 2 ** 20:.1f} MiB), top growth by line:']
+        lines += [f'{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+7d} blocks  {stat.traceback[0]}'
+                  for stat in diff[:TOP]]
+        return '\n'.join(lines)
+
+
+profiler = Profiler()
+
+
+def parse_window(arguments: list[str]) -> tuple[Optional[float], Optional[int]]:
+    # '30', '30s' -> seconds, '50 messages' -> messages; defaults to 30 seconds
+    if not arguments:
+        return 30.0, None
+    amount = arguments[0].lower()
+    unit = arguments[1].lower() if len(arguments) > 1 else ''
+    if amount.endswith('s') and amount[:-1].isdigit():
+        amount, unit = amount[:-1], 's'
+    if not amount.isdigit() or int(amount) <= 0:
+        raise ValueError(f'Invalid profile window: {" ".join(arguments)}')
+    if unit.startswith(('message', 'msg')):
+        return None, int(amount)
+    return float(amount), None
@@ -1,79 +1,212 @@
 import io
 import logging
 
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
-import pandas as pd
-
-from src.connect import connect, query
+from src import cache
+from src import metrics
+from src import render
+from src import statements
+from src.common import PRIMARY_KEYS, TABLES
+from src.connect import connect_read, pooled_read, query
+from src.pagination import Keyset, Page
 
 logger = logging.getLogger(__name__)
 
 
+PLAYERS = statements.register('players', """SELECT name from players Order By name;""")
+
+_LEADERBOARD = """
+    SELECT u.player_id, 
+        p.name,
+        COUNT(*) AS appearances,
+        round(SUM(l.net/100.0),2) AS total_net,
+        ROUND(AVG(l.net/100.0), 2) AS avg_net_per_appearance
+    FROM ledgers l
+    JOIN users u ON l.user_id = u.user_id
+    JOIN players p ON u.player_id = p.player_id
+    WHERE $1::text[] IS NULL OR p.name ILIKE ANY($1)
+    GROUP BY u.player_id, p.name
+    ORDER BY {order} desc;
+    """
+LEADERBOARD = statements.register('leaderboard', _LEADERBOARD.format(order='total_net'), 'text[]')
+LEADERBOARD_AVG = statements.register('leaderboard_avg', _LEADERBOARD.format(order='avg_net_per_appearance'),
+                                      'text[]')
+
+CAREER = statements.register('career', """
+    SELECT ledgers.alias,
+        ROUND(ledgers.net / 100.0, 2) AS net,
+        ROUND(SUM(ledgers.net / 100.0) OVER (ORDER BY games.date), 2) as career,
+        TO_CHAR(games.date, 'YYYY-MM-DD') as date
+    FROM ledgers
+    JOIN users ON users.user_id = ledgers.user_id
+    JOIN players ON players.player_id = users.player_id
+    JOIN games ON ledgers.game_id = games.game_id
+    WHERE players.name ILIKE $1
+    ORDER BY games.date;
+    """, 'text')
+
+EMAIL = statements.register('email', """SELECT email FROM players WHERE discord_id = $1;""", 'bigint')
+
+USER_NAMES = statements.register('user_names', """
+    SELECT u.user_id, p.name FROM users u JOIN players p ON u.player_id = p.player_id;
+    """)
+
+GAME_DATES = statements.register('game_dates', "SELECT game_id, date FROM games ORDER BY game_id")
+
+RECENT_GRAPH = statements.register('recent_graph', """
+    WITH recent_games AS (
+        SELECT p.name AS name,
+               g.game_id AS game_id,
+               g.date AS date,
+               SUM(l.net) / 100.0 AS ytd
+        FROM games g
+        JOIN ledgers l ON g.game_id = l.game_id
+        JOIN users u ON l.user_id = u.user_id
+        JOIN players p ON u.player_id = p.player_id
+        WHERE g.date >= NOW() - $1 * INTERVAL '1 day'
+        GROUP BY p.name, g.game_id, g.date
+    ),
+    active_players AS (
+        SELECT DISTINCT name
+        FROM recent_games
+        WHERE $2::text[] IS NULL OR name ILIKE ANY ($2)
+    )
+    SELECT rg.name,
+           rg.game_id,
+           rg.date,
+           ROUND(SUM(rg.ytd) OVER (
+               PARTITION BY rg.name
+               ORDER BY rg.game_id
+               ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+           ), 2) AS career
+    FROM recent_games rg
+    JOIN active_players ap ON rg.name = ap.name
+    ORDER BY name, game_id;
+    """, 'integer', 'text[]')
+
+CAREER_GRAPH = statements.register('career_graph', """
+    WITH per_game AS (
+        SELECT p.name AS name,
+            g.game_id AS game_id,
+            g.date AS date,
+            SUM(l.net) / 100.0 AS ytd
+        FROM games g
+        JOIN ledgers l ON g.game_id = l.game_id
+        JOIN users u ON l.user_id = u.user_id
+        JOIN players p ON u.player_id = p.player_id
+        GROUP BY p.name, g.game_id, g.date
+        )
+    SELECT name,
+        game_id,
+        date,
+        ROUND(SUM(ytd) OVER (
+            PARTITION BY name
+            ORDER BY game_id
+            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+        ), 2) AS career
+    FROM per_game
+    WHERE $1::text[] IS NULL OR name ILIKE ANY ($1)
+    ORDER BY name, game_id;
+    """, 'text[]')
+
+
+@cache.cached('players')
 def players():
-    players_query = """SELECT name from players Order By name;"""
-    with connect() as connection:
-        a, c = query(connection, players_query)
+    with metrics.timer('db_query_seconds', preset='players'), pooled_read() as connection:
+        a, c = statements.execute(connection, PLAYERS)
     return a, c
 
 
+@cache.cached('ledgers', 'users', 'players')
 def leaderboard(names = None, order_avg=False):
-    leaderboard_query_mid = ''
-    params = []
-    if names:
-        leaderboard_query_mid = """
-            WHERE p.name ILIKE ANY(%s)
-            """
-        params.append(names)
-    leaderboard_query_end = f"""
-        ORDER BY {'avg_net_per_appearance' if order_avg else 'total_net'} desc;
-        """
-    leaderboard_query = f"""
-        SELECT u.player_id, 
-            p.name,
-            COUNT(*) AS appearances,
-            round(SUM(l.net/100.0),2) AS total_net,
-            ROUND(AVG(l.net/100.0), 2) AS avg_net_per_appearance
-        FROM ledgers l
-        JOIN users u ON l.user_id = u.user_id
-        JOIN players p ON u.player_id = p.player_id{leaderboard_query_mid}
-        GROUP BY u.player_id, p.name
-        {leaderboard_query_end}
-        """
-    with connect() as connection:
-        a, c = query(connection, leaderboard_query, params)
+    with metrics.timer('db_query_seconds', preset='leaderboard'), pooled_read() as connection:
+        a, c = statements.execute(connection, LEADERBOARD_AVG if order_avg else LEADERBOARD, names or None)
     return a, c
 
 
+@cache.cached('players')
+def email(discord_id: int):
+    with metrics.timer('db_query_seconds', preset='email'), pooled_read() as connection:
+        a, c = statements.execute(connection, EMAIL, discord_id)
+    return a, c
+
+
+@cache.cached('users', 'players')
+def user_names() -> dict[str, str]:
+    # pokernow user id -> player name
+    with metrics.timer('db_query_seconds', preset='user_names'), pooled_read() as connection:
+        a, _ = statements.execute(connection, USER_NAMES)
+    return dict(a)
+
+
+@cache.cached('ledgers', 'users', 'players', 'games')
 def career(name = None):
-    career_query = """
-        SELECT ledgers.alias,
-            ROUND(ledgers.net / 100.0, 2) AS net,
-            ROUND(SUM(ledgers.net / 100.0) OVER (ORDER BY games.date), 2) as career,
-            TO_CHAR(games.date, 'YYYY-MM-DD') as date
-        FROM ledgers
-        JOIN users ON users.user_id = ledgers.user_id
-        JOIN players ON players.player_id = users.player_id
-        JOIN games ON ledgers.game_id = games.game_id
-        WHERE players.name ILIKE %s
-        ORDER BY games.date;
-        """
     if name:
-        with connect() as connection:
-            a, c = query(connection, career_query,f'%{name}%')
+        with metrics.timer('db_query_seconds', preset='career'), pooled_read() as connection:
+            a, c = statements.execute(connection, CAREER, f'%{name}%')
         return a, c
     else:
         return [], None
 
 
-def grapher(grapher_query, title='', *args):
-    games_query = "SELECT game_id, date FROM games ORDER BY game_id"
-    with connect() as connection:
-        ans, columns = query(connection, grapher_query, args)
+SEARCH_COLUMN = 'search_text'
+
+
+def table_columns(connection, table: str) -> list[str]:
+    ans, _ = query(connection,
+                   "SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position",
+                   table)
+    return [c[0].lower() for c in ans]
+
+
+def _like_pattern(value: str) -> str:
+    escaped = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def table_pages(table: str, order_columns: list[str] = None) -> Keyset:
+    # Rows newest first (or by the given columns), paged on the primary key. Raises KeyError for an unknown column.
+    with connect_read() as connection:
+        columns = table_columns(connection, table)
+    for col in order_columns or []:
+        if col not in columns:
+            raise KeyError(col)
+    primary_key = PRIMARY_KEYS[table]
+    order = [(f'"{col}"', ()) for col in order_columns or [TABLES[table]] if col not in primary_key]
+    order += [(f'"{col}"', ()) for col in primary_key]
+    return Keyset(table, [c for c in columns if c != SEARCH_COLUMN], order, preset='table',
+                  key_only=len(order) == len(primary_key))
+
+
+def search_pages(table: str, values: list[str]) -> Keyset:
+    # Rows matching any value, best matches first. Uses the trigram indexed search_text column
+    # (db/migrations/002_search_text.sql) and falls back to scanning every column when it is missing.
+    with connect_read() as connection:
+        columns = table_columns(connection, table)
+    shown = [c for c in columns if c != SEARCH_COLUMN]
+    patterns = [_like_pattern(v) for v in values]
+    key = [(f'"{col}"', ()) for col in PRIMARY_KEYS[table]]
+    if SEARCH_COLUMN in columns:
+        matches = ' OR '.join(f'{SEARCH_COLUMN} LIKE %s' for _ in patterns)
+        matched = ' + '.join(f'({SEARCH_COLUMN} LIKE %s)::int' for _ in patterns)
+        order = [(f'({matched})', tuple(patterns)),
+                 (f'word_similarity(%s, {SEARCH_COLUMN})', (' '.join(values).lower(),)), *key]
+        return Keyset(table, shown, order, where=f'({matches})', where_params=tuple(patterns), preset='search')
+    checks = [f'CAST("{c}" AS TEXT) ILIKE %s' for c in shown]
+    where_clause = ' OR '.join('(' + ' OR '.join(checks) + ')' for _ in patterns)
+    return Keyset(table, shown, key, where=f'({where_clause})', where_params=tuple(p for p in patterns for _ in shown),
+                  preset='search', key_only=True)
+
+
+def search(table: str, values: list[str]) -> Page:
+    return search_pages(table, values).fetch()
+
+
+def grapher(statement, title='', *args, profile=None, preset='graph'):
+    import pandas as pd
+    with metrics.timer('db_query_seconds', preset=preset), pooled_read() as connection:
+        ans, columns = statements.execute(connection, statement, *args)
         df = pd.DataFrame(ans, columns=columns)
-        ans2, columns2 = query(connection, games_query)
+        ans2, columns2 = statements.execute(connection, GAME_DATES)
         date_map = pd.DataFrame(ans2, columns=columns2).set_index("game_id")["date"]
 
     if df.empty:
@@ -95,128 +228,53 @@ def grapher(grapher_query, title='', *args):
     num_lines = len(wide.columns)
     MAX_PLAYERS_PER_COL = 20
     num_cols = (num_lines + MAX_PLAYERS_PER_COL - 1) // MAX_PLAYERS_PER_COL
-    fig, ax = plt.subplots(figsize=(11 + num_cols * 1.5, 8))
-    for player in wide.columns:
-        count = df['name'].eq(player).sum()
-        ax.plot(wide.index, wide[player], label=f'{player} - {count}')
-    game_ids = wide.index.to_list()
-    MAX_TICKS = 10
-    step = max(1, len(game_ids) // MAX_TICKS)
-    tick_positions = game_ids[::step] + [game_ids[-1]]
-    tick_positions = sorted(set(tick_positions))
-
-    ax.set_xticks(tick_positions)
-    ax.set_xticklabels(
-        [date_map.get(gid).strftime("%Y-%m-%d") if date_map.get(gid) else "" for gid in tick_positions], rotation=90
-    )
-    ax.grid(True, axis='x', which='major', linestyle='--')
-    ax.grid(True, axis='y', which='major', linestyle='--')
-
-    previous_year = None
-    for game in wide.index:
-        date = date_map.get(game)
-        if date and (previous_year is None or date.year > previous_year):
-            ax.axvline(x=game, color='gray', linestyle='--', linewidth=1.5, zorder=0)
-            ax.text(game, ax.get_ylim()[1] * 0.975 + ax.get_ylim()[0] * 0.025, str(date.year),
-                    rotation=90, verticalalignment='top', horizontalalignment='left',
-                    color='gray', fontsize=30)
-            previous_year = date.year
+    profile = profile or render.DEFAULT_PROFILE
+    figsize = (11 + num_cols * 1.5, 8)
+    dpi = profile.dpi(figsize, points=games, lines=num_lines)
+    with render.figure(render.CAREER, figsize=figsize, dpi=dpi) as (fig, ax):
+        for player in wide.columns:
+            count = df['name'].eq(player).sum()
+            ax.plot(wide.index, wide[player], label=f'{player} - {count}')
+        game_ids = wide.index.to_list()
+        MAX_TICKS = 10
+        step = max(1, len(game_ids) // MAX_TICKS)
+        tick_positions = game_ids[::step] + [game_ids[-1]]
+        tick_positions = sorted(set(tick_positions))
 
-    num_lines = len(wide.columns)
-    num_cols = (num_lines + MAX_PLAYERS_PER_COL - 1) // MAX_PLAYERS_PER_COL
-    legend = ax.legend(title='PLAYERS', ncol=num_cols, fontsize='medium', loc='center left', bbox_to_anchor=(1, .5))
-    legend.get_title().set_fontweight('bold')
-    legend.get_title().set_fontsize('large')
-    legend.get_frame().set_linewidth(1.5)
-    legend.get_frame().set_edgecolor('blue')
-
-    ax.xaxis.set_minor_locator(AutoMinorLocator(5))
-    ax.yaxis.set_minor_locator(AutoMinorLocator(5))
-    ax.set_xlim(left=wide.index[0], right=wide.index[-1])
-    ax.set_ylim(bottom=ax.get_ylim()[0], top=ax.get_ylim()[1])
-    ax.axhline(0, color='black', linewidth=0.8, linestyle='--')
-    ax.axhspan(ax.get_ylim()[0], 0, color='red', alpha=0.03, zorder=0)
-    ax.grid(True, linestyle='-', color='gray', alpha=0.5)
-    ax.grid(True, which='minor', linestyle=':', linewidth=0.5, color='gray', alpha=0.6)
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Career Net')
-    ax.set_title(f'{title}: {games} Games')
-
-    fig.tight_layout()
-    buffer = io.BytesIO()
-    fig.savefig(buffer, format='png')
-    buffer.seek(0)
-    return buffer
-
-def recent_graph(days = 30, selected_players = None) -> io.BytesIO:
-    graph_query_mid = ''
-    params = []
-    if selected_players:
-        graph_query_mid = f"""WHERE name ILIKE ANY (%s)"""
-        params.append(selected_players)
-    date_filter = f"g.date >= NOW() - INTERVAL '{days} days'"
-    recent_query = f"""
-        WITH recent_games AS (
-            SELECT p.name AS name,
-                   g.game_id AS game_id,
-                   g.date AS date,
-                   SUM(l.net) / 100.0 AS ytd
-            FROM games g
-            JOIN ledgers l ON g.game_id = l.game_id
-            JOIN users u ON l.user_id = u.user_id
-            JOIN players p ON u.player_id = p.player_id
-            WHERE {date_filter}
-            GROUP BY p.name, g.game_id, g.date
-        ),
-        active_players AS (
-            SELECT DISTINCT name
-            FROM recent_games
-            {graph_query_mid}
+        ax.set_xticks(tick_positions)
+        ax.set_xticklabels(
+            [date_map.get(gid).strftime("%Y-%m-%d") if date_map.get(gid) else "" for gid in tick_positions], rotation=90
         )
-        SELECT rg.name,
-               rg.game_id,
-               rg.date,
-               ROUND(SUM(rg.ytd) OVER (
-                   PARTITION BY rg.name
-                   ORDER BY rg.game_id
-                   ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-               ), 2) AS career
-        FROM recent_games rg
-        JOIN active_players ap ON rg.name = ap.name
-        ORDER BY name, game_id;
-    """
-    return grapher(recent_query, f'Last {days} Days', *params)
-
-
-def career_graph(selected_players = None) -> io.BytesIO:
-    graph_query_mid = ''
-    params = []
-    if selected_players:
-        graph_query_mid = f"""WHERE name ILIKE ANY (%s)"""
-        params.append(selected_players)
-    graph_query_end = """ORDER BY name, game_id;"""
-    graph_query = f"""
-        WITH per_game AS (
-            SELECT p.name AS name,
-                g.game_id AS game_id,
-                g.date AS date,
-                SUM(l.net) / 100.0 AS ytd
-            FROM games g
-            JOIN ledgers l ON g.game_id = l.game_id
-            JOIN users u ON l.user_id = u.user_id
-            JOIN players p ON u.player_id = p.player_id
-            GROUP BY p.name, g.game_id, g.date
-            )
-        SELECT name,
-            game_id,
-            date,
-            ROUND(SUM(ytd) OVER (
-                PARTITION BY name
-                ORDER BY game_id
-                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-            ), 2) AS career
-        FROM per_game
-        {graph_query_mid}
-        {graph_query_end}
-        """
-    return grapher(graph_query, f'Player Careers', *params)
+
+        previous_year = None
+        for game in wide.index:
+            date = date_map.get(game)
+            if date and (previous_year is None or date.year > previous_year):
+                ax.axvline(x=game, color='gray', linestyle='--', linewidth=1.5, zorder=0)
+                ax.text(game, ax.get_ylim()[1] * 0.975 + ax.get_ylim()[0] * 0.025, str(date.year),
+                        rotation=90, verticalalignment='top', horizontalalignment='left',
+                        color='gray', fontsize=30)
+                previous_year = date.year
+
+        num_lines = len(wide.columns)
+        num_cols = (num_lines + MAX_PLAYERS_PER_COL - 1) // MAX_PLAYERS_PER_COL
+        render.CAREER.legend(ax, title='PLAYERS', ncol=num_cols, fontsize='medium', loc='center left',
+                             bbox_to_anchor=(1, .5))
+
+        ax.set_xlim(left=wide.index[0], right=wide.index[-1])
+        render.CAREER.shade_losses(ax)
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Career Net')
+        ax.set_title(f'{title}: {games} Games')
+
+        fig.tight_layout()
+        return render.encode(fig, profile)
+
+def recent_graph(days = 30, selected_players = None, profile = None) -> io.BytesIO:
+    return grapher(RECENT_GRAPH, f'Last {days} Days', days, selected_players or None, profile=profile,
+                   preset='recent')
+
+
+def career_graph(selected_players = None, profile = None) -> io.BytesIO:
+    return grapher(CAREER_GRAPH, f'Player Careers', selected_players or None, profile=profile,
+                   preset='career_graph')
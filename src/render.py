@@ -0,0 +1,328 @@
+import argparse
+import io
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from src import metrics
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+    from matplotlib.legend import Legend
+
+logger = logging.getLogger(__name__)
+
+COLORS = [
+    "Blue", "Red", "Lime", "Magenta", "Orange", "SaddleBrown", "Cyan",
+    "DarkViolet", "Gray", "Green", "Gold", "Salmon", 'SkyBlue', 'Orchid',
+]
+
+
+@dataclass(frozen=True)
+class FigureTemplate:
+    # Styling shared by every figure of a kind, built once instead of per render
+    name: str
+    colors: tuple[str, ...] = tuple(COLORS)
+    minor_divisions: int = 5
+    legend_edge: str = 'blue'
+    legend_linewidth: float = 1.5
+    zero_linewidth: float = 0.5
+
+    @cached_property
+    def prop_cycle(self):
+        from matplotlib import cycler
+        return cycler(color=list(self.colors))
+
+    @cached_property
+    def legend_style(self) -> dict[str, object]:
+        from matplotlib.font_manager import FontProperties
+        return {'title_fontproperties': FontProperties(weight='bold', size='large'), 'edgecolor': self.legend_edge}
+
+    def build(self, figsize: tuple[float, float] = (10, 6), dpi: float = 100) -> tuple['Figure', 'Axes']:
+        # a figure with every style applied and no data, figure() keeps one per thread and reuses it
+        from matplotlib.ticker import AutoMinorLocator
+        fig = new_figure(figsize, dpi)
+        ax = fig.subplots()
+        ax.set_prop_cycle(self.prop_cycle)
+        ax.xaxis.set_minor_locator(AutoMinorLocator(self.minor_divisions))
+        ax.yaxis.set_minor_locator(AutoMinorLocator(self.minor_divisions))
+        ax.grid(True, linestyle='-', color='gray', alpha=0.5)
+        ax.grid(True, which='minor', linestyle=':', linewidth=0.5, color='gray', alpha=0.6)
+        return fig, ax
+
+    def reset(self, ax: 'Axes'):
+        # drops one render's data and per-render settings, the styling from build() stays
+        from matplotlib.ticker import AutoLocator, ScalarFormatter
+        for artist in [*ax.lines, *ax.patches, *ax.texts, *ax.collections]:
+            artist.remove()
+        if ax.legend_ is not None:
+            ax.legend_.remove()
+        ax.set_prop_cycle(self.prop_cycle)
+        ax.xaxis.set_major_locator(AutoLocator())
+        ax.xaxis.set_major_formatter(ScalarFormatter())
+        ax.tick_params(axis='x', labelrotation=0)
+        ax.set_title('')
+        ax.set_xlabel('')
+        ax.set_ylabel('')
+        ax.relim()
+        ax.autoscale()
+
+    def legend(self, ax: 'Axes', **kwargs) -> 'Legend':
+        # the entries change with every render, so only the legend's construction is left per figure
+        legend = ax.legend(**self.legend_style, **kwargs)
+        legend.get_frame().set_linewidth(self.legend_linewidth)
+        return legend
+
+    def shade_losses(self, ax: 'Axes'):
+        # freezes the current y-limits so the shading does not rescale the axes
+        ax.set_ylim(bottom=ax.get_ylim()[0], top=ax.get_ylim()[1])
+        ax.axhline(0, color='black', linewidth=self.zero_linewidth, linestyle='--')
+        ax.axhspan(ax.get_ylim()[0], 0, color='red', alpha=0.03, zorder=0)
+
+
+NETS = FigureTemplate('nets')
+CAREER = FigureTemplate('career', zero_linewidth=0.8)
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    # How a finished figure is sized and encoded for upload
+    name: str
+    fmt: str
+    min_width: int
+    max_width: int
+    palette: bool = False
+    quality: int = 90
+
+    @property
+    def extension(self) -> str:
+        return self.fmt
+
+    def pixel_width(self, points: int, lines: int) -> int:
+        # about two pixels per hand/game keeps every step visible, crowded legends get extra room
+        width = self.min_width + 2 * points + 40 * max(0, lines - 8)
+        return max(self.min_width, min(self.max_width, width))
+
+    def dpi(self, figsize: tuple[float, float], points: int, lines: int) -> float:
+        if self.fmt == 'svg':
+            return 100
+        return self.pixel_width(points, lines) / figsize[0]
+
+
+PROFILES = {
+    'discord': OutputProfile('discord', 'png', min_width=1200, max_width=3000, palette=True),
+    'compact': OutputProfile('compact', 'webp', min_width=1000, max_width=2000, quality=80),
+    'full': OutputProfile('full', 'png', min_width=4500, max_width=4500),
+    'svg': OutputProfile('svg', 'svg', min_width=1000, max_width=1000),
+}
+DEFAULT_PROFILE = PROFILES['discord']
+
+
+def get_profile(name: Optional[str] = None) -> OutputProfile:
+    if name is None:
+        return DEFAULT_PROFILE
+    return PROFILES.get(name.lower().lstrip('-'), DEFAULT_PROFILE)
+
+
+def split_profile(words: list[str]) -> tuple[OutputProfile, list[str]]:
+    # pulls a '--profile' flag (e.g. --svg, --compact) out of command arguments
+    profile = DEFAULT_PROFILE
+    remaining = []
+    for word in words:
+        if word.startswith('--') and word[2:].lower() in PROFILES:
+            profile = PROFILES[word[2:].lower()]
+        else:
+            remaining.append(word)
+    return profile, remaining
+
+
+def current_rss() -> int:
+    # resident set size in bytes, 0 when the platform offers no way to read it
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss is the peak, in KiB on Linux, the closest fallback available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RenderStats:
+    def __init__(self, history: int = 100):
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.total_seconds = 0.0
+        self.last_rss = 0
+        self.baseline_rss = 0
+        self.rss_deltas = deque(maxlen=history)
+
+    def record(self, name: str, seconds: float, rss_before: int, rss_after: int):
+        with self._lock:
+            if not self.baseline_rss:
+                self.baseline_rss = rss_before
+            self.renders += 1
+            self.total_seconds += seconds
+            self.last_rss = rss_after
+            self.rss_deltas.append(rss_after - rss_before)
+        metrics.observe('render_seconds', seconds, template=name)
+        metrics.set_gauge('process_rss_mib', rss_after / 2 ** 20)
+        logger.info('Rendered %s in %.0f ms, RSS %+.2f MiB (%.1f MiB)',
+                    name, seconds * 1000, (rss_after - rss_before) / 2 ** 20, rss_after / 2 ** 20)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            deltas = list(self.rss_deltas)
+            return {
+                'renders': self.renders,
+                'avg_render_ms': self.total_seconds * 1000 / self.renders if self.renders else 0.0,
+                'rss_mib': self.last_rss / 2 ** 20,
+                'rss_growth_mib': (self.last_rss - self.baseline_rss) / 2 ** 20 if self.renders else 0.0,
+                'avg_rss_delta_kib': sum(deltas) / len(deltas) / 1024 if deltas else 0.0,
+            }
+
+
+stats = RenderStats()
+
+
+def render_stats() -> dict[str, float]:
+    return stats.snapshot()
+
+
+def new_figure(figsize: tuple[float, float], dpi: float) -> 'Figure':
+    # matplotlib is imported on the first render, importing this module for profiles and flags stays cheap
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+# styled figures kept for reuse per template, at most this many and without their pixel buffers
+POOL_SIZE = int(os.getenv('RENDER_POOL_SIZE', 2))
+_pool_lock = threading.Lock()
+_pool: dict[FigureTemplate, list[tuple['Figure', 'Axes']]] = {}
+
+
+def _release(template: FigureTemplate, fig: 'Figure', ax: 'Axes'):
+    # a fresh canvas drops the old one's renderer, the full-size pixel buffer of the last render
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    template.reset(ax)
+    FigureCanvasAgg(fig)
+    with _pool_lock:
+        idle = _pool.setdefault(template, [])
+        if len(idle) < POOL_SIZE:
+            idle.append((fig, ax))
+            return
+    fig.clear()
+
+
+@contextmanager
+def figure(template: FigureTemplate, figsize: tuple[float, float],
+           dpi: float = 100) -> Iterator[tuple['Figure', 'Axes']]:
+    # Figures are built without pyplot so they never enter its global registry,
+    # which keeps rendering thread-safe. A template's styled axes are built once and shared through a small pool,
+    # later renders only resize the figure and clear their data from it on exit.
+    rss_before = current_rss()
+    start = time.perf_counter()
+    with _pool_lock:
+        idle = _pool.get(template)
+        built = idle.pop() if idle else None
+    fig, ax = built or template.build(figsize, dpi)
+    fig.set_size_inches(figsize)
+    fig.set_dpi(dpi)
+    try:
+        yield fig, ax
+    finally:
+        _release(template, fig, ax)
+        stats.record(template.name, time.perf_counter() - start, rss_before, current_rss())
+
+
+def encode(fig: 'Figure', profile: OutputProfile = DEFAULT_PROFILE) -> io.BytesIO:
+    from PIL import Image
+    buffer = io.BytesIO()
+    if profile.fmt == 'svg':
+        fig.savefig(buffer, format='svg')
+    else:
+        fig.canvas.draw()
+        image = Image.frombuffer('RGBA', fig.canvas.get_width_height(), fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        image = image.convert('RGB')
+        if profile.fmt == 'webp':
+            image.save(buffer, format='WEBP', quality=profile.quality, method=4)
+        else:
+            if profile.palette:
+                # line charts use a handful of colors, a 256 color palette is visually lossless
+                image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+            image.save(buffer, format='PNG', optimize=True)
+    buffer.seek(0)
+    return buffer
+
+
+def sample_figure(points: int, lines: int, profile: OutputProfile) -> 'Figure':
+    rng = random.Random(points * 31 + lines)
+    figsize = (10, 6)
+    # a figure of its own, the caller keeps it past the render
+    fig, ax = NETS.build(figsize, profile.dpi(figsize, points, lines))
+    for line in range(lines):
+        total = 0.0
+        values = []
+        for _ in range(points):
+            total += rng.gauss(0, 2)
+            values.append(total)
+        ax.plot(values, label=f'Player {line + 1}')
+    NETS.legend(ax, title='PLAYERS', bbox_to_anchor=(1, 0.5), loc='center left', frameon=True)
+    NETS.shade_losses(ax)
+    fig.tight_layout()
+    return fig
+
+
+def benchmark(sizes: list[tuple[int, int]], repeat: int = 3) -> list[dict[str, object]]:
+    results = []
+    for points, lines in sizes:
+        for profile in PROFILES.values():
+            fig = sample_figure(points, lines, profile)
+            timings = []
+            size = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                size = len(encode(fig, profile).getvalue())
+                timings.append(time.perf_counter() - start)
+            fig.clear()
+            results.append({
+                'points': points,
+                'lines': lines,
+                'profile': profile.name,
+                'width_px': profile.pixel_width(points, lines) if profile.fmt != 'svg' else 0,
+                'encode_ms': min(timings) * 1000,
+                'kib': size / 1024,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report encode time and byte size per output profile.')
+    parser.add_argument('--sizes', nargs='+', default=['100x6', '400x10', '1500x14'],
+                        help='HANDSxLINES pairs to render')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = [tuple(int(n) for n in size.lower().split('x')) for size in args.sizes]
+    print(f"{'hands':>6} {'lines':>5} {'profile':>8} {'width':>6} {'encode ms':>10} {'KiB':>9}")
+    for row in benchmark(sizes, args.repeat):
+        print(f"{row['points']:>6} {row['lines']:>5} {row['profile']:>8} {row['width_px']:>6} "
+              f"{row['encode_ms']:>10.1f} {row['kib']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
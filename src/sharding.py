@@ -0,0 +1,105 @@
+import logging
+import os
+import signal
+import subprocess
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard_ids(text: Optional[str]) -> Optional[list[int]]:
+    if not text:
+        return None
+    return sorted({int(part) for part in text.split(',') if part.strip()})
+
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    # Discord's own routing: a guild's events only ever arrive on this shard
+    return (guild_id >> 22) % shard_count
+
+
+class Ownership:
+    # Which shards this process runs. Without SHARD_COUNT it is a single unsharded client that owns everything.
+    def __init__(self, shard_count: Optional[int] = None, shard_ids: Optional[list[int]] = None):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self._owned = set(shard_ids) if shard_count and shard_ids is not None else None
+
+    @classmethod
+    def from_env(cls) -> 'Ownership':
+        count = os.getenv('SHARD_COUNT')
+        return cls(int(count) if count else None, parse_shard_ids(os.getenv('SHARD_IDS')))
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.shard_count)
+
+    def shard(self, guild_id: int) -> int:
+        return shard_for(guild_id, self.shard_count) if self.shard_count else 0
+
+    def owns(self, guild_id: int) -> bool:
+        return self._owned is None or shard_for(guild_id, self.shard_count) in self._owned
+
+    def __str__(self) -> str:
+        if not self.sharded:
+            return 'unsharded'
+        return f"shards {self.shard_ids if self.shard_ids is not None else 'all'} of {self.shard_count}"
+
+
+ownership = Ownership.from_env()
+
+
+def make_client(intents):
+    import discord
+    if not ownership.sharded:
+        return discord.Client(intents=intents)
+    return discord.AutoShardedClient(intents=intents, shard_count=ownership.shard_count,
+                                     shard_ids=ownership.shard_ids)
+
+
+def plan(shard_count: int, processes: int) -> list[list[int]]:
+    # round robin so guild load spreads evenly even when processes do not divide the shard count
+    processes = max(1, min(processes, shard_count))
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+
+def launch(command: list[str], shard_count: int, processes: int, restart_delay: float = 5.0) -> int:
+    # Runs one bot process per group of shards and keeps them running until told to stop
+    children: dict[int, subprocess.Popen] = {}
+    groups = plan(shard_count, processes)
+    stopping = False
+
+    def spawn(index: int) -> subprocess.Popen:
+        env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=','.join(map(str, groups[index])))
+        if os.getenv('METRICS_PORT'):
+            env['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT')) + index)
+        logger.info('Starting process %s for shards %s of %s', index, groups[index], shard_count)
+        return subprocess.Popen(command, env=env)
+
+    def stop(sig, _):
+        nonlocal stopping
+        stopping = True
+        for child in children.values():
+            if child.poll() is None:
+                child.send_signal(sig)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(len(groups)):
+        children[index] = spawn(index)
+
+    while children:
+        time.sleep(1)
+        for index, child in list(children.items()):
+            code = child.poll()
+            if code is None:
+                continue
+            if stopping:
+                del children[index]
+            else:
+                logger.warning('Process %s exited with %s, restarting in %ss', index, code, restart_delay)
+                time.sleep(restart_delay)
+                children[index] = spawn(index)
+    return 0
+
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Any, Callable, Hashable, Optional
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def names_key(names: Optional[list[str]]) -> tuple[str, ...]:
+    # player filters match with ILIKE, so case and order do not change the result
+    return tuple(sorted({name.lower() for name in names or []}))
+
+
+class SingleFlight:
+    # Identical requests that arrive while one is running wait for its result instead of running again
+    def __init__(self):
+        self._running: dict[Hashable, asyncio.Future] = {}
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._counts: dict[str, list[int]] = {}
+
+    def _count(self, command: str, shared: bool):
+        counts = self._counts.setdefault(command, [0, 0])
+        counts[shared] += 1
+        metrics.increment('coalesce', command=command, result='shared' if shared else 'leader')
+        metrics.set_gauge('coalesce_ratio', counts[1] / (counts[0] + counts[1]), command=command)
+
+    async def run(self, command: str, key: tuple, func: Callable[..., Any], *args, limit: Optional[int] = None):
+        # func runs in a worker thread, at most limit leaders of one command at a time
+        flight = (command, *key)
+        running = self._running.get(flight)
+        if running is not None:
+            self._count(command, shared=True)
+            return await asyncio.shield(running)
+
+        self._count(command, shared=False)
+        future = asyncio.get_running_loop().create_future()
+        # nobody may be waiting, so mark a failure as seen
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._running[flight] = future
+        try:
+            if limit:
+                semaphore = self._limits.setdefault(command, asyncio.Semaphore(limit))
+                if semaphore.locked():
+                    metrics.increment('command_queued', command=command)
+                async with semaphore:
+                    result = await asyncio.to_thread(func, *args)
+            else:
+                result = await asyncio.to_thread(func, *args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._running[flight]
+
+
+flights = SingleFlight()
@@ -0,0 +1,51 @@
+import logging
+from dataclasses import dataclass
+
+import psycopg2.errors
+
+from src import metrics
+from src.connect import query
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Statement:
+    name: str
+    sql: str
+    types: tuple[str, ...] = ()
+
+
+registry: dict[str, Statement] = {}
+
+
+def register(name: str, sql: str, *types: str) -> Statement:
+    # sql uses $1, $2 ... placeholders, types are the Postgres types of those parameters
+    if name in registry:
+        raise ValueError(f'Statement {name} is already registered')
+    statement = Statement(name, sql, types)
+    registry[name] = statement
+    return statement
+
+
+def execute(connection, statement: Statement, *args):
+    # PREPARE once per session, then EXECUTE by name so Postgres reuses the plan
+    if statement.name in connection.prepared:
+        metrics.increment('prepared_statements', statement=statement.name, result='hit')
+    else:
+        types = f" ({', '.join(statement.types)})" if statement.types else ''
+        try:
+            query(connection, f'PREPARE {statement.name}{types} AS {statement.sql}')
+        except psycopg2.errors.DuplicatePreparedStatement:
+            # prepared by a transaction we lost track of, usable from the next call
+            connection.prepared.add(statement.name)
+            raise
+        connection.prepared.add(statement.name)
+        metrics.increment('prepared_statements', statement=statement.name, result='prepare')
+
+    marks = f" ({', '.join(['%s'] * len(args))})" if args else ''
+    try:
+        return query(connection, f'EXECUTE {statement.name}{marks};', *args)
+    except psycopg2.errors.InvalidSqlStatementName:
+        connection.prepared.discard(statement.name)
+        raise
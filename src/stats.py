@@ -0,0 +1,101 @@
+import re
+from typing import Optional
+
+import numpy as np
+
+from src import metrics
+from src.netmatrix import Nets, matrix
+
+
+def _ilike(pattern: str) -> re.Pattern:
+    # the same matching the SQL presets do with ILIKE
+    parts = (('.*' if c == '%' else '.' if c == '_' else re.escape(c)) for c in pattern)
+    return re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def select(nets: Nets, names: Optional[list[str]] = None) -> np.ndarray:
+    # row indices of the named players who have played, or of everyone who has
+    chosen = nets.played.any(axis=1)
+    if names:
+        patterns = [_ilike(name) for name in names]
+        chosen &= np.array([any(p.fullmatch(name) for p in patterns) for name in nets.names], dtype=bool)
+    return np.flatnonzero(chosen)
+
+
+def _dollars(cents: np.ndarray) -> list[Optional[float]]:
+    return [None if np.isnan(c) else round(float(c) / 100, 2) for c in np.asarray(cents, dtype=np.float64)]
+
+
+def runs(hits: np.ndarray, played: np.ndarray) -> np.ndarray:
+    # length of the run of hits ending at each game, games not played neither extend nor break it
+    total = np.cumsum(hits, axis=1)
+    breaks = np.where(played & ~hits, total, 0)
+    return total - np.maximum.accumulate(breaks, axis=1)
+
+
+def max_drawdown(nets: np.ndarray) -> np.ndarray:
+    # largest fall of the running career total from its previous high, starting from 0
+    career = np.cumsum(nets, axis=1)
+    peak = np.maximum.accumulate(np.maximum(career, 0), axis=1)
+    return (peak - career).max(axis=1, initial=0)
+
+
+def summary(names: Optional[list[str]] = None) -> tuple[list[tuple], list[str]]:
+    with metrics.timer('stats_seconds', stat='summary'):
+        nets = matrix.current()
+        rows = select(nets, names)
+        net, played = nets.nets[rows], nets.played[rows]
+        games = played.sum(axis=1)
+        total = net.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / games
+            deviation = np.where(played, net - mean[:, None], 0)
+            std = np.where(games > 1, np.sqrt((deviation ** 2).sum(axis=1) / (games - 1)), np.nan)
+            win_rate = np.round((played & (net > 0)).sum(axis=1) / games * 100, 1)
+        best = np.where(played, net, np.iinfo(np.int64).min).max(axis=1, initial=np.iinfo(np.int64).min)
+        worst = np.where(played, net, np.iinfo(np.int64).max).min(axis=1, initial=np.iinfo(np.int64).max)
+        order = np.argsort(-total, kind='stable')
+        columns = ['name', 'games', 'total_net', 'avg_net', 'std_dev', 'win_%', 'best', 'worst', 'max_drawdown']
+        values = [[nets.names[r] for r in rows], games.tolist(), _dollars(total), _dollars(mean), _dollars(std),
+                  win_rate.tolist(), _dollars(best), _dollars(worst), _dollars(max_drawdown(net))]
+    return [tuple(column[i] for column in values) for i in order], columns
+
+
+def streaks(names: Optional[list[str]] = None) -> tuple[list[tuple], list[str]]:
+    with metrics.timer('stats_seconds', stat='streaks'):
+        nets = matrix.current()
+        rows = select(nets, names)
+        net, played = nets.nets[rows], nets.played[rows]
+        wins, losses = runs(played & (net > 0), played), runs(played & (net < 0), played)
+        longest_win, longest_loss = wins.max(axis=1, initial=0), losses.max(axis=1, initial=0)
+        current_win = wins[:, -1] if net.shape[1] else np.zeros(len(rows), dtype=np.int64)
+        current_loss = losses[:, -1] if net.shape[1] else np.zeros(len(rows), dtype=np.int64)
+        current = [f'W{w}' if w else f'L{l}' if l else '-' for w, l in zip(current_win, current_loss)]
+        order = np.lexsort((-longest_loss, -longest_win))
+        columns = ['name', 'games', 'longest_win', 'longest_loss', 'current']
+        values = [[nets.names[r] for r in rows], played.sum(axis=1).tolist(), longest_win.tolist(),
+                  longest_loss.tolist(), current]
+    return [tuple(column[i] for column in values) for i in order], columns
+
+
+def form(games: int = 5, names: Optional[list[str]] = None) -> tuple[list[tuple], list[str]]:
+    # each player's last few games next to their career average
+    with metrics.timer('stats_seconds', stat='form'):
+        nets = matrix.current()
+        rows = select(nets, names)
+        net, played = nets.nets[rows], nets.played[rows]
+        from_end = np.cumsum(played[:, ::-1], axis=1)[:, ::-1]
+        recent = played & (from_end <= games)
+        count = recent.sum(axis=1)
+        recent_net = np.where(recent, net, 0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recent_avg = recent_net / count
+            career_avg = net.sum(axis=1) / played.sum(axis=1)
+        wins, losses = (recent & (net > 0)).sum(axis=1), (recent & (net < 0)).sum(axis=1)
+        results = [''.join('W' if n > 0 else 'L' if n < 0 else '-' for n in net[i][recent[i]])
+                   for i in range(len(rows))]
+        order = np.argsort(-recent_net, kind='stable')
+        columns = ['name', 'games', 'net', 'avg_net', 'career_avg', 'record', 'results']
+        values = [[nets.names[r] for r in rows], count.tolist(), _dollars(recent_net), _dollars(recent_avg),
+                  _dollars(career_avg), [f'{w}-{l}' for w, l in zip(wins, losses)], results]
+    return [tuple(column[i] for column in values) for i in order if count[i]], columns
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# cold until warm() starts, WARMUP=0 skips it (to compare first requests with and without)
+state = 'cold'
+_task: Optional[asyncio.Task] = None
+_first: set[str] = set()
+
+
+def _steps() -> list[tuple[str, Callable[[], object]]]:
+    from src import netmatrix
+    from src import query_presets
+    from src import render
+    from src import statements
+    from src.connect import pooled_read
+
+    def career_graph_query():
+        # the !graph query on a pooled session, no figure, the renderer has its own step
+        with pooled_read() as connection:
+            statements.execute(connection, query_presets.CAREER_GRAPH, None)
+            statements.execute(connection, query_presets.GAME_DATES)
+
+    def figure():
+        # matplotlib's import and font cache, PIL's encoder, the first figure's setup
+        profile = render.DEFAULT_PROFILE
+        fig = render.sample_figure(40, 6, profile)
+        render.encode(fig, profile)
+        fig.clear()
+
+    return [
+        # opens a pooled session and prepares the statements on it
+        ('players', query_presets.players),
+        # the same arguments !leaderboard passes, so these are the entries it will hit
+        ('leaderboard', lambda: query_presets.leaderboard([], False)),
+        ('leaderboard_avg', lambda: query_presets.leaderboard([], True)),
+        ('user_names', query_presets.user_names),
+        ('figure', figure),
+        # reads every ledger row once, so the first !graph finds them in Postgres' buffers
+        ('career_graph', career_graph_query),
+        # numpy's import and the player x game matrix behind !summary, !streaks and !form
+        ('net_matrix', netmatrix.matrix.current),
+    ]
+
+
+async def warm():
+    global state
+    state = 'warming'
+    started = time.perf_counter()
+    for name, step in _steps():
+        step_started = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception as err:
+            logger.warning('Warm-up Step %s Failed: %s', name, err)
+            continue
+        seconds = time.perf_counter() - step_started
+        metrics.observe('warmup_seconds', seconds, step=name)
+        logger.info('Warmed %s in %.0f ms', name, seconds * 1000)
+    state = 'warm'
+    total = time.perf_counter() - started
+    metrics.observe('warmup_seconds', total, step='total')
+    logger.info('Warm-up finished in %.1f s', total)
+
+
+def start():
+    # runs beside the bot, readiness does not wait for it
+    global _task
+    if _task is not None or os.getenv('WARMUP', '1') == '0':
+        return
+    _task = asyncio.create_task(warm())
+
+
+def first_request(command: str, seconds: float):
+    # the first run of each command since startup, labelled with how warm the process was
+    if command in _first:
+        return
+    _first.add(command)
+    metrics.set_gauge('first_request_seconds', seconds, command=command, state=state)
+    logger.info('First !%s since startup took %.0f ms (%s)', command, seconds * 1000, state)
@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src.jobs import Cron
+
+
+def at(text: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(text)
+
+
+def test_fields():
+    cron = Cron('*/15 9-17 1,15 * 1-5')
+    assert cron.minutes == [0, 15, 30, 45]
+    assert cron.hours == list(range(9, 18))
+    assert cron.days == {1, 15}
+    assert cron.weekdays == {1, 2, 3, 4, 5}
+
+
+def test_step_from_a_start():
+    assert Cron('5/20 * * * *').minutes == [5, 25, 45]
+
+
+def test_sunday_is_0_or_7():
+    assert Cron('0 0 * * 7').weekdays == {0}
+    assert Cron('0 0 * * 0').weekdays == {0}
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '5-1 * * * *'])
+def test_invalid(expression):
+    with pytest.raises(ValueError):
+        Cron(expression)
+
+
+def test_next_daily():
+    cron = Cron('0 5 * * *')
+    assert cron.next_after(at('2024-03-10 04:59:30')) == at('2024-03-10 05:00')
+    # strictly after, the current minute does not count
+    assert cron.next_after(at('2024-03-10 05:00:00')) == at('2024-03-11 05:00')
+    assert cron.next_after(at('2024-12-31 23:00')) == at('2025-01-01 05:00')
+
+
+def test_next_every_quarter_hour():
+    cron = Cron('*/15 * * * *')
+    assert cron.next_after(at('2024-03-10 10:07')) == at('2024-03-10 10:15')
+    assert cron.next_after(at('2024-03-10 23:50')) == at('2024-03-11 00:00')
+
+
+def test_next_weekday():
+    # 2024-03-10 is a Sunday
+    cron = Cron('30 8 * * 1')
+    assert cron.next_after(at('2024-03-10 12:00')) == at('2024-03-11 08:30')
+    assert cron.next_after(at('2024-03-11 08:30')) == at('2024-03-18 08:30')
+
+
+def test_day_of_month_or_weekday():
+    # like cron, a restricted day of month and day of week match when either does
+    cron = Cron('0 0 13 * 5')
+    assert cron.next_after(at('2024-03-10 00:00')) == at('2024-03-13 00:00')
+    assert cron.next_after(at('2024-03-13 00:00')) == at('2024-03-15 00:00')
+
+
+def test_leap_day():
+    assert Cron('0 12 29 2 *').next_after(at('2024-03-01 00:00')) == at('2028-02-29 12:00')
+
+
+def test_never():
+    with pytest.raises(ValueError):
+        Cron('0 0 31 2 *').next_after(at('2024-01-01 00:00'))
@@ -0,0 +1,42 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('google.genai')
+pytest.importorskip('rapidfuzz')
+pytest.importorskip('psycopg2')
+
+from src.ledger_gemini import deduplicate_rows
+
+
+def frame(*rows) -> 'pd.DataFrame':
+    return pd.DataFrame(rows, columns=['alias', 'user_id', 'net'])
+
+
+def test_overlapping_screenshots_read_the_same_row_twice():
+    df = frame(('ace', 'abcdefghij', 1500), ('nit', 'klmnopqrst', -1500), ('ace', 'abcdefghij', 1500))
+    assert deduplicate_rows(df).values.tolist() == [['ace', 'abcdefghij', 1500], ['nit', 'klmnopqrst', -1500]]
+
+
+def test_misread_id_with_same_alias_and_net():
+    df = frame(('Ace ', 'abcdefghij', 1500), ('ace', 'abcdefgh1j', 1500), ('nit', 'klmnopqrst', -1500))
+    assert deduplicate_rows(df).values.tolist() == [['Ace', 'abcdefghij', 1500], ['nit', 'klmnopqrst', -1500]]
+
+
+def test_first_read_of_a_user_id_wins():
+    df = frame(('ace', 'abcdefghij', 1500), ('ace2', ' abcdefghij', 1200))
+    assert deduplicate_rows(df).values.tolist() == [['ace', 'abcdefghij', 1500]]
+
+
+def test_same_alias_different_net_is_kept():
+    # two players can share an alias, only a matching net marks a duplicate
+    df = frame(('ace', 'abcdefghij', 1500), ('ace', 'zyxwvutsrq', -300))
+    assert len(deduplicate_rows(df)) == 2
+
+
+def test_index_is_reset():
+    df = frame(('ace', 'abcdefghij', 1), ('ace', 'abcdefghij', 1), ('nit', 'klmnopqrst', -1))
+    assert list(deduplicate_rows(df).index) == [0, 1]
+
+
+def test_empty():
+    assert deduplicate_rows(pd.DataFrame()).empty
@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('discord')
+
+from src.drain import Drain
+
+
+def message(message_id: int):
+    return SimpleNamespace(id=message_id, guild=SimpleNamespace(id=1), channel=SimpleNamespace(id=2))
+
+
+def test_unfinished_handlers_are_replayed_queued_or_dropped():
+    async def scenario():
+        inflight = Drain()
+        progress = {'reposts': [10]}
+
+        async def handler(msg, replay, side_effect):
+            with inflight.track(msg, replay):
+                side_effect()
+                await asyncio.sleep(60)
+
+        query, ledger, graph = message(1), message(2), message(3)
+        tasks = [asyncio.create_task(handler(query, True, lambda: None)),
+                 asyncio.create_task(handler(ledger, False, lambda: inflight.resume_as(ledger, 'import', progress))),
+                 asyncio.create_task(handler(graph, False, lambda: None))]
+        await asyncio.sleep(0)
+        # a change after the handover point is still what the next process gets
+        progress['game_id'] = 7
+        messages, jobs = await inflight.drain(timeout=0.01)
+        assert messages == [(1, 2, 1)]
+        assert jobs == [('import', {'reposts': [10], 'game_id': 7})]
+        assert all(task.cancelled() for task in tasks)
+        assert not inflight.admit(message(5))
+        assert inflight.held == [(1, 2, 5)]
+
+    asyncio.run(scenario())
+
+
+def test_handler_past_its_last_handover_is_not_resumed():
+    async def scenario():
+        inflight = Drain()
+        msg = message(1)
+
+        async def handler():
+            with inflight.track(msg):
+                inflight.resume_as(msg, 'import', {})
+                inflight.resume_as(msg, None)
+                await asyncio.sleep(60)
+
+        asyncio.create_task(handler())
+        await asyncio.sleep(0)
+        assert await inflight.drain(timeout=0.01) == ([], [])
+
+    asyncio.run(scenario())
+
+
+def test_finished_handlers_leave_nothing():
+    async def scenario():
+        inflight = Drain()
+        msg = message(1)
+
+        async def handler():
+            with inflight.track(msg, replay=False):
+                await asyncio.sleep(0)
+
+        asyncio.create_task(handler())
+        await asyncio.sleep(0)
+        assert inflight.in_flight
+        assert await inflight.drain(timeout=1) == ([], [])
+
+    asyncio.run(scenario())
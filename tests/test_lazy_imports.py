@@ -0,0 +1,13 @@
+import pytest
+
+from benchmarks.imports import LAZY, heavy_modules
+
+# these modules import discord and psycopg2 at the top, without them nothing can be checked
+pytest.importorskip('discord')
+pytest.importorskip('psycopg2')
+
+
+@pytest.mark.parametrize('module', LAZY)
+def test_heavy_dependencies_load_on_first_use(module):
+    # the import graph rather than milliseconds, python -m benchmarks.imports reports the times
+    assert heavy_modules(module) == []
@@ -0,0 +1,78 @@
+import csv
+import io
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from benchmarks import synthetic
+from src import ledger_csv
+
+HEADER = ['player_nickname', 'player_id', 'session_start_at', 'session_end_at', 'buy_in', 'buy_out', 'stack', 'net']
+
+
+def ledger(*rows) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    for alias, user_id, buy_in, buy_out, stack, net in rows:
+        writer.writerow([alias, user_id, '2024-01-01T20:00:00', '2024-01-01T23:00:00', buy_in, buy_out, stack, net])
+    return out.getvalue().encode('utf-8')
+
+
+def nets(frame) -> dict[str, int]:
+    return dict(zip(frame['user_id'], frame['net']))
+
+
+def test_is_ledger_csv():
+    assert ledger_csv.is_ledger_csv(ledger(('ace', 'a1', 2000, 0, 3000, 1000)))
+    assert ledger_csv.is_ledger_csv(b'\xef\xbb\xbf' + ledger())
+    assert not ledger_csv.is_ledger_csv(b'entry,at,order\n')
+    assert not ledger_csv.is_ledger_csv(b'\xff\xfe')
+
+
+def test_cents():
+    frame = ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', 2000, 0, 3250, 1250), ('nit', 'n1', 2000, 0, 750, -1250)))
+    assert nets(frame) == {'a1': 1250, 'n1': -1250}
+    assert list(frame['alias']) == ['ace', 'nit']
+
+
+def test_dollars_with_decimals():
+    frame = ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', '20.00', '0', '32.50', '12.50'),
+                                               ('nit', 'n1', '20.00', '0', '7.50', '-12.50')))
+    assert nets(frame) == {'a1': 1250, 'n1': -1250}
+
+
+def test_micro_stakes_cents_export_stays_cents():
+    # every buy-in under $5, amounts this small must not be taken for dollars
+    frame = ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', 200, 0, 350, 150), ('nit', 'n1', 200, 50, 0, -150)))
+    assert nets(frame) == {'a1': 150, 'n1': -150}
+
+
+def test_whole_dollar_cents_export_stays_cents():
+    frame = ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', 2000, 0, 3500, 1500), ('nit', 'n1', 2000, 0, 500, -1500)))
+    assert nets(frame) == {'a1': 1500, 'n1': -1500}
+
+
+def test_mixed_decimals_are_refused():
+    with pytest.raises(ledger_csv.AmbiguousUnits):
+        ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', '20.00', 0, '35.00', '15.00'), ('nit', 'n1', 20, 0, 5, -15)))
+
+
+def test_sessions_of_one_player_are_combined():
+    frame = ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', 2000, 0, 0, -2000),
+                                               ('ace_again', 'a1', 2000, 0, 5000, 3000),
+                                               ('nit', 'n1', 2000, 0, 1000, -1000)))
+    assert nets(frame) == {'a1': 1000, 'n1': -1000}
+    assert list(frame['alias']) == ['ace', 'nit']
+
+
+def test_malformed_returns_empty():
+    assert ledger_csv.parse_ledger_csv(ledger(('ace', 'a1', 2000, 0, 0, 'lots'))).empty
+
+
+def test_synthetic_session_balances():
+    _, data = synthetic.session(players=6, hands=200, seed=3)
+    frame = ledger_csv.parse_ledger_csv(data)
+    assert len(frame) == 6
+    assert frame['net'].sum() == 0
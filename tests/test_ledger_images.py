@@ -0,0 +1,32 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from benchmarks.load import screenshot
+from src import ledger_images
+
+
+def test_distinct_ledgers_with_one_layout_are_kept():
+    # same size, same table, only the names and nets differ
+    images = [(screenshot(seed), 'image/png') for seed in range(30)]
+    assert len(ledger_images.preprocess(images)) == 30
+
+
+def test_identical_images_are_dropped():
+    image = (screenshot(1), 'image/png')
+    kept = ledger_images.preprocess([image, (screenshot(2), 'image/png'), image])
+    assert len(kept) == 2
+
+
+def test_reencoded_copy_is_dropped():
+    # the same screenshot uploaded twice, once with different compression
+    original = screenshot(3)
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(original)).save(buffer, format='PNG', compress_level=1)
+    assert len(ledger_images.preprocess([(original, 'image/png'), (buffer.getvalue(), 'image/png')])) == 1
+
+
+def test_undecodable_image_is_sent_untouched():
+    assert ledger_images.preprocess([(b'not an image', 'image/jpeg')]) == [(b'not an image', 'image/jpeg')]
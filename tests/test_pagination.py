@@ -0,0 +1,96 @@
+import contextlib
+import random
+import sqlite3
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from src import pagination
+from src.pagination import Keyset
+
+COLUMNS = ['a', 'b', 'id']
+
+
+@pytest.fixture
+def table():
+    rng = random.Random(7)
+    rows = [(rng.choice([None, 1, 2, 3]), rng.choice([None, 'x', 'y']), i) for i in range(60)]
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE t (a INT, b TEXT, id INT PRIMARY KEY)')
+    db.executemany('INSERT INTO t VALUES (?, ?, ?)', rows)
+    yield db, rows
+    db.close()
+
+
+def sort_key(values):
+    # DESC NULLS LAST, so reversing this ascending key gives the page order
+    return tuple((value is not None, value if value is not None else 0) for value in values)
+
+
+def seek_rows(db, keyset, key, forward):
+    clause, params = keyset._seek(key, forward)
+    return db.execute(f'SELECT a, b, id FROM t WHERE {clause.replace("%s", "?")}', params).fetchall()
+
+
+@pytest.mark.parametrize('order', [['a', 'b', 'id'], ['b', 'id'], ['a', 'id']])
+def test_seek_with_null_keys(table, order):
+    db, rows = table
+    keyset = Keyset('t', COLUMNS, [(f'"{c}"', ()) for c in order])
+    index = [COLUMNS.index(c) for c in order]
+    for row in rows:
+        key = tuple(row[i] for i in index)
+        after = {r for r in rows if sort_key(r[i] for i in index) < sort_key(key)}
+        before = {r for r in rows if sort_key(r[i] for i in index) > sort_key(key)}
+        assert set(seek_rows(db, keyset, key, forward=True)) == after
+        assert set(seek_rows(db, keyset, key, forward=False)) == before
+
+
+def test_seek_key_only_uses_a_row_comparison(table):
+    db, rows = table
+    keyset = Keyset('t', COLUMNS, [('"id"', ())], key_only=True)
+    clause, params = keyset._seek((10,), forward=True)
+    assert clause == '("id") < (%s)'
+    assert params == [10]
+    assert {r[2] for r in seek_rows(db, keyset, (10,), forward=False)} == set(range(11, 60))
+
+
+def test_seek_passes_expression_params(table):
+    db, rows = table
+    # ranks rows matching the pattern first, as search_pages does
+    keyset = Keyset('t', COLUMNS, [("(b LIKE %s)", ('x',)), ('"id"', ())])
+    clause, params = keyset._seek((1, 30), forward=True)
+    assert params.count('x') == clause.count('b LIKE')
+    got = seek_rows(db, keyset, (1, 30), forward=True)
+    assert {r[2] for r in got} == {r[2] for r in rows if (r[1] == 'x' and r[2] < 30) or r[1] != 'x'}
+
+
+def test_fetch_pages_forward_and_back(table, monkeypatch):
+    db, rows = table
+
+    @contextlib.contextmanager
+    def connect_read():
+        yield db
+
+    def query(connection, command, *args):
+        cursor = connection.execute(command.replace('%s', '?'), args)
+        return cursor.fetchall(), [d[0] for d in cursor.description]
+
+    monkeypatch.setattr(pagination, 'connect_read', connect_read)
+    monkeypatch.setattr(pagination, 'query', query)
+    keyset = Keyset('t', COLUMNS, [(f'"{c}"', ()) for c in COLUMNS], limit=7)
+    expected = sorted(rows, key=sort_key, reverse=True)
+
+    pages = [keyset.fetch()]
+    while pages[-1].has_next:
+        page = pages[-1]
+        pages.append(keyset.fetch(after=page.last_key, start=page.start + len(page.rows)))
+    assert [r for p in pages for r in p.rows] == expected
+    assert not pages[0].has_previous
+
+    back = [pages[-1]]
+    while back[-1].has_previous:
+        page = back[-1]
+        back.append(keyset.fetch(before=page.first_key, start=page.start - keyset.limit))
+    assert [p.rows for p in reversed(back)] == [p.rows for p in pages]
+    assert back[-1].start == 1
@@ -0,0 +1,81 @@
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from src import cache
+from src import connect
+
+
+class Connection:
+    closed = False
+
+    def __init__(self, target: str):
+        self.target = target
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # a replica that has replayed up to state['replayed'], and the last write the process knows of
+    state = {'replayed': '0/0'}
+    monkeypatch.setattr(connect, 'replica_config', lambda: {})
+    monkeypatch.setattr(connect, 'connect', lambda **_: Connection('primary'))
+    monkeypatch.setattr(psycopg2, 'connect', lambda **_: Connection('replica'))
+    monkeypatch.setattr(connect, '_caught_up', lambda _, lsn: lsn is not None and lsn <= state['replayed'])
+    monkeypatch.setattr(connect, '_idle', {'primary': [], 'replica': []})
+    monkeypatch.setattr(connect, '_writes', {})
+    monkeypatch.setattr(connect, '_last_write', None)
+    monkeypatch.setattr(connect, '_replica_down_until', 0.0)
+    monkeypatch.setattr(cache, 'results', cache.ResultCache())
+    return state
+
+
+def target() -> str:
+    with connect.pooled_read() as connection:
+        return connection.target
+
+
+def cached_target() -> str:
+    return cache.results.get_or_compute('leaderboard', ('ledgers',), target)
+
+
+def test_cached_result_waits_for_the_replica_after_a_write(replica):
+    connect.note_write('0/5')
+    cache.invalidate('ledgers')
+    # another member's read that is not cached is not held back
+    assert target() == 'replica'
+    assert cached_target() == 'primary'
+    assert connect._last_write is not None
+
+    replica['replayed'] = '0/5'
+    cache.invalidate('ledgers')
+    assert cached_target() == 'replica'
+    # replayed once, later results go straight to the pool
+    assert connect._last_write is None
+
+
+def test_write_known_only_from_notify_reads_the_primary(replica):
+    connect.note_write()
+    assert cached_target() == 'primary'
+
+
+def test_cached_result_without_writes_uses_the_replica(replica):
+    assert cached_target() == 'replica'
+
+
+def test_writer_reads_their_own_write(replica):
+    token = connect.current_user.set(42)
+    try:
+        connect._writes[42] = (connect.time.monotonic(), '0/9')
+        assert target() == 'primary'
+    finally:
+        connect.current_user.reset(token)
+    assert target() == 'replica'
@@ -0,0 +1,63 @@
+import contextlib
+import random
+
+import pytest
+
+pytest.importorskip('matplotlib')
+pytest.importorskip('PIL')
+
+from src import render
+
+
+def draw(fig, ax, seed: int, lines: int):
+    rng = random.Random(seed)
+    for line in range(lines):
+        ax.plot([rng.gauss(0, 2) for _ in range(30 + seed * 20)], label=f'Player {line + 1}')
+    ticks = [0, 10, 20]
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([str(tick) for tick in ticks], rotation=90)
+    ax.text(5, 0, 'year')
+    ax.set_title(f'{seed} Games')
+    render.NETS.legend(ax, title='PLAYERS', bbox_to_anchor=(1, 0.5), loc='center left')
+    ax.set_xlim(left=0)
+    render.NETS.shade_losses(ax)
+    fig.tight_layout()
+
+
+def fresh(seed: int, lines: int, figsize: tuple[float, float]) -> bytes:
+    fig, ax = render.NETS.build(figsize, 100)
+    draw(fig, ax, seed, lines)
+    return render.encode(fig).getvalue()
+
+
+def reused(seed: int, lines: int, figsize: tuple[float, float]) -> bytes:
+    with render.figure(render.NETS, figsize, 100) as (fig, ax):
+        draw(fig, ax, seed, lines)
+        return render.encode(fig).getvalue()
+
+
+def test_reused_axes_render_like_fresh_ones():
+    # a larger render first, nothing of it may leak into the next one
+    reused(3, 12, (12, 8))
+    assert reused(1, 4, (10, 6)) == fresh(1, 4, (10, 6))
+
+
+def test_styled_axes_are_reused_from_a_bounded_pool(monkeypatch):
+    monkeypatch.setattr(render, '_pool', {})
+    with render.figure(render.NETS, (10, 6)) as (fig, ax):
+        ax.plot([1, 2, 3])
+        render.encode(fig)
+    # the pixel buffer of the render is not kept with the pooled figure
+    assert not hasattr(fig.canvas, 'renderer')
+    with render.figure(render.NETS, (10, 6)) as (again, ax):
+        assert again is fig
+        assert not ax.lines and ax.get_legend() is None
+        with render.figure(render.CAREER, (10, 6)) as (other, _):
+            assert other is not fig
+        with render.figure(render.NETS, (10, 6)) as (concurrent, _):
+            assert concurrent is not fig
+
+    with contextlib.ExitStack() as stack:
+        for _ in range(render.POOL_SIZE + 2):
+            stack.enter_context(render.figure(render.NETS, (10, 6)))
+    assert len(render._pool[render.NETS]) == render.POOL_SIZE
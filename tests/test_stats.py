@@ -0,0 +1,88 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('psycopg2')
+
+from src import stats
+from src.netmatrix import Nets, _build
+
+
+def test_runs_skip_missed_games():
+    played = np.array([[1, 1, 0, 1, 1, 1, 0]], dtype=bool)
+    net = np.array([[5, 3, 0, 2, -1, 4, 0]])
+    wins = stats.runs(played & (net > 0), played)
+    assert wins.tolist() == [[1, 2, 2, 3, 0, 1, 1]]
+    losses = stats.runs(played & (net < 0), played)
+    assert losses.tolist() == [[0, 0, 0, 0, 1, 0, 0]]
+
+
+def test_runs_break_on_an_even_game():
+    played = np.ones((1, 4), dtype=bool)
+    net = np.array([[1, 0, 1, 1]])
+    assert stats.runs(played & (net > 0), played).tolist() == [[1, 0, 1, 2]]
+
+
+def test_runs_per_row():
+    played = np.array([[1, 1, 1], [1, 0, 1]], dtype=bool)
+    net = np.array([[-1, -2, 3], [-1, 0, -1]])
+    assert stats.runs(played & (net < 0), played).tolist() == [[1, 2, 0], [1, 1, 2]]
+
+
+def test_max_drawdown():
+    net = np.array([
+        [10, -4, -8, 5, -20, 30],
+        [-5, -5, 10, 0, 0, 0],
+        [1, 2, 3, 0, 0, 0],
+    ])
+    # careers 10 6 -2 3 -17 13 fall 27 from their high, -5 -10 fall 10 from the start, 1 3 6 never fall
+    assert stats.max_drawdown(net).tolist() == [27, 10, 0]
+
+
+def test_max_drawdown_without_games():
+    assert stats.max_drawdown(np.zeros((2, 0), dtype=np.int64)).tolist() == [0, 0]
+
+
+def nets_of(cells, names) -> Nets:
+    return _build(np.array(cells, dtype=np.int64).reshape(-1, 4), names)
+
+
+def test_build_and_patch():
+    full = nets_of([(1, 10, 500, 1), (2, 10, -500, 1), (1, 11, -200, 2), (3, 11, 200, 1)],
+                   {1: 'ann', 2: 'bob', 3: 'cy'})
+    assert full.game_ids.tolist() == [10, 11]
+    assert full.nets.tolist() == [[500, -200], [-500, 0], [0, 200]]
+    assert full.played.tolist() == [[True, True], [True, False], [False, True]]
+    # game 11 rewritten and game 12 added, game 10 is kept
+    patched = _build(np.array([(2, 11, 100, 1), (3, 11, -100, 1), (4, 12, 0, 1)], dtype=np.int64), {4: 'dee'},
+                     full, [11, 12])
+    assert patched.player_ids.tolist() == [1, 2, 3, 4]
+    assert patched.nets.tolist() == [[500, 0, 0], [-500, 100, 0], [0, -100, 0], [0, 0, 0]]
+    assert patched.counts[3, 2] == 1
+    assert patched.fingerprint() == (5, 0, 2 * 10 + 1 * 10 + 2 * 11 + 3 * 11 + 4 * 12,
+                                     500 - 2 * 500 + 2 * 100 - 3 * 100,
+                                     500 * 10 - 2 * 500 * 10 + 2 * 100 * 11 - 3 * 100 * 11)
+
+
+def test_fingerprint_sees_nets_swapped_between_players():
+    # a corrected misread moves nets between players of one game, the count and total stay the same
+    before = nets_of([(1, 10, 700, 1), (2, 10, -200, 1), (3, 10, -500, 1)], {})
+    after = nets_of([(1, 10, 700, 1), (2, 10, -500, 1), (3, 10, -200, 1)], {})
+    assert before.fingerprint()[:3] == after.fingerprint()[:3]
+    assert before.fingerprint() != after.fingerprint()
+
+
+def test_fingerprint_sees_nets_moved_across_games():
+    # ann gains in one game what she gives back in another, each player's total is unchanged
+    before = nets_of([(1, 10, 100, 1), (2, 10, -100, 1), (1, 11, -100, 1), (2, 11, 100, 1)], {})
+    after = nets_of([(1, 10, 200, 1), (2, 10, -200, 1), (1, 11, -200, 1), (2, 11, 200, 1)], {})
+    assert before.fingerprint()[:4] == after.fingerprint()[:4]
+    assert before.fingerprint() != after.fingerprint()
+
+
+def test_select_matches_like_ilike():
+    nets = nets_of([(1, 1, 5, 1), (2, 1, -5, 1), (3, 1, 0, 1), (4, 2, 0, 0)], {1: 'Ann', 2: 'annie', 3: 'bob', 4: 'cy'})
+    assert stats.select(nets).tolist() == [0, 1, 2]
+    assert stats.select(nets, ['ANN']).tolist() == [0]
+    assert stats.select(nets, ['ann%', 'b_b']).tolist() == [0, 1, 2]
+    # cy has a row but no game
+    assert stats.select(nets, ['cy']).tolist() == []
@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('google.genai')
+pytest.importorskip('rapidfuzz')
+pytest.importorskip('psycopg2')
+
+from src import ledger_gemini
+from src.ledger_gemini import validate_photo
+
+IMAGES = [(b'one', 'image/png'), (b'two', 'image/png')]
+
+
+def row(user_id: str, net: float, player: str = 'ace') -> dict:
+    return {'player': player, 'id': user_id, 'buy_in': 20.0, 'buy_out': 0.0, 'stack': 20.0 + net, 'net': net}
+
+
+def photo(number: int, *rows) -> dict:
+    return {'photo': number, 'visible_rows': len(rows), 'rows': list(rows)}
+
+
+class Client:
+    # answers each request with the next scripted response, raw strings are sent as they are
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+        self.models = self
+
+    def generate_content(self, **_):
+        self.requests += 1
+        response = self.responses.pop(0)
+        return SimpleNamespace(text=response if isinstance(response, str) else json.dumps(response))
+
+
+def structured(client) -> dict[str, int]:
+    df = ledger_gemini._gemini_structured(client, IMAGES, '')
+    return dict(zip(df['user_id'], df['net']))
+
+
+@pytest.mark.parametrize('entry', [
+    {'photo': 1, 'visible_rows': 1},
+    {'photo': 1, 'visible_rows': None, 'rows': []},
+    {'photo': 1, 'visible_rows': 1, 'rows': 'abcdefghij'},
+    photo(1, {**row('abcdefghij', 5), 'buy_out': None}),
+    photo(1, {**row('abcdefghij', 5), 'id': 12}),
+    photo(1, ['ace', 'abcdefghij']),
+    [],
+])
+def test_malformed_entries_are_errors(entry):
+    assert len(validate_photo(entry)) == 1
+
+
+def test_valid_photo():
+    assert validate_photo(photo(1, row('abcdefghij', 5), row('klmnopqrst', -5))) == []
+
+
+@pytest.mark.parametrize('response', ['{"photo": 1}', '7', 'not json', [{'photo': '1'}, None]])
+def test_malformed_response_is_retried(response):
+    client = Client(response, [photo(1, row('abcdefghij', 5)), photo(2, row('klmnopqrst', -5))])
+    assert structured(client) == {'abcdefghij': 500, 'klmnopqrst': -500}
+    assert client.requests == 2
+
+
+def test_only_failed_photos_are_sent_again():
+    client = Client([photo(1, row('abcdefghij', 5)), photo(2, row('bad id', -5))],
+                    [photo(1, row('klmnopqrst', -5))])
+    assert structured(client) == {'abcdefghij': 500, 'klmnopqrst': -500}
+
+
+def test_unbalanced_ledger_is_read_again():
+    client = Client([photo(1, row('abcdefghij', 5)), photo(2, row('klmnopqrst', -8))],
+                    [photo(1, row('abcdefghij', 5)), photo(2, row('klmnopqrst', -5))])
+    assert structured(client) == {'abcdefghij': 500, 'klmnopqrst': -500}
+    assert client.requests == 2
+
+
+def test_retry_keeps_the_reading_with_fewer_errors():
+    first = photo(2, row('klmnopqrst', -5), row('uvwxyzabcd', 0, 'nit'))
+    first['visible_rows'] = 3
+    worse = photo(1, row('bad id', -5), row('also bad', 0))
+    worse['visible_rows'] = 3
+    client = Client([photo(1, row('abcdefghij', 5)), first], [worse], [worse])
+    assert structured(client) == {'abcdefghij': 500, 'klmnopqrst': -500, 'uvwxyzabcd': 0}
+    assert client.requests == 3
+
+
+def test_gives_up_with_an_empty_frame():
+    client = Client('null', 'null', 'null')
+    assert ledger_gemini._gemini_structured(client, IMAGES, '').empty